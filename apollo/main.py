@@ -1,10 +1,14 @@
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Any
+
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sirius import common
 from starlette.middleware.cors import CORSMiddleware
 from starlette.responses import Response
 
-from tools.media import router
+from tools import media
+from tools.metrics import get_metrics_response
 
 
 def verify_token(token: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False))) -> None:
@@ -15,7 +19,15 @@ def verify_token(token: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_e
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, headers={"WWW-Authenticate": "Bearer"}, )
 
 
-apollo_app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncGenerator[None, Any]:
+    media.model_registry.start_in_background()
+    yield
+
+    media.model_registry.shutdown()
+
+
+apollo_app = FastAPI(lifespan=lifespan)
 apollo_app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -23,7 +35,7 @@ apollo_app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-apollo_app.include_router(router, prefix="/media", dependencies=[Depends(verify_token)] if common.is_production_environment() else [])
+apollo_app.include_router(media.router, prefix="/media", dependencies=[Depends(verify_token)] if common.is_production_environment() else [])
 
 
 @apollo_app.get("/ping", summary="Returns a 200 response code by default. Used to check if the service is alive.")
@@ -31,6 +43,16 @@ async def ping() -> Response:
     return Response(status_code=status.HTTP_200_OK)
 
 
+@apollo_app.get("/ready", summary="Returns a 200 response code once the startup models are loaded and warmed up, and a 503 response code otherwise.")
+async def ready() -> Response:
+    return Response(status_code=status.HTTP_200_OK if media.model_registry.is_ready else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@apollo_app.get("/metrics", summary="Returns the timing histograms of each processing stage in the Prometheus text format.")
+async def metrics() -> Response:
+    return get_metrics_response()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:apollo_app", host="0.0.0.0", port=8002, reload=True)
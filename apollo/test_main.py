@@ -2,8 +2,19 @@ from dotenv import load_dotenv
 
 load_dotenv()
 from main import apollo_app
+from tools import inference, media
+from tools.backends import compare_backends, InferenceBackend, BackendComparison
+from tools.inference import InferenceEngine, DetectionRequest
 
+import asyncio
+import time
 from io import BytesIO
+from typing import List, Dict, Tuple
+
+import httpx
+import numpy as np
+import pytest
+from PIL import Image
 
 from fastapi.testclient import TestClient
 
@@ -21,3 +32,155 @@ def test_yolov8n_endpoint() -> None:
 
     response = client.post("/media/object_detection", files={"image": ("person.jpg", image_bytes.getvalue(), "image/jpeg")})
     assert "person" in [data["description"] for data in response.json()]
+
+
+def test_object_detection_reports_batching() -> None:
+    with open("apollo/test/person.jpg", "rb") as f:
+        image_bytes = BytesIO(f.read())
+
+    media.frame_cache.clear()
+    response = client.post("/media/object_detection", files={"image": ("person.jpg", image_bytes.getvalue(), "image/jpeg")})
+    assert int(response.headers["X-Batch-Size"]) >= 1
+    assert float(response.headers["X-Queue-Wait-Ms"]) >= 0
+
+
+def test_object_detection_boxes_only() -> None:
+    with open("apollo/test/person.jpg", "rb") as f:
+        image_bytes = BytesIO(f.read())
+
+    response = client.post("/media/object_detection", params={"response_format": "BOXES"}, files={"image": ("person.jpg", image_bytes.getvalue(), "image/jpeg")})
+    person_list = [data for data in response.json() if data["description"] == "person"]
+    assert len(person_list) > 0
+    assert len(person_list[0]["xyxy"]) == 4 and "image_base64" not in person_list[0]
+
+
+def test_raw_frame_object_detection() -> None:
+    with open("apollo/test/person.jpg", "rb") as f:
+        image = Image.open(BytesIO(f.read())).convert("RGB")
+
+    frame = np.asarray(image)[:, :, ::-1].tobytes()
+    response = client.post("/media/object_detection/raw", params={"width": image.width, "height": image.height, "response_format": "BOXES"}, content=frame, headers={"Content-Type": "application/octet-stream"})
+    assert "person" in [data["description"] for data in response.json()]
+
+    response = client.post("/media/object_detection/raw", params={"width": image.width + 1, "height": image.height}, content=frame, headers={"Content-Type": "application/octet-stream"})
+    assert response.status_code == 400
+
+
+def test_object_detection_multipart() -> None:
+    with open("apollo/test/person.jpg", "rb") as f:
+        image_bytes = BytesIO(f.read())
+
+    response = client.post("/media/object_detection", params={"response_format": "MULTIPART"}, files={"image": ("person.jpg", image_bytes.getvalue(), "image/jpeg")})
+    assert response.headers["Content-Type"].startswith("multipart/mixed")
+    assert b"X-Description: person" in response.content
+
+
+def test_onnx_backend_matches_pytorch() -> None:
+    comparison: BackendComparison = compare_backends("apollo/test/person.jpg", backend_list=[(InferenceBackend.ONNX, False)], number_of_runs=3, classes=[0, 2])[0]
+    assert comparison.recall >= 0.9
+
+
+def test_repeated_frame_is_served_from_cache() -> None:
+    with open("apollo/test/person.jpg", "rb") as f:
+        image_bytes = BytesIO(f.read())
+
+    client.post("/media/object_detection", params={"source": "front_door"}, files={"image": ("person.jpg", image_bytes.getvalue(), "image/jpeg")})
+    response = client.post("/media/object_detection", params={"source": "front_door"}, files={"image": ("person.jpg", image_bytes.getvalue(), "image/jpeg")})
+    assert response.headers["X-Cache"] == "HIT"
+    assert "person" in [data["description"] for data in response.json()]
+    assert client.get("/media/cache_statistics").json()["hits"] >= 1
+
+    #   The cached detections are neither shared with another source nor with requests without a source
+    assert client.post("/media/object_detection", params={"source": "garage"}, files={"image": ("person.jpg", image_bytes.getvalue(), "image/jpeg")}).headers["X-Cache"] == "MISS"
+    for _ in range(2):
+        assert client.post("/media/object_detection", files={"image": ("person.jpg", image_bytes.getvalue(), "image/jpeg")}).headers["X-Cache"] == "MISS"
+
+
+def test_source_region_of_interest() -> None:
+    with open("apollo/test/person.jpg", "rb") as f:
+        image_bytes = BytesIO(f.read())
+
+    response = client.put("/media/sources/test_camera", json={"region_of_interest_list": [{"name": "everything", "polygon": [[0, 0], [1, 0], [1, 1], [0, 1]]}], "inference_size": 320})
+    assert response.status_code == 200
+
+    response = client.post("/media/object_detection", params={"response_format": "BOXES", "source": "test_camera"}, files={"image": ("person.jpg", image_bytes.getvalue(), "image/jpeg")})
+    assert "person" in [data["description"] for data in response.json()]
+    assert client.delete("/media/sources/test_camera").status_code == 204
+
+
+def test_ready(monkeypatch: pytest.MonkeyPatch) -> None:
+    load = media.model_registry.load
+
+    async def slow_load(model_name: str) -> None:
+        await asyncio.sleep(0.5)
+        await load(model_name)
+
+    monkeypatch.setattr(media.model_registry, "load", slow_load)
+    with TestClient(apollo_app) as startup_client:
+        assert startup_client.get("/ping").status_code == 200
+        assert startup_client.get("/ready").status_code == 503
+
+        deadline: float = time.monotonic() + 60
+        while startup_client.get("/ready").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+        assert startup_client.get("/ready").status_code == 200
+
+
+def test_object_detection_with_smaller_model() -> None:
+    with open("apollo/test/person.jpg", "rb") as f:
+        image_bytes = BytesIO(f.read())
+
+    response = client.post("/media/object_detection", params={"response_format": "BOXES", "model": "yolo12n"}, files={"image": ("person.jpg", image_bytes.getvalue(), "image/jpeg")})
+    assert "person" in [data["description"] for data in response.json()]
+
+
+def test_metrics() -> None:
+    with open("apollo/test/person.jpg", "rb") as f:
+        client.post("/media/object_detection", params={"response_format": "BOXES", "model": "yolo12n"}, files={"image": ("person.jpg", f.read(), "image/jpeg")})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200 and 'apollo_stage_duration_seconds_count{stage="INFERENCE"}' in response.text
+
+
+def test_full_inference_queue_returns_503(monkeypatch: pytest.MonkeyPatch) -> None:
+    def slow_detect_objects(detection_request_list: List[DetectionRequest], model_path: str, predict_kwargs: Dict) -> Tuple[List[List], Dict]:
+        time.sleep(0.5)
+        return [[] for _ in detection_request_list], {}
+
+    #   One request is being predicted and one is queued, so the other two do not fit
+    inference_engine: InferenceEngine = InferenceEngine("test.pt", number_of_workers=1, max_queue_depth=1, max_batch_size=1, max_wait_ms=0)
+    inference_engine.model_path = "test.pt"
+    monkeypatch.setattr(inference, "detect_objects", slow_detect_objects)
+    monkeypatch.setattr(media.model_registry, "get_engine", lambda model_name=None: inference_engine)
+
+    with open("apollo/test/person.jpg", "rb") as f:
+        image_bytes = f.read()
+
+    async def post_concurrently() -> List[httpx.Response]:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=apollo_app), base_url="http://apollo") as async_client:
+            return await asyncio.gather(*[async_client.post("/media/object_detection", params={"response_format": "BOXES"}, files={"image": ("person.jpg", image_bytes, "image/jpeg")}) for _ in range(4)])
+
+    response_list: List[httpx.Response] = asyncio.run(post_concurrently())
+    inference_engine.shutdown()
+    assert sorted(response.status_code for response in response_list) == [200, 200, 503, 503]
+    assert all(response.headers["Retry-After"] == "1" for response in response_list if response.status_code == 503)
+
+
+def test_batching_honours_the_deadline(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(inference, "detect_objects", lambda detection_request_list, model_path, predict_kwargs: ([[] for _ in detection_request_list], {}))
+
+    async def detect_concurrently(inference_engine: InferenceEngine, number_of_requests: int) -> Tuple[List[int], float]:
+        inference_engine.model_path = "test.pt"
+        started_at: float = time.perf_counter()
+        prediction_list = await asyncio.gather(*[inference_engine.detect(DetectionRequest()) for _ in range(number_of_requests)])
+        inference_engine.shutdown()
+        return [prediction.batch_size for prediction in prediction_list], time.perf_counter() - started_at
+
+    #   A partial batch waits for the deadline before it is dispatched
+    batch_size_list, duration_seconds = asyncio.run(detect_concurrently(InferenceEngine("test.pt", max_batch_size=8, max_wait_ms=200), 3))
+    assert batch_size_list == [3, 3, 3] and 0.2 <= duration_seconds < 1.0
+
+    #   A full batch is dispatched without waiting for the deadline
+    batch_size_list, duration_seconds = asyncio.run(detect_concurrently(InferenceEngine("test.pt", max_batch_size=2, max_wait_ms=5000), 2))
+    assert batch_size_list == [2, 2] and duration_seconds < 1.0
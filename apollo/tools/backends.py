@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import threading
+import time
+from enum import Enum
+from pathlib import Path
+from typing import List, Dict, Any, Tuple
+
+from PIL import Image
+from sirius.common import DataClass
+from ultralytics import YOLO
+from ultralytics.engine.results import Results
+
+MODEL_CACHE_DIRECTORY: str = os.getenv("APOLLO_MODEL_CACHE_DIRECTORY", "model_cache")
+INT8_CALIBRATION_DATA: str = os.getenv("APOLLO_INT8_CALIBRATION_DATA", "coco8.yaml")
+_export_lock: threading.Lock = threading.Lock()
+
+
+class InferenceBackend(Enum):
+    PYTORCH = "PYTORCH"
+    ONNX = "ONNX"
+    OPENVINO = "OPENVINO"
+
+
+INFERENCE_BACKEND: InferenceBackend = InferenceBackend(os.getenv("APOLLO_INFERENCE_BACKEND", InferenceBackend.PYTORCH.value).upper())
+IS_INT8_QUANTIZED: bool = os.getenv("APOLLO_INT8_QUANTIZATION", "false").lower() == "true"
+
+
+class BackendComparison(DataClass):
+    backend: InferenceBackend
+    is_int8_quantized: bool
+    model_path: str
+    median_latency_ms: float
+    p90_latency_ms: float
+    number_of_detections: int
+    recall: float
+    precision: float
+    mean_iou: float
+
+
+def get_cached_model_path(model_path: str, backend: InferenceBackend, is_int8_quantized: bool) -> Path:
+    name: str = f"{Path(model_path).stem}{"_int8" if is_int8_quantized else ""}"
+    return Path(MODEL_CACHE_DIRECTORY) / (f"{name}.onnx" if backend == InferenceBackend.ONNX else f"{name}_openvino_model")
+
+
+def export_model(model_path: str, backend: InferenceBackend = INFERENCE_BACKEND, is_int8_quantized: bool = IS_INT8_QUANTIZED) -> str:
+    if backend == InferenceBackend.PYTORCH:
+        return model_path
+
+    cached_model_path: Path = get_cached_model_path(model_path, backend, is_int8_quantized)
+    with _export_lock:
+        if cached_model_path.exists():
+            return str(cached_model_path)
+
+        cached_model_path.parent.mkdir(parents=True, exist_ok=True)
+        if backend == InferenceBackend.OPENVINO:
+            exported_model_path: str = YOLO(model_path).export(format="openvino", dynamic=True, int8=is_int8_quantized, data=INT8_CALIBRATION_DATA if is_int8_quantized else None)
+            shutil.move(exported_model_path, cached_model_path)
+        else:
+            exported_model_path = YOLO(model_path).export(format="onnx", dynamic=True, simplify=True)
+            if is_int8_quantized:
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                quantize_dynamic(exported_model_path, str(cached_model_path), weight_type=QuantType.QUInt8)
+                os.remove(exported_model_path)
+            else:
+                shutil.move(exported_model_path, cached_model_path)
+
+    return str(cached_model_path)
+
+
+def load_model(model_path: str) -> YOLO:
+    return YOLO(model_path, task="detect")
+
+
+def get_iou(box: List[float], other_box: List[float]) -> float:
+    intersection_width: float = max(0.0, min(box[2], other_box[2]) - max(box[0], other_box[0]))
+    intersection_height: float = max(0.0, min(box[3], other_box[3]) - max(box[1], other_box[1]))
+    intersection_area: float = intersection_width * intersection_height
+    union_area: float = (box[2] - box[0]) * (box[3] - box[1]) + (other_box[2] - other_box[0]) * (other_box[3] - other_box[1]) - intersection_area
+    return intersection_area / union_area if union_area > 0 else 0.0
+
+
+def get_detections(results: Results) -> List[Tuple[int, List[float]]]:
+    return [(int(box.cls.tolist()[0]), box.xyxy[0].tolist()) for box in results.boxes]  # type: ignore[union-attr]
+
+
+def compare_backends(image_path: str, model_path: str = "yolo12m.pt", backend_list: List[Tuple[InferenceBackend, bool]] | None = None, number_of_runs: int = 20, **predict_kwargs: Any) -> List[BackendComparison]:
+    backend_list = [(InferenceBackend.PYTORCH, False), (InferenceBackend.ONNX, False), (InferenceBackend.OPENVINO, False), (InferenceBackend.OPENVINO, True)] if backend_list is None else backend_list
+    image: Image.Image = Image.open(image_path).convert("RGB")
+    reference_detection_list: List[Tuple[int, List[float]]] | None = None
+    backend_comparison_list: List[BackendComparison] = []
+    predict_kwargs = {"verbose": False, "device": "cpu", **predict_kwargs}
+
+    for backend, is_int8_quantized in [(InferenceBackend.PYTORCH, False)] + [b for b in backend_list if b != (InferenceBackend.PYTORCH, False)]:
+        exported_model_path: str = export_model(model_path, backend, is_int8_quantized)
+        model: YOLO = load_model(exported_model_path)
+        model.predict(image, **predict_kwargs)
+        latency_list: List[float] = []
+        results: Results | None = None
+
+        for _ in range(number_of_runs):
+            started_at: float = time.perf_counter()
+            results = model.predict(image, **predict_kwargs)[0]
+            latency_list.append((time.perf_counter() - started_at) * 1000)
+
+        detection_list: List[Tuple[int, List[float]]] = get_detections(results)
+        if reference_detection_list is None:
+            reference_detection_list = detection_list
+
+        iou_list: List[float] = [max([get_iou(box, reference_box) for reference_class_id, reference_box in reference_detection_list if reference_class_id == class_id], default=0.0) for class_id, box in detection_list]
+        matched_reference_count: int = sum(1 for reference_class_id, reference_box in reference_detection_list if any(class_id == reference_class_id and get_iou(box, reference_box) >= 0.5 for class_id, box in detection_list))
+
+        if (backend, is_int8_quantized) in backend_list:
+            backend_comparison_list.append(BackendComparison(
+                backend=backend,
+                is_int8_quantized=is_int8_quantized,
+                model_path=exported_model_path,
+                median_latency_ms=statistics.median(latency_list),
+                p90_latency_ms=statistics.quantiles(latency_list, n=10)[-1] if len(latency_list) > 1 else latency_list[0],
+                number_of_detections=len(detection_list),
+                recall=matched_reference_count / len(reference_detection_list) if len(reference_detection_list) > 0 else 1.0,
+                precision=sum(1 for iou in iou_list if iou >= 0.5) / len(iou_list) if len(iou_list) > 0 else 1.0,
+                mean_iou=statistics.mean(iou_list) if len(iou_list) > 0 else 0.0,
+            ))
+
+    return backend_comparison_list
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Compares the accuracy and latency of the exported inference backends against the PyTorch model.")
+    argument_parser.add_argument("--image", default="test/person.jpg")
+    argument_parser.add_argument("--model", default="yolo12m.pt")
+    argument_parser.add_argument("--runs", type=int, default=20)
+    arguments = argument_parser.parse_args()
+
+    comparison_list: List[Dict[str, Any]] = [comparison.model_dump(mode="json") for comparison in compare_backends(arguments.image, arguments.model, number_of_runs=arguments.runs)]
+    print(json.dumps(comparison_list, indent=2))
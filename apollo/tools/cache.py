@@ -0,0 +1,101 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from io import BytesIO
+from typing import List, Tuple, Hashable
+
+import numpy as np
+from PIL import Image
+from sirius.common import DataClass
+
+from tools.inference import Detection
+
+FRAME_CACHE_SIZE: int = int(os.getenv("APOLLO_FRAME_CACHE_SIZE", "64"))
+FRAME_CACHE_TTL_SECONDS: float = float(os.getenv("APOLLO_FRAME_CACHE_TTL_SECONDS", "30"))
+FRAME_CACHE_MAX_DIFFERENCE: int = int(os.getenv("APOLLO_FRAME_CACHE_MAX_DIFFERENCE", "12"))
+SIGNATURE_SIZE: Tuple[int, int] = (64, 64)
+
+
+@dataclass
+class FrameCacheEntry:
+    key: Hashable
+    signature: np.ndarray
+    detection_list: List[Detection]
+    created_at: float
+
+
+class FrameCacheStatistics(DataClass):
+    size: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+
+
+def get_frame_signature(image_bytes: bytes | None = None, frame: np.ndarray | None = None) -> np.ndarray:
+    if frame is not None:
+        image: Image.Image = Image.fromarray(np.ascontiguousarray(frame[:, :, 1]))
+    else:
+        image = Image.open(BytesIO(image_bytes))
+        image.draft("L", (SIGNATURE_SIZE[0] * 2, SIGNATURE_SIZE[1] * 2))
+
+    return np.asarray(image.convert("L").resize(SIGNATURE_SIZE, Image.Resampling.BOX), dtype=np.int16)
+
+
+class FrameCache:
+    max_size: int
+    ttl_seconds: float
+    max_difference: int
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    _entry_dict: OrderedDict[int, FrameCacheEntry]
+    _next_entry_id: int = 0
+
+    def __init__(self, max_size: int = FRAME_CACHE_SIZE, ttl_seconds: float = FRAME_CACHE_TTL_SECONDS, max_difference: int = FRAME_CACHE_MAX_DIFFERENCE) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_difference = max_difference
+        self._entry_dict = OrderedDict()
+
+    @property
+    def is_enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def get(self, key: Hashable, signature: np.ndarray) -> List[Detection] | None:
+        self._evict_expired()
+        for entry_id, entry in reversed(self._entry_dict.items()):
+            if entry.key == key and int(np.abs(entry.signature - signature).max()) <= self.max_difference:
+                self._entry_dict.move_to_end(entry_id)
+                self.hits += 1
+                return entry.detection_list
+
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, signature: np.ndarray, detection_list: List[Detection]) -> None:
+        if not self.is_enabled:
+            return
+
+        self._entry_dict[self._next_entry_id] = FrameCacheEntry(key=key, signature=signature, detection_list=detection_list, created_at=time.monotonic())
+        self._next_entry_id += 1
+
+        while len(self._entry_dict) > self.max_size:
+            self._entry_dict.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entry_dict.clear()
+
+    def get_statistics(self) -> FrameCacheStatistics:
+        self._evict_expired()
+        return FrameCacheStatistics(size=len(self._entry_dict), hits=self.hits, misses=self.misses, evictions=self.evictions, hit_rate=self.hits / (self.hits + self.misses) if self.hits + self.misses > 0 else 0.0)
+
+    def _evict_expired(self) -> None:
+        expiry_time: float = time.monotonic() - self.ttl_seconds
+        expired_entry_id_list: List[int] = [entry_id for entry_id, entry in self._entry_dict.items() if entry.created_at < expiry_time]
+
+        for entry_id in expired_entry_id_list:
+            del self._entry_dict[entry_id]
+            self.evictions += 1
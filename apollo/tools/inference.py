@@ -0,0 +1,260 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from io import BytesIO
+from multiprocessing import get_context
+from typing import List, Any, Dict, Set, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+from sirius.common import DataClass
+from ultralytics import YOLO
+from ultralytics.engine.results import Results
+
+from tools.backends import InferenceBackend, INFERENCE_BACKEND, IS_INT8_QUANTIZED, export_model, load_model
+from tools.metrics import Stage, BATCH_SIZE, observe_stage_duration
+from tools.regions import Polygon, PreparedImage, prepare_image, get_model_input_size
+
+MAX_BATCH_SIZE: int = int(os.getenv("APOLLO_MAX_BATCH_SIZE", "8"))
+MAX_BATCH_WAIT_MS: float = float(os.getenv("APOLLO_MAX_BATCH_WAIT_MS", "25"))
+MAX_QUEUE_DEPTH: int = int(os.getenv("APOLLO_MAX_QUEUE_DEPTH", "32"))
+NUMBER_OF_WORKERS: int = int(os.getenv("APOLLO_NUMBER_OF_WORKERS", "1"))
+_worker_state: threading.local = threading.local()
+
+
+class ExecutorType(Enum):
+    THREAD = "THREAD"
+    PROCESS = "PROCESS"
+
+
+EXECUTOR_TYPE: ExecutorType = ExecutorType(os.getenv("APOLLO_EXECUTOR_TYPE", ExecutorType.THREAD.value).upper())
+
+
+class InferenceQueueFullException(Exception):
+    pass
+
+
+class Detection(DataClass):
+    description: str
+    confidence: float
+    box: List[float]
+    image: bytes | None = None
+
+
+@dataclass
+class DetectionRequest:
+    image_bytes: bytes | None = None
+    frame: np.ndarray | None = None
+    include_crops: bool = True
+    polygon_list: List[Polygon] = field(default_factory=list)
+    inference_size: int | None = None
+
+
+@dataclass
+class BatchPrediction:
+    detection_list: List[Detection]
+    batch_size: int
+    queue_wait_ms: float
+
+
+@dataclass
+class PendingPrediction:
+    detection_request: DetectionRequest
+    future: asyncio.Future
+    enqueued_at: float
+
+
+def get_worker_model(model_path: str) -> YOLO:
+    #   Each worker thread/process holds its own replica because YOLO.predict is not thread-safe
+    model_dict: Dict[str, YOLO] = _worker_state.__dict__.setdefault("model_dict", {})
+    if model_path not in model_dict:
+        model_dict[model_path] = load_model(model_path)
+
+    return model_dict[model_path]
+
+
+def get_image(detection_request: DetectionRequest) -> Image.Image:
+    if detection_request.frame is not None:
+        return Image.fromarray(np.ascontiguousarray(detection_request.frame[:, :, ::-1]))
+
+    image: Image.Image = Image.open(BytesIO(detection_request.image_bytes))
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+
+def detect_objects(detection_request_list: List[DetectionRequest], model_path: str, predict_kwargs: Dict[str, Any]) -> Tuple[List[List[Detection]], Dict[Stage, float]]:
+    #   The stage durations are returned rather than observed here, as this may run in a worker process whose metrics are not exported
+    model: YOLO = get_worker_model(model_path)
+    stage_duration_dict: Dict[Stage, float] = {Stage.CROP_ENCODE: 0.0}
+    results_dict: Dict[int, Results] = {}
+    detection_list_list: List[List[Detection]] = []
+
+    started_at: float = time.perf_counter()
+    image_list: List[Image.Image] = [get_image(detection_request) for detection_request in detection_request_list]
+    stage_duration_dict[Stage.IMAGE_DECODE] = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    prepared_image_list: List[PreparedImage] = [prepare_image(image, detection_request.polygon_list, detection_request.inference_size) for detection_request, image in zip(detection_request_list, image_list)]
+    stage_duration_dict[Stage.PREPROCESS] = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    for model_input_size in {get_model_input_size(detection_request.inference_size) for detection_request in detection_request_list}:
+        index_list: List[int] = [index for index, detection_request in enumerate(detection_request_list) if get_model_input_size(detection_request.inference_size) == model_input_size]
+        size_kwargs: Dict[str, Any] = {} if model_input_size is None else {"imgsz": model_input_size}
+        results_list: List[Results] = model.predict([prepared_image_list[index].image for index in index_list], device="cuda" if torch.cuda.is_available() else "cpu", **size_kwargs, **predict_kwargs)
+        results_dict.update(zip(index_list, results_list))
+
+    stage_duration_dict[Stage.INFERENCE] = time.perf_counter() - started_at
+
+    for index, (detection_request, image, prepared_image) in enumerate(zip(detection_request_list, image_list, prepared_image_list)):
+        detection_list: List[Detection] = []
+        for box in results_dict[index].boxes:  # type: ignore[union-attr]
+            x1, y1, x2, y2 = prepared_image.to_original_box(box.xyxy[0].tolist())
+            if not prepared_image.is_inside_region([x1, y1, x2, y2]):
+                continue
+
+            cropped_image_bytes: bytes | None = None
+            if detection_request.include_crops:
+                started_at = time.perf_counter()
+                cropped_image_bytes_io = BytesIO()
+                image.crop((x1, y1, x2, y2)).save(cropped_image_bytes_io, format="JPEG")
+                cropped_image_bytes = cropped_image_bytes_io.getvalue()
+                stage_duration_dict[Stage.CROP_ENCODE] += time.perf_counter() - started_at
+
+            detection_list.append(Detection(description=model.names[int(box.cls.tolist()[0])], confidence=float(box.conf.tolist()[0]), box=[x1, y1, x2, y2], image=cropped_image_bytes))
+
+        detection_list_list.append(detection_list)
+
+    return detection_list_list, stage_duration_dict
+
+
+def warm_up_worker(model_path: str, image_size: int) -> float:
+    started_at: float = time.perf_counter()
+    get_worker_model(model_path).predict(Image.new("RGB", (image_size, image_size)), verbose=False, device="cuda" if torch.cuda.is_available() else "cpu")
+    return (time.perf_counter() - started_at) * 1000
+
+
+class InferenceEngine:
+    source_model_path: str
+    backend: InferenceBackend
+    is_int8_quantized: bool
+    executor_type: ExecutorType
+    number_of_workers: int
+    max_queue_depth: int
+    max_batch_size: int
+    max_wait_ms: float
+    predict_kwargs: Dict[str, Any]
+    model_path: str | None = None
+    _executor: Executor | None = None
+    _queue: asyncio.Queue | None = None
+    _dispatcher: asyncio.Task | None = None
+    _batch_task_set: Set[asyncio.Task]
+
+    def __init__(self, source_model_path: str, backend: InferenceBackend = INFERENCE_BACKEND, is_int8_quantized: bool = IS_INT8_QUANTIZED, executor_type: ExecutorType = EXECUTOR_TYPE,
+                 number_of_workers: int = NUMBER_OF_WORKERS, max_queue_depth: int = MAX_QUEUE_DEPTH, max_batch_size: int = MAX_BATCH_SIZE, max_wait_ms: float = MAX_BATCH_WAIT_MS, **predict_kwargs: Any) -> None:
+        self.source_model_path = source_model_path
+        self.backend = backend
+        self.is_int8_quantized = is_int8_quantized
+        self.executor_type = executor_type
+        self.number_of_workers = max(1, number_of_workers)
+        self.max_queue_depth = max(1, max_queue_depth)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.predict_kwargs = predict_kwargs
+        self._batch_task_set = set()
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == ExecutorType.PROCESS:
+                self._executor = ProcessPoolExecutor(max_workers=self.number_of_workers, mp_context=get_context("spawn"))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.number_of_workers, thread_name_prefix="apollo-inference")
+
+        return self._executor
+
+    async def prepare(self) -> None:
+        if self.model_path is None:
+            self.model_path = await asyncio.to_thread(export_model, self.source_model_path, self.backend, self.is_int8_quantized)
+
+    async def warm_up(self, image_size: int = 640) -> List[float]:
+        await self.prepare()
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        return list(await asyncio.gather(*[loop.run_in_executor(self.executor, warm_up_worker, self.model_path, image_size) for _ in range(self.number_of_workers)]))
+
+    async def detect(self, detection_request: DetectionRequest) -> BatchPrediction:
+        if self.model_path is None:
+            await self.prepare()
+
+        queue: asyncio.Queue = self._get_queue()
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+        try:
+            queue.put_nowait(PendingPrediction(detection_request=detection_request, future=future, enqueued_at=time.perf_counter()))
+        except asyncio.QueueFull:
+            raise InferenceQueueFullException(f"The inference queue is full ({self.max_queue_depth} pending requests)")
+
+        return await future
+
+    def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+        self._executor, self._queue, self._dispatcher = None, None, None
+
+    def _get_queue(self) -> asyncio.Queue:
+        #   The dispatcher is bound to the event loop it was started on, so it is restarted if the loop changes (e.g. under the TestClient)
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        if self._queue is None or self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_depth)
+            self._dispatcher = loop.create_task(self._dispatch(self._queue))
+
+        return self._queue
+
+    async def _dispatch(self, queue: asyncio.Queue) -> None:
+        worker_semaphore: asyncio.Semaphore = asyncio.Semaphore(self.number_of_workers)
+
+        while True:
+            await worker_semaphore.acquire()
+            batch: List[PendingPrediction] = [await queue.get()]
+            deadline: float = batch[0].enqueued_at + self.max_wait_ms / 1000
+
+            while len(batch) < self.max_batch_size:
+                remaining_time: float = deadline - time.perf_counter()
+                try:
+                    batch.append(queue.get_nowait() if remaining_time <= 0 else await asyncio.wait_for(queue.get(), remaining_time))
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+
+            batch_task: asyncio.Task = asyncio.create_task(self._predict_batch([pending_prediction for pending_prediction in batch if not pending_prediction.future.done()]))
+            batch_task.add_done_callback(lambda _: worker_semaphore.release())
+            batch_task.add_done_callback(self._batch_task_set.discard)
+            self._batch_task_set.add(batch_task)
+
+    async def _predict_batch(self, batch: List[PendingPrediction]) -> None:
+        if len(batch) == 0:
+            return
+
+        started_at: float = time.perf_counter()
+        try:
+            detection_list_list, stage_duration_dict = await asyncio.get_running_loop().run_in_executor(self.executor, detect_objects, [pending_prediction.detection_request for pending_prediction in batch], self.model_path, self.predict_kwargs)
+        except Exception as e:
+            for pending_prediction in batch:
+                if not pending_prediction.future.done():
+                    pending_prediction.future.set_exception(e)
+            return
+
+        BATCH_SIZE.observe(len(batch))
+        for stage, duration_seconds in stage_duration_dict.items():
+            observe_stage_duration(stage, duration_seconds)
+
+        for pending_prediction, detection_list in zip(batch, detection_list_list):
+            observe_stage_duration(Stage.QUEUE_WAIT, started_at - pending_prediction.enqueued_at)
+            if not pending_prediction.future.done():
+                pending_prediction.future.set_result(BatchPrediction(detection_list=detection_list, batch_size=len(batch), queue_wait_ms=(started_at - pending_prediction.enqueued_at) * 1000))
@@ -1,16 +1,27 @@
+import asyncio
 import base64
-from io import BytesIO
-from typing import List
+import secrets
+from enum import Enum
+from typing import List, Dict, Tuple
 
-import torch
-from PIL import Image
-from fastapi import UploadFile, File, APIRouter
+import numpy as np
+from fastapi import UploadFile, File, APIRouter, Response, HTTPException, status, Request
 from sirius.common import DataClass
-from ultralytics import YOLO
-from ultralytics.engine.results import Results
+
+from tools.cache import FrameCache, FrameCacheStatistics, get_frame_signature
+from tools.inference import BatchPrediction, InferenceQueueFullException, DetectionRequest, Detection, InferenceEngine
+from tools.regions import SourceConfiguration, get_source_configuration, set_source_configuration, delete_source_configuration, get_all_source_configurations
+from tools.registry import ModelRegistry, ModelNotFoundException, ModelStatus
 
 router = APIRouter()
-yolov8n_model: YOLO = YOLO("yolo12m.pt")
+model_registry: ModelRegistry = ModelRegistry(classes=[0, 2], verbose=False)
+frame_cache: FrameCache = FrameCache()
+
+
+class ResponseFormat(Enum):
+    FULL = "FULL"
+    BOXES = "BOXES"
+    MULTIPART = "MULTIPART"
 
 
 class ObjectDetectionResponse(DataClass):
@@ -18,22 +29,122 @@ class ObjectDetectionResponse(DataClass):
     image_base64: str
 
 
-@router.post("/object_detection", summary="Detects objects in the image and returns a list of cropped images of the detected objects.")
-async def object_detection(image: UploadFile = File(...)) -> List[ObjectDetectionResponse]:
+class BoundingBoxResponse(DataClass):
+    description: str
+    confidence: float
+    xyxy: List[float]
+
+
+def get_multipart_response(detection_list: List[Detection]) -> Response:
+    boundary: str = secrets.token_hex(16)
+    part_list: List[bytes] = []
+
+    for index, detection in enumerate(detection_list):
+        part_list.append((f"--{boundary}\r\n"
+                          f"Content-Type: image/jpeg\r\n"
+                          f"Content-Disposition: inline; name=\"{detection.description}\"; filename=\"{index}.jpeg\"\r\n"
+                          f"Content-Length: {len(detection.image)}\r\n"
+                          f"X-Description: {detection.description}\r\n"
+                          f"X-Confidence: {detection.confidence:.4f}\r\n"
+                          f"X-Box: {",".join(f"{coordinate:.1f}" for coordinate in detection.box)}\r\n\r\n").encode("ascii"))
+        part_list.append(detection.image)
+        part_list.append(b"\r\n")
+
+    part_list.append(f"--{boundary}--\r\n".encode("ascii"))
+    return Response(content=b"".join(part_list), media_type=f"multipart/mixed; boundary={boundary}")
+
+
+async def detect(detection_request: DetectionRequest, source: str | None = None, model: str | None = None) -> Tuple[List[Detection], Dict[str, str]]:
+    inference_engine: InferenceEngine = model_registry.get_engine(model)
+    source_configuration: SourceConfiguration | None = get_source_configuration(source)
+    if source_configuration is not None:
+        detection_request.polygon_list = [region_of_interest.polygon for region_of_interest in source_configuration.region_of_interest_list]
+        detection_request.inference_size = source_configuration.inference_size
+
+    #   Frames without a source are not cached, as a near-identical frame (e.g. a dark night frame) from another camera would otherwise be served this one's detections
+    signature: np.ndarray | None = await asyncio.to_thread(get_frame_signature, detection_request.image_bytes, detection_request.frame) if frame_cache.is_enabled and source is not None else None
+    cache_key: Tuple[str, str | None, bool] = (inference_engine.source_model_path, source, detection_request.include_crops)
+    detection_list: List[Detection] | None = frame_cache.get(cache_key, signature) if signature is not None else None
+    if detection_list is not None:
+        return detection_list, {"X-Cache": "HIT"}
+
+    prediction: BatchPrediction = await inference_engine.detect(detection_request)
+    if signature is not None:
+        frame_cache.put(cache_key, signature, prediction.detection_list)
+
+    return prediction.detection_list, {"X-Cache": "MISS", "X-Batch-Size": str(prediction.batch_size), "X-Queue-Wait-Ms": f"{prediction.queue_wait_ms:.2f}"}
+
+
+async def get_object_detection_response(response: Response, detection_request: DetectionRequest, response_format: ResponseFormat, source: str | None, model: str | None) -> List[ObjectDetectionResponse] | List[BoundingBoxResponse] | Response:
+    try:
+        detection_list, header_dict = await detect(detection_request, source, model)
+    except ModelNotFoundException as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except InferenceQueueFullException as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "1"})
+
+    if response_format == ResponseFormat.MULTIPART:
+        response = get_multipart_response(detection_list)
+
+    response.headers.update(header_dict)
+
+    if response_format == ResponseFormat.MULTIPART:
+        return response
+    elif response_format == ResponseFormat.BOXES:
+        return [BoundingBoxResponse(description=detection.description, confidence=detection.confidence, xyxy=detection.box) for detection in detection_list]
+
+    return [ObjectDetectionResponse(description=detection.description, image_base64=base64.b64encode(detection.image).decode("ascii")) for detection in detection_list]
+
+
+@router.post("/object_detection", response_model=None, summary="Detects objects in the image and returns a list of cropped images of the detected objects.",
+             description="The response_format can be FULL (base64 encoded crops in JSON), BOXES (the class, confidence and xyxy box only) or MULTIPART (raw JPEG crops in a multipart/mixed body, with the class, confidence and box in the part headers). "
+                         "If a source is provided, its registered regions of interest and inference size are applied before the inference, and near-duplicate frames of the same source are served from the frame cache. "
+                         "The model can be set to a smaller model (see /media/models) to trade accuracy for latency.")
+async def object_detection(response: Response, image: UploadFile = File(...), response_format: ResponseFormat = ResponseFormat.FULL, source: str | None = None, model: str | None = None) -> List[ObjectDetectionResponse] | List[BoundingBoxResponse] | Response:
     image_bytes = await image.read()
-    image_file: Image.Image = Image.open(BytesIO(image_bytes))
-    raw_prediction_results: List[Results] = yolov8n_model.predict(image_file, classes=[0, 2], verbose=False, device= "cuda" if torch.cuda.is_available() else "cpu")
-    prediction_results: List[ObjectDetectionResponse] = []
-
-    for box in [box for detections in raw_prediction_results for box in detections.boxes]:  # type: ignore[attr-defined]
-        class_id = int(box.cls.tolist()[0])
-        object_name = yolov8n_model.names[class_id]
-        x1, y1, x2, y2 = box.xyxy[0].tolist()
-        cropped_image = image_file.crop((x1, y1, x2, y2))
-        cropped_image_bytes_io = BytesIO()
-        cropped_image.save(cropped_image_bytes_io, format='JPEG')
-        cropped_image_bytes = cropped_image_bytes_io.getvalue()
-
-        prediction_results.append(ObjectDetectionResponse(description=object_name, image_base64=base64.b64encode(cropped_image_bytes).decode("ascii")))
-
-    return prediction_results
+    return await get_object_detection_response(response, DetectionRequest(image_bytes=image_bytes, include_crops=response_format != ResponseFormat.BOXES), response_format, source, model)
+
+
+@router.post("/object_detection/raw", response_model=None, summary="Detects objects in an uncompressed frame and returns a list of cropped images of the detected objects.",
+             description="The request body is the raw BGR frame (8 bits per channel, row-major, width x height x 3 bytes), e.g. an OpenCV frame's tobytes(), which avoids the JPEG round trip. "
+                         "The remaining parameters are the same as /media/object_detection.")
+async def raw_object_detection(request: Request, response: Response, width: int, height: int, response_format: ResponseFormat = ResponseFormat.FULL, source: str | None = None, model: str | None = None) -> List[ObjectDetectionResponse] | List[BoundingBoxResponse] | Response:
+    frame_bytes: bytes = await request.body()
+    if len(frame_bytes) != width * height * 3:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Expected {width * height * 3} bytes for a {width}x{height} BGR frame, but received {len(frame_bytes)} bytes")
+
+    frame: np.ndarray = np.frombuffer(frame_bytes, dtype=np.uint8).reshape((height, width, 3))
+    return await get_object_detection_response(response, DetectionRequest(frame=frame, include_crops=response_format != ResponseFormat.BOXES), response_format, source, model)
+
+
+@router.get("/models", summary="Returns the available models and whether they are warmed up.")
+async def get_models() -> List[ModelStatus]:
+    return model_registry.get_status_list()
+
+
+@router.get("/cache_statistics", summary="Returns the hit/miss counters of the near-duplicate frame cache.")
+async def get_cache_statistics() -> FrameCacheStatistics:
+    return frame_cache.get_statistics()
+
+
+@router.get("/sources", summary="Returns the regions of interest and inference sizes registered for each source.")
+async def get_sources() -> Dict[str, SourceConfiguration]:
+    return get_all_source_configurations()
+
+
+@router.put("/sources/{source_name}", summary="Registers the regions of interest and inference size of a source.",
+            description="The polygons of the regions of interest are in normalized coordinates, where (0, 0) is the top-left and (1, 1) is the bottom-right corner of the frame. "
+                        "Only the pixels inside the polygons are used for the inference, and the frame is resized so that its longest side is at most inference_size pixels.")
+async def put_source(source_name: str, source_configuration: SourceConfiguration) -> SourceConfiguration:
+    set_source_configuration(source_name, source_configuration)
+    frame_cache.clear()
+    return source_configuration
+
+
+@router.delete("/sources/{source_name}", summary="Removes the regions of interest and inference size of a source.")
+async def delete_source(source_name: str) -> Response:
+    if not delete_source_configuration(source_name):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    frame_cache.clear()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
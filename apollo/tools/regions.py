@@ -0,0 +1,87 @@
+import math
+from dataclasses import dataclass
+from typing import List, Tuple, Dict
+
+from PIL import Image, ImageDraw
+from sirius.common import DataClass
+
+Polygon = List[Tuple[float, float]]
+_source_configuration_dict: Dict[str, "SourceConfiguration"] = {}
+
+
+class RegionOfInterest(DataClass):
+    name: str
+    polygon: Polygon
+
+
+class SourceConfiguration(DataClass):
+    region_of_interest_list: List[RegionOfInterest] = []
+    inference_size: int | None = None
+
+
+@dataclass
+class PreparedImage:
+    image: Image.Image
+    mask: Image.Image | None
+    offset: Tuple[int, int]
+    scale: float
+
+    def to_original_box(self, box: List[float]) -> List[float]:
+        return [box[0] / self.scale + self.offset[0], box[1] / self.scale + self.offset[1], box[2] / self.scale + self.offset[0], box[3] / self.scale + self.offset[1]]
+
+    def is_inside_region(self, original_box: List[float]) -> bool:
+        if self.mask is None:
+            return True
+
+        center_x: int = min(max(int((original_box[0] + original_box[2]) / 2) - self.offset[0], 0), self.mask.width - 1)
+        center_y: int = min(max(int((original_box[1] + original_box[3]) / 2) - self.offset[1], 0), self.mask.height - 1)
+        return self.mask.getpixel((center_x, center_y)) != 0
+
+
+def get_source_configuration(source_name: str | None) -> SourceConfiguration | None:
+    return None if source_name is None else _source_configuration_dict.get(source_name)
+
+
+def get_all_source_configurations() -> Dict[str, SourceConfiguration]:
+    return dict(_source_configuration_dict)
+
+
+def set_source_configuration(source_name: str, source_configuration: SourceConfiguration) -> None:
+    _source_configuration_dict[source_name] = source_configuration
+
+
+def delete_source_configuration(source_name: str) -> bool:
+    return _source_configuration_dict.pop(source_name, None) is not None
+
+
+def get_model_input_size(inference_size: int | None) -> int | None:
+    return None if inference_size is None else max(32, math.ceil(inference_size / 32) * 32)
+
+
+def prepare_image(image: Image.Image, polygon_list: List[Polygon], inference_size: int | None) -> PreparedImage:
+    mask: Image.Image | None = None
+    offset: Tuple[int, int] = (0, 0)
+    scale: float = 1.0
+
+    if len(polygon_list) > 0:
+        pixel_polygon_list: List[List[Tuple[float, float]]] = [[(x * image.width, y * image.height) for x, y in polygon] for polygon in polygon_list]
+        left: int = max(0, math.floor(min(x for polygon in pixel_polygon_list for x, _ in polygon)))
+        top: int = max(0, math.floor(min(y for polygon in pixel_polygon_list for _, y in polygon)))
+        right: int = min(image.width, math.ceil(max(x for polygon in pixel_polygon_list for x, _ in polygon)))
+        bottom: int = min(image.height, math.ceil(max(y for polygon in pixel_polygon_list for _, y in polygon)))
+        offset = (left, top)
+        mask = Image.new("L", (max(1, right - left), max(1, bottom - top)), 0)
+        mask_draw: ImageDraw.ImageDraw = ImageDraw.Draw(mask)
+
+        for polygon in pixel_polygon_list:
+            mask_draw.polygon([(x - left, y - top) for x, y in polygon], fill=255)
+
+        masked_image: Image.Image = Image.new("RGB", mask.size)
+        masked_image.paste(image.crop((left, top, left + mask.width, top + mask.height)), mask=mask)
+        image = masked_image
+
+    if inference_size is not None and max(image.size) > inference_size:
+        scale = inference_size / max(image.size)
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.Resampling.BILINEAR)
+
+    return PreparedImage(image=image, mask=mask, offset=offset, scale=scale)
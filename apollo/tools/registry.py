@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Set, Any
+
+from sirius.common import DataClass
+
+from tools.inference import InferenceEngine
+
+logger = logging.getLogger(__name__)
+
+
+def get_available_models(models_str: str) -> Dict[str, str]:
+    return {name.strip(): path.strip() for name, path in (model.split("=", 1) for model in models_str.split(",") if "=" in model)}
+
+
+AVAILABLE_MODELS: Dict[str, str] = get_available_models(os.getenv("APOLLO_MODELS", "yolo12n=yolo12n.pt,yolo12s=yolo12s.pt,yolo12m=yolo12m.pt"))
+DEFAULT_MODEL: str = os.getenv("APOLLO_DEFAULT_MODEL", "yolo12m")
+STARTUP_MODELS: List[str] = [name.strip() for name in os.getenv("APOLLO_STARTUP_MODELS", DEFAULT_MODEL).split(",") if name.strip() != ""]
+
+
+class ModelNotFoundException(Exception):
+    pass
+
+
+class ModelStatus(DataClass):
+    name: str
+    path: str
+    is_default: bool
+    is_loaded_at_startup: bool
+    is_ready: bool
+    warm_up_latency_ms: List[float] = []
+
+
+class ModelRegistry:
+    default_model: str
+    startup_model_list: List[str]
+    predict_kwargs: Dict[str, Any]
+    _model_dict: Dict[str, str]
+    _engine_dict: Dict[str, InferenceEngine]
+    _ready_model_set: Set[str]
+    _warm_up_latency_dict: Dict[str, List[float]]
+    _warm_up_task: "asyncio.Task[None] | None" = None
+
+    def __init__(self, model_dict: Dict[str, str] = AVAILABLE_MODELS, default_model: str = DEFAULT_MODEL, startup_model_list: List[str] = STARTUP_MODELS, **predict_kwargs: Any) -> None:
+        self._model_dict = model_dict
+        self.default_model = default_model
+        self.startup_model_list = list(model_dict.keys()) if "*" in startup_model_list else startup_model_list
+        self.predict_kwargs = predict_kwargs
+        self._engine_dict = {}
+        self._ready_model_set = set()
+        self._warm_up_latency_dict = {}
+
+        for model_name in [self.default_model] + self.startup_model_list:
+            if model_name not in self._model_dict:
+                raise ModelNotFoundException(f"Model is not available: {model_name}")
+
+    @property
+    def is_ready(self) -> bool:
+        return all(model_name in self._ready_model_set for model_name in self.startup_model_list)
+
+    def get_engine(self, model_name: str | None = None) -> InferenceEngine:
+        model_name = self.default_model if model_name is None else model_name
+        if model_name not in self._model_dict:
+            raise ModelNotFoundException(f"Model is not available: {model_name} (available models: {", ".join(self._model_dict.keys())})")
+
+        if model_name not in self._engine_dict:
+            self._engine_dict[model_name] = InferenceEngine(self._model_dict[model_name], **self.predict_kwargs)
+
+        return self._engine_dict[model_name]
+
+    async def load(self, model_name: str) -> None:
+        self._warm_up_latency_dict[model_name] = await self.get_engine(model_name).warm_up()
+        self._ready_model_set.add(model_name)
+        logger.info(f"Model '{model_name}' is warmed up ({", ".join(f"{latency:.0f}ms" for latency in self._warm_up_latency_dict[model_name])})")
+
+    async def start(self) -> None:
+        await asyncio.gather(*[self.load(model_name) for model_name in self.startup_model_list])
+
+    def start_in_background(self) -> None:
+        #   The service keeps serving /ping and /ready (as 503) while the startup models are exported and warmed up
+        self._warm_up_task = asyncio.create_task(self.start())
+        self._warm_up_task.add_done_callback(self._on_warmed_up)
+
+    def shutdown(self) -> None:
+        if self._warm_up_task is not None:
+            self._warm_up_task.cancel()
+            self._warm_up_task = None
+
+        for engine in self._engine_dict.values():
+            engine.shutdown()
+
+        self._ready_model_set.clear()
+
+    @staticmethod
+    def _on_warmed_up(task: "asyncio.Task[None]") -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"The startup models could not be warmed up: {task.exception()!r}")
+
+    def get_status_list(self) -> List[ModelStatus]:
+        return [ModelStatus(
+            name=model_name,
+            path=model_path,
+            is_default=model_name == self.default_model,
+            is_loaded_at_startup=model_name in self.startup_model_list,
+            is_ready=model_name in self._ready_model_set,
+            warm_up_latency_ms=self._warm_up_latency_dict.get(model_name, []),
+        ) for model_name, model_path in self._model_dict.items()]
@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from types import ModuleType
+from typing import List, Dict, Any, Callable, Awaitable
+
+import httpx
+
+BENCHMARK_DIRECTORY: Path = Path(__file__).resolve().parent
+VITA_MCP_DIRECTORY: Path = BENCHMARK_DIRECTORY.parent / "vita-mcp"
+API_KEY: str = "benchmark"
+#   The smallest valid JPEG header is enough, as vita-api only sniffs the signature and the fake Discord does not decode it
+JPEG_BYTES: bytes = b"\xff\xd8\xff\xe0" + bytes(4 * 1024)
+
+
+@dataclass
+class Scenario:
+    name: str
+    target: str
+    request_function: Callable[[], Awaitable[bool]]
+    rss_function: Callable[[], float | None]
+
+
+def get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
+        server_socket.bind(("127.0.0.1", 0))
+        return server_socket.getsockname()[1]
+
+
+def get_peak_rss_mb(pid: int | None = None) -> float | None:
+    if pid is None:
+        #   ru_maxrss is in KiB on Linux, but in bytes on macOS
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            return next(round(int(line.split()[1]) / 1024, 1) for line in status_file if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        return None
+
+
+async def wait_until_ready(url: str, process: subprocess.Popen, timeout_seconds: float = 30.0) -> None:
+    deadline: float = time.monotonic() + timeout_seconds
+    async with httpx.AsyncClient() as http_client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{" ".join(process.args)} exited with {process.returncode}")
+
+            try:
+                if (await http_client.get(url)).is_success:
+                    return
+            except httpx.TransportError:
+                pass
+
+            await asyncio.sleep(0.2)
+
+    raise TimeoutError(f"{url} was not ready after {timeout_seconds} seconds")
+
+
+async def run_scenario(scenario: Scenario, number_of_requests: int, concurrency: int) -> Dict[str, Any]:
+    remaining_list: List[int] = [number_of_requests]
+    latency_list: List[float] = []
+    number_of_errors: int = 0
+
+    async def worker() -> None:
+        nonlocal number_of_errors
+        while remaining_list[0] > 0:
+            remaining_list[0] -= 1
+            started_at: float = time.perf_counter()
+            try:
+                is_successful: bool = await scenario.request_function()
+            except Exception:
+                is_successful = False
+
+            latency_list.append((time.perf_counter() - started_at) * 1000)
+            number_of_errors += 0 if is_successful else 1
+
+    #   A request before the measurement, so that connection set up and the first cache fill are not counted
+    await scenario.request_function()
+    started_at: float = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    duration_seconds: float = time.perf_counter() - started_at
+
+    latency_list.sort()
+    return {
+        "name": scenario.name,
+        "target": scenario.target,
+        "concurrency": concurrency,
+        "requests": number_of_requests,
+        "errors": number_of_errors,
+        "throughput_rps": round(number_of_requests / duration_seconds, 1),
+        "p50_ms": round(statistics.median(latency_list), 2),
+        "p99_ms": round(latency_list[int(0.99 * (len(latency_list) - 1))], 2),
+        "peak_rss_mb": scenario.rss_function(),
+    }
+
+
+def get_vita_api_scenario_list(api_client: httpx.AsyncClient, vita_api_pid: int) -> List[Scenario]:
+    async def get(path: str, params: Dict[str, Any] | None = None) -> bool:
+        response: httpx.Response = await api_client.get(path, params=params)
+        return response.is_success
+
+    async def send_message() -> bool:
+        response: httpx.Response = await api_client.post("/discord/send_message", json={"message": "Benchmark message"})
+        return response.is_success
+
+    async def send_multipart_message() -> bool:
+        response: httpx.Response = await api_client.post("/discord/send_message/multipart", data={"message": "Benchmark message"}, files=[("media_list", ("frame.jpg", JPEG_BYTES, "image/jpeg"))])
+        return response.is_success
+
+    request_function_dict: Dict[str, Callable[[], Awaitable[bool]]] = {
+        "GET /ibkr/account_summary": lambda: get("/ibkr/account_summary"),
+        "GET /ibkr/portfolio_analytics": lambda: get("/ibkr/portfolio_analytics"),
+        "GET /wise/account_summary": lambda: get("/wise/account_summary"),
+        "GET /wise/latest_transactions": lambda: get("/wise/latest_transactions", {"currency_str": "NZD"}),
+        "POST /discord/send_message": send_message,
+        "POST /discord/send_message/multipart": send_multipart_message,
+        "GET /metrics": lambda: get("/metrics"),
+    }
+    return [Scenario(name=name, target="vita-api", request_function=request_function, rss_function=lambda: get_peak_rss_mb(vita_api_pid)) for name, request_function in request_function_dict.items()]
+
+
+def import_vita_mcp(vita_api_url: str) -> ModuleType:
+    #   vita-mcp reads its configuration when it is imported, and its module name clashes with other services' main, so it is imported from its path
+    os.environ["VITA_API_BASE_URL"] = vita_api_url
+    os.environ["API_KEY"] = API_KEY
+    module_spec = importlib.util.spec_from_file_location("vita_mcp_main", VITA_MCP_DIRECTORY / "main.py")
+    module: ModuleType = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+    return module
+
+
+def get_vita_mcp_scenario_list(vita_mcp: ModuleType) -> List[Scenario]:
+    async def call_tool(name: str, arguments: Dict[str, Any]) -> bool:
+        #   Called through the MCP server's tool manager, so that argument validation and result conversion are included
+        await vita_mcp.mcp.call_tool(name, arguments)
+        return True
+
+    argument_dict: Dict[str, Dict[str, Any]] = {
+        "get_ibkr_account_summary": {},
+        "get_wise_account_summary": {},
+        "get_latest_wise_transactions": {"currency_str": "NZD"},
+        "send_discord_message": {"message": "Benchmark message"},
+        "get_financial_snapshot": {"currency_str": "NZD"},
+        "get_output_format_token_stats": {"currency_str": "NZD"},
+    }
+    #   vita-mcp runs inside the benchmark process, so its peak RSS includes the benchmark's own
+    return [Scenario(name=f"tool {name}", target="vita-mcp", request_function=lambda n=name, a=arguments: call_tool(n, a), rss_function=get_peak_rss_mb) for name, arguments in argument_dict.items()]
+
+
+def compare_with_baseline(result_list: List[Dict[str, Any]], baseline_result_list: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    baseline_dict: Dict[str, Dict[str, Any]] = {f"{result["name"]} x{result.get("concurrency")}": result for result in baseline_result_list}
+    regression_list: List[str] = []
+
+    for result in result_list:
+        key: str = f"{result["name"]} x{result.get("concurrency")}"
+        baseline: Dict[str, Any] | None = baseline_dict.get(key)
+        if baseline is None or "error" in result or "error" in baseline:
+            continue
+
+        if result["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+            regression_list.append(f"{key}: throughput {baseline["throughput_rps"]} -> {result["throughput_rps"]} requests/s")
+        #   1 ms of slack so that sub-millisecond latencies do not flag noise as a regression
+        if result["p99_ms"] > baseline["p99_ms"] * (1 + tolerance) + 1:
+            regression_list.append(f"{key}: p99 {baseline["p99_ms"]} -> {result["p99_ms"]} ms")
+
+    return regression_list
+
+
+async def run_benchmark(arguments: argparse.Namespace) -> Dict[str, Any]:
+    upstream_port, vita_api_port = get_free_port(), get_free_port()
+    upstream_url, vita_api_url = f"http://127.0.0.1:{upstream_port}", f"http://127.0.0.1:{vita_api_port}"
+    environment: Dict[str, str] = {
+        **os.environ,
+        "FAKE_LATENCY_MS": str(arguments.latency_ms),
+        "FAKE_LATENCY_JITTER_MS": str(arguments.jitter_ms),
+        "FAKE_ERROR_RATE": str(arguments.error_rate),
+        "FAKE_IBKR_NUMBER_OF_ACCOUNTS": str(arguments.accounts),
+        "FAKE_IBKR_NUMBER_OF_POSITIONS": str(arguments.positions),
+        "FAKE_WISE_TRANSACTIONS_PER_DAY": str(arguments.transactions_per_day),
+        "FAKE_DISCORD_SERVER_NAME": "Vita",
+        "FAKE_DISCORD_CHANNEL_NAME": "notifications",
+        "IBKR_SERVICE_BASE_URL": f"{upstream_url}/ibkr",
+        "DISCORD_SERVER_NAME": "Vita",
+        "DISCORD_CHANNEL_NAME": "notifications",
+        "DISCORD_BOT_TOKEN": "benchmark",
+        "WISE_API_KEY": "benchmark",
+        "WISE_LEDGER_PATH": str(BENCHMARK_DIRECTORY / "benchmark_ledger.sqlite3"),
+        "API_KEY": API_KEY,
+    }
+    if arguments.no_cache:
+        environment.update({"IBKR_ACCOUNTS_CACHE_TTL_SECONDS": "0", "IBKR_POSITIONS_CACHE_TTL_SECONDS": "0", "IBKR_CACHE_MAX_STALE_SECONDS": "0", "WISE_BALANCE_CACHE_TTL_SECONDS": "0", "WISE_LEDGER_SYNC_INTERVAL_SECONDS": "0"})
+
+    for path in BENCHMARK_DIRECTORY.glob("benchmark_ledger.sqlite3*"):
+        path.unlink()
+
+    upstream_process: subprocess.Popen = subprocess.Popen([sys.executable, "-m", "uvicorn", "fake_upstreams:app", "--port", str(upstream_port), "--log-level", "warning"], cwd=BENCHMARK_DIRECTORY, env=environment)
+    vita_api_process: subprocess.Popen = subprocess.Popen([sys.executable, str(BENCHMARK_DIRECTORY / "serve_vita_api.py"), "--upstream-url", upstream_url, "--port", str(vita_api_port)], env=environment)
+    result_list: List[Dict[str, Any]] = []
+
+    try:
+        await wait_until_ready(f"{upstream_url}/health", upstream_process)
+        await wait_until_ready(f"{vita_api_url}/metrics", vita_api_process)
+
+        async with httpx.AsyncClient(base_url=vita_api_url, headers={"Authorization": f"Bearer {API_KEY}"}, limits=httpx.Limits(max_connections=max(arguments.concurrency)), timeout=60.0) as api_client:
+            scenario_list: List[Scenario] = get_vita_api_scenario_list(api_client, vita_api_process.pid)
+
+            if not arguments.skip_mcp:
+                try:
+                    scenario_list.extend(get_vita_mcp_scenario_list(import_vita_mcp(vita_api_url)))
+                except Exception as e:
+                    result_list.append({"name": "vita-mcp", "target": "vita-mcp", "error": repr(e)})
+
+            for scenario in scenario_list:
+                for concurrency in arguments.concurrency:
+                    try:
+                        result_list.append(await run_scenario(scenario, arguments.requests, concurrency))
+                    except Exception as e:
+                        result_list.append({"name": scenario.name, "target": scenario.target, "concurrency": concurrency, "error": repr(e)})
+
+                    print(json.dumps(result_list[-1]), file=sys.stderr)
+    finally:
+        peak_rss_mb_dict: Dict[str, float | None] = {"fake_upstreams": get_peak_rss_mb(upstream_process.pid), "vita-api": get_peak_rss_mb(vita_api_process.pid), "benchmark": get_peak_rss_mb()}
+        for process in [vita_api_process, upstream_process]:
+            process.terminate()
+            process.wait(timeout=10)
+
+    return {
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "configuration": {key: value for key, value in vars(arguments).items() if key not in ["output", "baseline", "save_baseline"]},
+        "peak_rss_mb": peak_rss_mb_dict,
+        "results": result_list,
+    }
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Load tests every vita-api router and every vita-mcp tool against local fake IBKR, Wise and Discord upstreams, and compares the results with a saved baseline.")
+    argument_parser.add_argument("--requests", type=int, default=200, help="Requests per scenario and concurrency level")
+    argument_parser.add_argument("--concurrency", action="append", type=int, help="Concurrency level; can be repeated (default: 1 and 16)")
+    argument_parser.add_argument("--latency-ms", type=float, default=20.0, help="Latency of each fake upstream response")
+    argument_parser.add_argument("--jitter-ms", type=float, default=5.0, help="Uniform jitter added to the upstream latency")
+    argument_parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream requests that fail with 503")
+    argument_parser.add_argument("--accounts", type=int, default=2, help="Number of IBKR accounts")
+    argument_parser.add_argument("--positions", type=int, default=250, help="Number of positions per IBKR account")
+    argument_parser.add_argument("--transactions-per-day", type=int, default=50, help="Number of Wise transactions per day and currency")
+    argument_parser.add_argument("--no-cache", action="store_true", help="Disables vita-api's upstream caches, so that every request reaches the fake upstreams")
+    argument_parser.add_argument("--skip-mcp", action="store_true", help="Only benchmarks vita-api")
+    argument_parser.add_argument("--output", default=str(BENCHMARK_DIRECTORY / "results.json"))
+    argument_parser.add_argument("--baseline", default=str(BENCHMARK_DIRECTORY / "baseline.json"))
+    argument_parser.add_argument("--save-baseline", action="store_true", help="Saves the results as the new baseline")
+    argument_parser.add_argument("--tolerance", type=float, default=0.2, help="Relative change in throughput or p99 latency that is reported as a regression")
+    arguments = argument_parser.parse_args()
+    arguments.concurrency = arguments.concurrency or [1, 16]
+
+    benchmark: Dict[str, Any] = asyncio.run(run_benchmark(arguments))
+    Path(arguments.baseline if arguments.save_baseline else arguments.output).write_text(json.dumps(benchmark, indent=2))
+    print(json.dumps(benchmark["results"], indent=2))
+
+    baseline_path: Path = Path(arguments.baseline)
+    if not arguments.save_baseline and baseline_path.exists():
+        regression_list: List[str] = compare_with_baseline(benchmark["results"], json.loads(baseline_path.read_text())["results"], arguments.tolerance)
+        print("\n".join(["Regressions compared with the baseline:"] + regression_list) if len(regression_list) > 0 else "No regressions compared with the baseline")
+        sys.exit(1 if len(regression_list) > 0 else 0)
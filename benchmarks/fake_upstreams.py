@@ -0,0 +1,157 @@
+import asyncio
+import datetime
+import hashlib
+import os
+import random
+import re
+from typing import List, Dict, Any, Awaitable, Callable
+
+from fastapi import FastAPI, Request, Response, status
+from fastapi.responses import JSONResponse
+
+FAKE_LATENCY_MS: float = float(os.getenv("FAKE_LATENCY_MS", "20"))
+FAKE_LATENCY_JITTER_MS: float = float(os.getenv("FAKE_LATENCY_JITTER_MS", "5"))
+FAKE_ERROR_RATE: float = float(os.getenv("FAKE_ERROR_RATE", "0"))
+FAKE_IBKR_NUMBER_OF_ACCOUNTS: int = int(os.getenv("FAKE_IBKR_NUMBER_OF_ACCOUNTS", "2"))
+FAKE_IBKR_NUMBER_OF_POSITIONS: int = int(os.getenv("FAKE_IBKR_NUMBER_OF_POSITIONS", "250"))
+FAKE_WISE_TRANSACTIONS_PER_DAY: int = int(os.getenv("FAKE_WISE_TRANSACTIONS_PER_DAY", "50"))
+FAKE_DISCORD_SERVER_NAME: str = os.getenv("FAKE_DISCORD_SERVER_NAME", "Vita")
+FAKE_DISCORD_CHANNEL_NAME: str = os.getenv("FAKE_DISCORD_CHANNEL_NAME", "notifications")
+FAKE_DISCORD_BOT_TOKEN: str = os.getenv("DISCORD_BOT_TOKEN", "benchmark")
+FAKE_SEED: int = int(os.getenv("FAKE_SEED", "0"))
+IBKR_POSITIONS_PAGE_SIZE: int = 100
+WISE_CURRENCY_LIST: List[str] = ["NZD", "USD", "AUD"]
+UNDERLYING_LIST: List[str] = ["QQQ", "SPY", "AAPL", "MSFT", "NVDA", "TSLA", "AMZN", "GOOGL"]
+FUTURE_MULTIPLIER_DICT: Dict[str, int] = {"NQ": 20, "ES": 50, "CL": 1000, "GC": 100}
+MONTH_LIST: List[str] = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"]
+app = FastAPI()
+discord_message_count: int = 0
+
+
+def get_position(account_index: int, position_index: int) -> Dict[str, Any]:
+    #   Positions are generated from a seeded generator, so every run of the benchmark sees the same portfolio
+    generator: random.Random = random.Random(f"{FAKE_SEED}-{account_index}-{position_index}")
+    expiry: datetime.date = datetime.date.today() + datetime.timedelta(days=generator.randint(1, 720))
+    month: str = f"{MONTH_LIST[expiry.month - 1]}{expiry.year}"
+    underlying: str = generator.choice(UNDERLYING_LIST)
+    future: str = generator.choice(list(FUTURE_MULTIPLIER_DICT))
+    strike: int = generator.randint(10, 600) * 5
+    right: str = generator.choice(["C", "P"])
+    asset_class, description, multiplier = generator.choice([
+        ("STK", underlying, 1),
+        ("OPT", f"{underlying:<7}{month} {strike} {right} [{underlying:<6}{expiry.strftime("%y%m%d")}{right}{strike * 1000:08d} 100]", 100),
+        ("FUT", f"{future:<9}{month}", FUTURE_MULTIPLIER_DICT[future]),
+        ("FOP", f"{future:<7}{month} {strike * 10} {right}", FUTURE_MULTIPLIER_DICT[future]),
+    ])
+    average_cost: float = round(generator.uniform(1, 500), 2)
+    position: int = generator.choice([-10, -5, -1, 1, 2, 5, 10, 100])
+    market_price: float = round(average_cost * generator.uniform(0.5, 1.5), 2)
+
+    return {
+        "contractDesc": description,
+        "currency": "USD",
+        "position": position,
+        "avgPrice": average_cost,
+        "mktPrice": market_price,
+        "mktValue": round(position * market_price * multiplier, 2),
+        "unrealizedPnl": round(position * (market_price - average_cost) * multiplier, 2),
+        "assetClass": asset_class,
+    }
+
+
+def get_wise_transaction(currency: str, timestamp: datetime.datetime) -> Dict[str, Any]:
+    #   Derived from the timestamp alone, so that overlapping statements return identical transactions, as Wise does
+    generator: random.Random = random.Random(f"{FAKE_SEED}-{currency}-{timestamp.isoformat()}")
+    return {
+        "date": timestamp.isoformat().replace("+00:00", "Z"),
+        "amount": {"value": round(generator.uniform(-200, 100), 2), "currency": currency},
+        "totalFees": {"value": 0, "currency": currency},
+        "details": {"description": f"Card transaction {hashlib.sha1(timestamp.isoformat().encode("utf-8")).hexdigest()[:8]}"},
+        "runningBalance": {"value": round(generator.uniform(0, 10000), 2), "currency": currency},
+    }
+
+
+@app.middleware("http")
+async def simulate_upstream(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+    #   The Discord SDK joins its URLs with repeated slashes, which the real API tolerates
+    request.scope["path"] = re.sub("/{2,}", "/", request.scope["path"])
+    if request.scope["path"] == "/health":
+        return await call_next(request)
+
+    await asyncio.sleep(max(FAKE_LATENCY_MS + random.uniform(-FAKE_LATENCY_JITTER_MS, FAKE_LATENCY_JITTER_MS), 0.0) / 1000)
+    if random.random() < FAKE_ERROR_RATE:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"error": "Simulated upstream error"})
+
+    #   As the real API does, every Discord request must carry the bot token
+    if request.scope["path"].startswith("/discord/") and request.headers.get("Authorization") != f"Bot {FAKE_DISCORD_BOT_TOKEN}":
+        return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"message": "401: Unauthorized", "code": 0})
+
+    return await call_next(request)
+
+
+@app.get("/health")
+async def health() -> Dict[str, int]:
+    return {"discord_message_count": discord_message_count}
+
+
+@app.get("/ibkr/portfolio/accounts/")
+async def get_ibkr_accounts() -> List[Dict[str, Any]]:
+    return [{"id": f"U{1000000 + index}", "accountAlias": f"Account {index}" if index > 0 else None} for index in range(FAKE_IBKR_NUMBER_OF_ACCOUNTS)]
+
+
+@app.get("/ibkr/portfolio/{account_id}/positions/{page_number}")
+async def get_ibkr_positions(account_id: str, page_number: int) -> List[Dict[str, Any]]:
+    account_index: int = int(account_id.removeprefix("U")) - 1000000
+    position_index_range: range = range(page_number * IBKR_POSITIONS_PAGE_SIZE, min((page_number + 1) * IBKR_POSITIONS_PAGE_SIZE, FAKE_IBKR_NUMBER_OF_POSITIONS))
+    return [get_position(account_index, position_index) for position_index in position_index_range]
+
+
+@app.get("/wise/v2/profiles")
+async def get_wise_profiles() -> List[Dict[str, Any]]:
+    return [{"id": 1, "type": "PERSONAL", "fullName": "Benchmark User"}]
+
+
+@app.get("/wise/v4/profiles/{profile_id}/balances")
+async def get_wise_balances(profile_id: int, types: str = "STANDARD,SAVINGS") -> List[Dict[str, Any]]:
+    balance_list: List[Dict[str, Any]] = [{"id": index, "currency": currency, "type": "STANDARD", "name": None, "totalWorth": {"value": 1000.0 * (index + 1), "currency": currency}} for index, currency in enumerate(WISE_CURRENCY_LIST)]
+    return [balance for balance in balance_list if balance["type"] in types.split(",")]
+
+
+@app.get("/wise/v1/profiles/{profile_id}/balance-statements/{balance_id}/statement.json")
+async def get_wise_statement(profile_id: int, balance_id: int, currency: str, intervalStart: datetime.datetime, intervalEnd: datetime.datetime) -> Dict[str, Any]:
+    interval_seconds: float = 86400 / FAKE_WISE_TRANSACTIONS_PER_DAY
+    timestamp_list: List[datetime.datetime] = []
+    timestamp: float = (intervalStart.timestamp() // interval_seconds + 1) * interval_seconds
+
+    while timestamp <= intervalEnd.timestamp():
+        timestamp_list.append(datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc))
+        timestamp += interval_seconds
+
+    return {"transactions": [get_wise_transaction(currency, timestamp) for timestamp in reversed(timestamp_list)]}
+
+
+@app.get("/discord/api/v10/users/@me")
+async def get_discord_bot() -> Dict[str, Any]:
+    return {"id": "1", "username": "vita", "global_name": "Vita"}
+
+
+@app.get("/discord/api/v10/users/@me/guilds")
+async def get_discord_servers() -> List[Dict[str, Any]]:
+    return [{"id": "2", "name": FAKE_DISCORD_SERVER_NAME}]
+
+
+@app.get("/discord/api/v10/guilds/{server_id}/channels")
+async def get_discord_channels(server_id: str) -> List[Dict[str, Any]]:
+    return [{"id": "3", "name": FAKE_DISCORD_CHANNEL_NAME, "type": 0}]
+
+
+@app.get("/discord/api/v10/guilds/{server_id}/roles")
+async def get_discord_roles(server_id: str) -> List[Dict[str, Any]]:
+    return [{"id": "4", "name": "@everyone", "permissions": "0"}]
+
+
+@app.post("/discord/api/v10/channels/{channel_id}/messages")
+async def send_discord_message(channel_id: str) -> Dict[str, Any]:
+    global discord_message_count
+    discord_message_count += 1
+    return {"id": str(discord_message_count), "channel_id": channel_id}
@@ -0,0 +1,33 @@
+import argparse
+import os
+import sys
+from pathlib import Path
+from types import ModuleType
+
+VITA_API_DIRECTORY: Path = Path(__file__).resolve().parent.parent / "vita-api"
+
+
+def redirect_constants(constants: ModuleType, url: str, fake_url: str) -> None:
+    for name, value in list(vars(constants).items()):
+        if isinstance(value, str) and value.startswith(url):
+            setattr(constants, name, fake_url + value.removeprefix(url))
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Runs vita-api with its Wise and Discord upstreams redirected to the fake upstreams. The IBKR gateway is redirected with IBKR_SERVICE_BASE_URL.")
+    argument_parser.add_argument("--upstream-url", required=True)
+    argument_parser.add_argument("--port", type=int, default=8000)
+    arguments = argument_parser.parse_args()
+
+    os.chdir(VITA_API_DIRECTORY)
+    sys.path.insert(0, str(VITA_API_DIRECTORY))
+    #   The Wise and Discord base URLs are module constants of the SDK, so they are rewritten before vita-api imports them
+    from sirius.wise import constants as wise_constants
+    from sirius.communication.discord import constants as discord_constants
+
+    redirect_constants(wise_constants, wise_constants.URL, f"{arguments.upstream_url}/wise")
+    redirect_constants(discord_constants, discord_constants.BASE_URL, f"{arguments.upstream_url}/discord/api/")
+
+    import uvicorn
+
+    uvicorn.run("main:app", host="127.0.0.1", port=arguments.port, log_level="warning")
@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List, Dict, Any
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+from tools.transport import TransportType, DetectionTransport, InProcessDetectionTransport, create_detection_transport
+
+
+async def benchmark_transport(transport_type: TransportType, frame: np.ndarray, number_of_runs: int) -> Dict[str, Any]:
+    detection_transport: DetectionTransport | None = None
+    latency_list: List[float] = []
+
+    try:
+        detection_transport = create_detection_transport(transport_type)
+        await detection_transport.start()
+        object_list: List[str] = [detected_object.description for detected_object in await detection_transport.detect(frame, "benchmark")]
+
+        for index in range(number_of_runs):
+            #   The same frame is sent on every run, so it must not be served from Apollo's near-duplicate frame cache
+            if isinstance(detection_transport, InProcessDetectionTransport):
+                detection_transport.media.frame_cache.clear()
+
+            started_at: float = time.perf_counter()
+            await detection_transport.detect(frame, "benchmark")
+            latency_list.append((time.perf_counter() - started_at) * 1000)
+            if detection_transport.last_cache_status != "MISS":
+                raise RuntimeError(f"Run {index} was not an inference (X-Cache: {detection_transport.last_cache_status}), start Apollo with APOLLO_FRAME_CACHE_SIZE=0")
+    except Exception as e:
+        return {"transport": transport_type.value, "error": repr(e)}
+    finally:
+        if detection_transport is not None:
+            await detection_transport.aclose()
+
+    latency_list.sort()
+    return {"transport": transport_type.value, "objects": object_list, "median_ms": round(statistics.median(latency_list), 2), "p90_ms": round(latency_list[int(0.9 * (len(latency_list) - 1))], 2)}
+
+
+async def main(image_path: str, transport_type_list: List[TransportType], number_of_runs: int) -> None:
+    frame: np.ndarray = cv2.imread(image_path)
+    print(json.dumps([await benchmark_transport(transport_type, frame, number_of_runs) for transport_type in transport_type_list], indent=2))
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Compares the per-frame detection latency of each Chronos to Apollo transport. Transports that are not reachable are reported with their error. Apollo must run with APOLLO_FRAME_CACHE_SIZE=0 for the HTTP and UNIX_SOCKET transports.")
+    argument_parser.add_argument("--image", default="../apollo/test/person.jpg")
+    argument_parser.add_argument("--transport", action="append", type=TransportType, choices=list(TransportType))
+    argument_parser.add_argument("--runs", type=int, default=20)
+    arguments = argument_parser.parse_args()
+
+    asyncio.run(main(arguments.image, arguments.transport or list(TransportType), arguments.runs))
@@ -1,33 +1,49 @@
 import asyncio
-import base64
+import datetime
+import logging
 from contextlib import asynccontextmanager
 from enum import Enum
 from typing import List, AsyncGenerator, Any, Dict
 
-import cv2
-from apscheduler.events import EVENT_JOB_EXECUTED, JobExecutionEvent
+import httpx
+import numpy as np
+from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_SUBMITTED, JobExecutionEvent, JobSubmissionEvent
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sirius import common
-from sirius.http_requests import AsyncHTTPSession, HTTPResponse
 from starlette.middleware.cors import CORSMiddleware
 from starlette.responses import Response
 
+from tools.alerts import AlertTracker, send_alert
+from tools.events import DetectionEvent, EventNotFoundException, get_event_store, close_event_store
+from tools.camera import get_frame_grabber, evict_idle_frame_grabbers, stop_all_frame_grabbers
+from tools.clients import ServiceClients, get_service_clients, close_service_clients
+from tools.metrics import Stage, AlertOutcome, ALERTS, SCHEDULER_LAG_SECONDS, JOB_COMPLETION_SECONDS, measure, get_metrics_response
+from tools.motion import MotionDetector, MotionStatistics, get_motion_detector, get_all_motion_statistics
+from tools.scheduling import CameraScheduler, CameraStatistics, TickShedException, load_camera_configuration_list
+from tools.transport import DetectionTransport, DetectedObject, get_detection_transport, close_detection_transport, encode_frame
+
+FIRST_FRAME_TIMEOUT_SECONDS: float = 10.0
+MAX_FRAME_AGE_SECONDS: float = 10.0
+logger = logging.getLogger(__name__)
+
 
 class Job(Enum):
-    CHECK_BACKYARD_CAMERA = "CHECK_BACKYARD_CAMERA"
-    CHECK_LEFT_CORRIDOR_CAMERA = "CHECK_LEFT_CORRIDOR_CAMERA"
-    CHECK_GARAGE_CAMERA = "CHECK_GARAGE_CAMERA"
-    CHECK_FRONT_CAMERA = "CHECK_FRONT_CAMERA"
+    SYNC_APOLLO_SOURCES = "SYNC_APOLLO_SOURCES"
+    EVICT_IDLE_FRAME_GRABBERS = "EVICT_IDLE_FRAME_GRABBERS"
+
+
+def log_job_lag(event: JobSubmissionEvent) -> None:
+    time_now: datetime.datetime = datetime.datetime.now(datetime.timezone.utc)
+    for scheduled_run_time in event.scheduled_run_times:
+        SCHEDULER_LAG_SECONDS.labels(event.job_id).observe(max((time_now - scheduled_run_time).total_seconds(), 0.0))
 
 
 def log_job_duration(event: JobExecutionEvent) -> None:
-    # time_now = datetime.datetime.now(datetime.timezone.utc).astimezone(event.scheduled_run_time.tzinfo)
-    # job_runtime = (time_now - event.scheduled_run_time).total_seconds() * 1000
-    # print(f"Job '{event.job_id}' took {job_runtime:.2f}ms to complete.")
-    pass
+    time_now: datetime.datetime = datetime.datetime.now(datetime.timezone.utc)
+    JOB_COMPLETION_SECONDS.labels(event.job_id).observe(max((time_now - event.scheduled_run_time).total_seconds(), 0.0))
 
 
 def verify_token(token: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False))) -> None:
@@ -39,20 +55,36 @@ def verify_token(token: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_e
 
 
 scheduler = AsyncIOScheduler()
+camera_scheduler: CameraScheduler = CameraScheduler(scheduler, load_camera_configuration_list())
+alert_tracker: AlertTracker = AlertTracker()
+scheduler.add_listener(log_job_lag, EVENT_JOB_SUBMITTED)
 scheduler.add_listener(log_job_duration, EVENT_JOB_EXECUTED)
 
 
+async def sync_apollo_sources() -> None:
+    for camera in [camera for camera in camera_scheduler.camera_dict.values() if camera.is_apollo_source]:
+        await get_detection_transport().register_source(camera)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, Any]:
-    # scheduler.add_job(analyze_camera, IntervalTrigger(seconds=5), args=[common.get_environmental_secret("RTSP_URL_FRONT_CAMERA")], max_instances=1, id=Job.CHECK_FRONT_CAMERA.value)
-    # scheduler.add_job(analyze_camera, IntervalTrigger(seconds=5), args=[common.get_environmental_secret("RTSP_URL_BACKYARD_CAMERA")], max_instances=3, id=Job.CHECK_BACKYARD_CAMERA.value)
-    scheduler.add_job(analyze_camera, IntervalTrigger(seconds=5), args=[common.get_environmental_secret("RTSP_URL_GARAGE_CAMERA")], max_instances=1, id=Job.CHECK_GARAGE_CAMERA.value)
-    # scheduler.add_job(analyze_camera, IntervalTrigger(seconds=5), args=[common.get_environmental_secret("RTSP_URL_LEFT_CORRIDOR_CAMERA")], max_instances=3, id=Job.CHECK_LEFT_CORRIDOR_CAMERA.value)
+    get_service_clients()
+    await get_detection_transport().start()
+    for url in camera_scheduler.schedule_all(analyze_camera):
+        get_frame_grabber(url)
+
+    scheduler.add_job(sync_apollo_sources, IntervalTrigger(minutes=5), max_instances=1, id=Job.SYNC_APOLLO_SOURCES.value, next_run_time=datetime.datetime.now())
+    scheduler.add_job(evict_idle_frame_grabbers, IntervalTrigger(minutes=1), max_instances=1, id=Job.EVICT_IDLE_FRAME_GRABBERS.value)
+
     scheduler.start()
 
     yield
 
     scheduler.shutdown()
+    stop_all_frame_grabbers()
+    await close_detection_transport()
+    close_event_store()
+    await close_service_clients()
 
 
 chronos_app = FastAPI(lifespan=lifespan)
@@ -70,35 +102,80 @@ async def ping() -> Response:
     return Response(status_code=status.HTTP_200_OK)
 
 
-@chronos_app.post("/analyze_camera", summary="Looks are the camera that's from the RTSP URL. A message will be sent on Discord on anything suspicious.")
-async def analyze_camera(video_stream_address: str) -> Response:
-    global scheduler
+@chronos_app.get("/metrics", summary="Returns the timing histograms of each processing stage and the scheduler lag in the Prometheus text format.")
+async def metrics() -> Response:
+    return get_metrics_response()
 
-    def get_latest_camera_frame(url: str) -> bytes | None:
-        successful_frame_read, frame = cv2.VideoCapture(url).read()
-        if not successful_frame_read:
-            return None
 
-        successful_encoding, encoded_frame = cv2.imencode('.jpg', frame)
-        return encoded_frame.tobytes()
+@chronos_app.get("/motion_statistics", summary="Returns the motion detection statistics of each camera, including how many frames were forwarded for object detection.")
+async def motion_statistics() -> Dict[str, MotionStatistics]:
+    return get_all_motion_statistics()
+
+
+@chronos_app.get("/camera_statistics", summary="Returns the scheduling statistics of each camera, including its current interval and the number of shed ticks.")
+async def camera_statistics() -> Dict[str, CameraStatistics]:
+    return camera_scheduler.get_statistics()
+
+
+@chronos_app.get("/events", summary="Returns the stored detection events, newest first, filtered by time range, camera and object class.")
+async def events(start_time: datetime.datetime | None = None, end_time: datetime.datetime | None = None, camera_name: str | None = None, object_class: str | None = None, limit: int = 100) -> List[DetectionEvent]:
+    return await asyncio.to_thread(get_event_store().query, start_time.timestamp() if start_time is not None else None, end_time.timestamp() if end_time is not None else None, camera_name, object_class, limit)
 
-    latest_frame: bytes = await asyncio.to_thread(get_latest_camera_frame, video_stream_address)
-    if not latest_frame:
-        return Response(status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
 
-    apollo_url: str = f"{common.get_environmental_secret("APOLLO_BASE_URL")}/media/object_detection"
-    response: HTTPResponse = await AsyncHTTPSession(apollo_url).post(apollo_url, files={'image': ('image.jpeg', latest_frame, 'image/jpeg')}, headers={"Authorization": f"Bearer {common.get_environmental_secret("API_KEY")}"})
-    object_list: List[str] = [data["description"] for data in response.data]
+@chronos_app.get("/events/{event_id}/thumbnail", summary="Returns the JPEG thumbnail of the frame in which the detection event occurred.")
+async def event_thumbnail(event_id: str) -> Response:
+    try:
+        thumbnail: bytes = await asyncio.to_thread(get_event_store().get_thumbnail, event_id)
+    except EventNotFoundException as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
-    for detected_object in object_list:
-        discord_url: str = f"{common.get_environmental_secret("VITA_API_BASE_URL")}/discord/send_message"
-        data: Dict[str, Any] = {"message": f"{str(detected_object).title()} detected in the front camera.",
-                                "media_list": [{"media_base64": base64.b64encode(latest_frame).decode("utf-8"), "file_extension": "png"}]}
+    return Response(content=thumbnail, media_type="image/jpeg")
+
+
+@chronos_app.post("/analyze_camera", summary="Looks are the camera that's from the RTSP URL. A message will be sent on Discord on anything suspicious.")
+async def analyze_camera(video_stream_address: str, camera_name: str = "default", motion_threshold: float | None = None) -> Response:
+    frame: np.ndarray | None = await asyncio.to_thread(get_frame_grabber(video_stream_address).get_latest_frame, FIRST_FRAME_TIMEOUT_SECONDS, MAX_FRAME_AGE_SECONDS)
+    if frame is None:
+        return Response(status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
 
-        await AsyncHTTPSession(discord_url).post(discord_url, data=data, headers={"Authorization": f"Bearer {common.get_environmental_secret("API_KEY")}"})
-        scheduler.pause_job(Job.CHECK_GARAGE_CAMERA.value)
-        await asyncio.sleep(60)
-        scheduler.resume_job(Job.CHECK_GARAGE_CAMERA.value)
+    motion_detector: MotionDetector = get_motion_detector(camera_name, motion_threshold)
+    with measure(Stage.MOTION_DETECTION):
+        is_motion_detected: bool = await asyncio.to_thread(motion_detector.is_motion_detected, frame)
+
+    if not is_motion_detected:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+    detection_transport: DetectionTransport = get_detection_transport()
+    try:
+        async with camera_scheduler.apollo_request_slot(camera_name):
+            with measure(Stage.APOLLO_INFERENCE):
+                detected_object_list: List[DetectedObject] = await detection_transport.detect(frame, camera_name)
+    except TickShedException:
+        return Response(status_code=status.HTTP_429_TOO_MANY_REQUESTS)
+
+    if len(detected_object_list) > 0:
+        with measure(Stage.EVENT_STORE):
+            await asyncio.to_thread(get_event_store().append, camera_name, detected_object_list, frame)
+
+    object_list: List[str] = [detected_object.description for detected_object in detected_object_list]
+    alert_message: str | None = alert_tracker.get_alert_message(camera_name, object_list)
+
+    if alert_message is not None:
+        service_clients: ServiceClients = get_service_clients()
+        latest_frame: bytes = await asyncio.to_thread(encode_frame, frame)
+        try:
+            with measure(Stage.DISCORD_SEND):
+                is_alert_sent: bool = await send_alert(service_clients.vita_api, alert_message, latest_frame)
+            if not is_alert_sent:
+                logger.warning(f"Alert for camera '{camera_name}' was not delivered to Discord in time, so it is retried on the next tick")
+        except httpx.HTTPError:
+            is_alert_sent = False
+            logger.exception(f"Alert for camera '{camera_name}' could not be sent to Discord")
+
+        if is_alert_sent:
+            alert_tracker.record_alert(camera_name, object_list)
+        else:
+            ALERTS.labels(AlertOutcome.FAILED.value).inc()
 
     return Response(status_code=status.HTTP_200_OK)
 
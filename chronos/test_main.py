@@ -2,7 +2,25 @@ from dotenv import load_dotenv
 
 load_dotenv()
 from main import chronos_app
+from tools import alerts, camera, scheduling
+from tools.alerts import AlertTracker, send_alert
+from tools.camera import FrameGrabber
+from tools.events import EventStore
+from tools.motion import get_motion_detector
+from tools.scheduling import CameraScheduler, CameraConfiguration, TickShedException
+from tools.transport import DetectedObject
 
+import asyncio
+import threading
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import httpx
+import numpy as np
+import pytest
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES, JobEvent
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from fastapi.testclient import TestClient
 
 client = TestClient(chronos_app)
@@ -10,4 +28,253 @@ client = TestClient(chronos_app)
 
 def test_ping() -> None:
     response = client.get("/ping")
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+
+def test_motion_statistics() -> None:
+    motion_detector = get_motion_detector("motion_statistics_camera", threshold=0.01)
+    static_frame = np.zeros((120, 160, 3), dtype=np.uint8)
+    motion_frame = static_frame.copy()
+    motion_frame[30:90, 40:120] = 255
+    #   The first frame only initialises the background, so it is always forwarded
+    assert motion_detector.is_motion_detected(static_frame)
+    assert not motion_detector.is_motion_detected(static_frame)
+    assert motion_detector.is_motion_detected(motion_frame)
+
+    response = client.get("/motion_statistics")
+    statistics = response.json()["motion_statistics_camera"]
+    assert response.status_code == 200
+    assert statistics["threshold"] == 0.01 and statistics["frames_analyzed"] == 3 and statistics["frames_forwarded"] == 2
+    assert statistics["forward_rate"] == pytest.approx(2 / 3) and statistics["max_motion_score"] == 1.0
+
+
+def test_camera_statistics() -> None:
+    response = client.get("/camera_statistics")
+    assert response.status_code == 200
+
+
+def test_metrics() -> None:
+    response = client.get("/metrics")
+    assert response.status_code == 200 and "chronos_scheduler_lag_seconds" in response.text
+
+
+def test_event_store(tmp_path: Path) -> None:
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    event_store = EventStore(str(tmp_path), segment_size_bytes=4096, max_size_bytes=64 * 1024)
+    for index in range(100):
+        event_store.append("garage" if index % 2 == 0 else "front", [DetectedObject(description="person" if index % 3 == 0 else "car", confidence=0.9, xyxy=[0, 0, 10, 10])], frame, timestamp=1_000_000 + index * 5)
+
+    event_list = event_store.query(start_time=1_000_000 + 90 * 5, camera_name="garage", object_class="person")
+    assert [event.timestamp.timestamp() for event in event_list] == [1_000_000 + 96 * 5, 1_000_000 + 90 * 5]
+    assert event_store.get_thumbnail(event_list[0].id)[:2] == b"\xff\xd8"
+    assert event_store.get_size() <= 64 * 1024 and len(event_store.query(end_time=1_000_000)) == 0
+
+    event_store.close()
+    assert [event.id for event in EventStore(str(tmp_path)).query(limit=5)] == [event.id for event in event_store.query(limit=5)]
+
+
+def test_alert_cooldown() -> None:
+    time_now = [1000.0]
+    alert_tracker = AlertTracker(cooldown_seconds=60, clock=lambda: time_now[0])
+    assert alert_tracker.get_alert_message("front_door", []) is None
+    assert alert_tracker.get_alert_message("front_door", ["person", "car", "person"]) == "2 x Person and Car detected in the front door camera."
+
+    #   Nothing is muted until the alert is recorded as sent
+    assert alert_tracker.get_alert_message("front_door", ["person"]) == "Person detected in the front door camera."
+    alert_tracker.record_alert("front_door", ["person", "car", "person"])
+
+    time_now[0] += 30
+    assert alert_tracker.get_alert_message("front_door", ["person", "car"]) is None
+    assert alert_tracker.get_alert_message("garage", ["person"]) == "Person detected in the garage camera."
+    #   A new class in the same camera alerts again and lists every object in the frame
+    assert alert_tracker.get_alert_message("front_door", ["person", "dog"]) == "Person and Dog detected in the front door camera."
+    alert_tracker.record_alert("front_door", ["person", "dog"])
+
+    time_now[0] += 45
+    assert alert_tracker.get_alert_message("front_door", ["person", "dog"]) is None
+    assert alert_tracker.get_alert_message("front_door", ["car"]) == "Car detected in the front door camera."
+    time_now[0] += 15
+    assert alert_tracker.get_alert_message("front_door", ["person"]) == "Person detected in the front door camera."
+
+
+def test_alert_is_sent_once_delivered(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(alerts, "ALERT_DELIVERY_POLL_INTERVAL_SECONDS", 0.0)
+
+    def get_vita_api(status_list: List[str]) -> httpx.AsyncClient:
+        def handle_request(request: httpx.Request) -> httpx.Response:
+            message_status = status_list.pop(0) if len(status_list) > 1 else status_list[0]
+            return httpx.Response(202 if request.method == "POST" else 200, json={"id": "1", "status": message_status})
+
+        return httpx.AsyncClient(base_url="http://vita-api", transport=httpx.MockTransport(handle_request))
+
+    #   The message is only queued by vita-api, so its status is polled until the outbox has sent it or given up on it
+    assert asyncio.run(send_alert(get_vita_api(["QUEUED", "QUEUED", "SENT"]), "Person detected", b"frame"))
+    assert not asyncio.run(send_alert(get_vita_api(["QUEUED", "FAILED"]), "Person detected", b"frame"))
+    assert not asyncio.run(send_alert(get_vita_api(["QUEUED"]), "Person detected", b"frame", timeout_seconds=0.05))
+
+
+class FakeClock:
+    time_now: float = 1000.0
+
+    def monotonic(self) -> float:
+        return self.time_now
+
+
+def get_camera_scheduler() -> CameraScheduler:
+    camera_scheduler = CameraScheduler(AsyncIOScheduler(), [
+        CameraConfiguration(name="front", url="rtsp://front", interval_seconds=5.0),
+        CameraConfiguration(name="garage", url="rtsp://garage", interval_seconds=0.2, priority=1),
+        CameraConfiguration(name="disabled", url="rtsp://disabled", is_enabled=False),
+    ], max_in_flight_apollo_requests=1)
+    camera_scheduler.schedule_all(lambda *args: None)
+    return camera_scheduler
+
+
+def test_camera_scheduler_sheds_ticks() -> None:
+    camera_scheduler = get_camera_scheduler()
+
+    async def hold_slot(camera_name: str, release_event: asyncio.Event) -> None:
+        async with camera_scheduler.apollo_request_slot(camera_name):
+            await release_event.wait()
+
+    async def request_slot(camera_name: str) -> float:
+        started_at = time.monotonic()
+        async with camera_scheduler.apollo_request_slot(camera_name):
+            pass
+        return time.monotonic() - started_at
+
+    async def run() -> None:
+        release_event = asyncio.Event()
+        hold_task = asyncio.create_task(hold_slot("front", release_event))
+        await asyncio.sleep(0)
+
+        #   A regular camera sheds its tick immediately, while a priority camera waits up to one interval for the slot
+        started_at = time.monotonic()
+        with pytest.raises(TickShedException):
+            await request_slot("front")
+        assert time.monotonic() - started_at < 0.1
+        with pytest.raises(TickShedException):
+            await request_slot("garage")
+        assert time.monotonic() - started_at >= 0.2
+
+        asyncio.get_running_loop().call_later(0.05, release_event.set)
+        assert await request_slot("garage") < 0.2
+        await hold_task
+
+    asyncio.run(run())
+    statistics_dict = camera_scheduler.get_statistics()
+    assert set(statistics_dict) == {"front", "garage"}
+    assert (statistics_dict["front"].apollo_requests, statistics_dict["front"].shed_ticks) == (1, 1)
+    assert (statistics_dict["garage"].apollo_requests, statistics_dict["garage"].shed_ticks) == (1, 1)
+
+    camera_scheduler._on_tick_skipped(JobEvent(EVENT_JOB_MISSED, "front", None))
+    camera_scheduler._on_tick_skipped(JobEvent(EVENT_JOB_MAX_INSTANCES, "front", None))
+    camera_scheduler._on_tick_skipped(JobEvent(EVENT_JOB_MISSED, "unknown", None))
+    assert statistics_dict["front"].missed_ticks == 2 and statistics_dict["garage"].missed_ticks == 0
+
+
+def test_camera_scheduler_adapts_the_interval(monkeypatch: pytest.MonkeyPatch) -> None:
+    fake_clock = FakeClock()
+    monkeypatch.setattr(scheduling, "time", fake_clock)
+    monkeypatch.setattr(scheduling, "APOLLO_TARGET_LATENCY_SECONDS", 1.0)
+    monkeypatch.setattr(scheduling, "MAX_INTERVAL_MULTIPLIER", 6.0)
+    camera_scheduler = get_camera_scheduler()
+
+    async def request_slot(latency_seconds: float) -> None:
+        async with camera_scheduler.apollo_request_slot("front"):
+            fake_clock.time_now += latency_seconds
+
+    def get_interval_seconds(camera_name: str) -> float:
+        return camera_scheduler.scheduler.get_job(camera_name).trigger.interval.total_seconds()
+
+    #   A latency within the target keeps the configured intervals
+    asyncio.run(request_slot(0.5))
+    assert (get_interval_seconds("front"), get_interval_seconds("garage")) == (5.0, 0.2)
+
+    #   A slow Apollo stretches every camera's interval by the smoothed latency over the target, up to the maximum multiplier
+    asyncio.run(request_slot(15.5))
+    assert camera_scheduler.apollo_latency_seconds == pytest.approx(3.5)
+    assert get_interval_seconds("front") == pytest.approx(17.5) and get_interval_seconds("garage") == pytest.approx(0.7)
+    for _ in range(10):
+        asyncio.run(request_slot(100))
+    assert get_interval_seconds("front") == pytest.approx(30) and camera_scheduler.get_statistics()["garage"].interval_seconds == pytest.approx(1.2)
+
+    for _ in range(50):
+        asyncio.run(request_slot(0.1))
+    assert get_interval_seconds("front") == pytest.approx(5.0, rel=0.1)
+
+
+class FakeVideoCapture:
+    #   The first two connections fail, the third one delivers two frames before the stream drops and the later ones fail again
+    connection_count: int = 0
+    frames_left: int
+
+    def __init__(self, url: str) -> None:
+        FakeVideoCapture.connection_count += 1
+        self.frames_left = 2 if FakeVideoCapture.connection_count == 3 else 0
+
+    def set(self, property_id: int, value: float) -> bool:
+        return True
+
+    def isOpened(self) -> bool:
+        return self.frames_left > 0
+
+    def grab(self) -> bool:
+        self.frames_left -= 1
+        return self.frames_left >= 0
+
+    def retrieve(self) -> Tuple[bool, np.ndarray]:
+        return True, np.full((4, 4, 3), FakeVideoCapture.connection_count, dtype=np.uint8)
+
+    def release(self) -> None:
+        pass
+
+
+class RecordingEvent(threading.Event):
+    timeout_list: List[float]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.timeout_list = []
+
+    def wait(self, timeout: float | None = None) -> bool:
+        if timeout is not None:
+            self.timeout_list.append(timeout)
+        return super().wait(timeout)
+
+
+def test_frame_grabber_reconnects_with_backoff(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(camera.cv2, "VideoCapture", FakeVideoCapture)
+    monkeypatch.setattr(camera, "RECONNECT_MIN_BACKOFF_SECONDS", 0.01)
+    monkeypatch.setattr(camera, "RECONNECT_MAX_BACKOFF_SECONDS", 0.04)
+    monkeypatch.setattr(camera, "DECODE_INTERVAL_SECONDS", 0.0)
+    monkeypatch.setattr(FakeVideoCapture, "connection_count", 0)
+
+    frame_grabber = FrameGrabber("rtsp://camera")
+    stop_event = RecordingEvent()
+    frame_grabber._stop_event = stop_event
+    frame_grabber.start()
+    frame = frame_grabber.get_latest_frame(timeout_seconds=5)
+    deadline = time.monotonic() + 5
+    while len(stop_event.timeout_list) < 6 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    frame_grabber.stop()
+
+    assert frame is not None and frame[0, 0, 0] == 3 and frame_grabber.frames_decoded == 2
+    #   The backoff doubles up to the maximum while connecting fails, and is reset once a frame is decoded
+    assert stop_event.timeout_list[:6] == [0.01, 0.02, 0.01, 0.02, 0.04, 0.04]
+    assert frame_grabber.reconnect_count >= 6 and not frame_grabber.is_connected
+
+
+def test_idle_frame_grabbers_are_evicted(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(camera.cv2, "VideoCapture", FakeVideoCapture)
+    monkeypatch.setattr(camera, "RECONNECT_MIN_BACKOFF_SECONDS", 0.01)
+
+    idle_frame_grabber = camera.get_frame_grabber("rtsp://idle")
+    active_frame_grabber = camera.get_frame_grabber("rtsp://active")
+    idle_frame_grabber.last_used_at -= 120
+    assert camera.evict_idle_frame_grabbers(idle_timeout_seconds=60) == 1
+
+    assert idle_frame_grabber._thread is not None and not idle_frame_grabber._thread.is_alive()
+    assert camera.get_frame_grabber("rtsp://active") is active_frame_grabber and camera.get_frame_grabber("rtsp://idle") is not idle_frame_grabber
+    camera.stop_all_frame_grabbers()
@@ -0,0 +1,64 @@
+import asyncio
+import os
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Tuple
+
+import httpx
+
+from tools.metrics import AlertOutcome, ALERTS
+
+ALERT_COOLDOWN_SECONDS: float = float(os.getenv("ALERT_COOLDOWN_SECONDS", "60"))
+ALERT_DELIVERY_TIMEOUT_SECONDS: float = float(os.getenv("ALERT_DELIVERY_TIMEOUT_SECONDS", "30"))
+ALERT_DELIVERY_POLL_INTERVAL_SECONDS: float = float(os.getenv("ALERT_DELIVERY_POLL_INTERVAL_SECONDS", "0.5"))
+
+
+class AlertTracker:
+    cooldown_seconds: float
+    _clock: Callable[[], float]
+    _last_alert_time_dict: Dict[Tuple[str, str], float]
+
+    def __init__(self, cooldown_seconds: float = ALERT_COOLDOWN_SECONDS, clock: Callable[[], float] = time.monotonic) -> None:
+        self.cooldown_seconds = cooldown_seconds
+        self._clock = clock
+        self._last_alert_time_dict = {}
+
+    def get_alert_message(self, camera_name: str, object_list: List[str]) -> str | None:
+        object_counter: Counter[str] = Counter(object_list)
+        if len(object_counter) == 0:
+            return None
+
+        time_now: float = self._clock()
+        is_new_object_detected: bool = any(time_now - self._last_alert_time_dict.get((camera_name, object_name), float("-inf")) >= self.cooldown_seconds for object_name in object_counter)
+
+        if not is_new_object_detected:
+            ALERTS.labels(AlertOutcome.SUPPRESSED.value).inc()
+            return None
+
+        object_description_list: List[str] = [object_name.title() if count == 1 else f"{count} x {object_name.title()}" for object_name, count in object_counter.most_common()]
+        object_description: str = object_description_list[0] if len(object_description_list) == 1 else f"{", ".join(object_description_list[:-1])} and {object_description_list[-1]}"
+        return f"{object_description} detected in the {camera_name.replace("_", " ").lower()} camera."
+
+    def record_alert(self, camera_name: str, object_list: List[str]) -> None:
+        #   Only called once the alert is delivered, so that a failed send is retried on the next tick instead of being muted for the cooldown
+        time_now: float = self._clock()
+        for object_name in set(object_list):
+            self._last_alert_time_dict[(camera_name, object_name)] = time_now
+
+        ALERTS.labels(AlertOutcome.SENT.value).inc()
+
+
+async def send_alert(vita_api: httpx.AsyncClient, message: str, frame: bytes, timeout_seconds: float = ALERT_DELIVERY_TIMEOUT_SECONDS) -> bool:
+    response: httpx.Response = await vita_api.post("/discord/send_message/multipart", data={"message": message}, files=[("media_list", ("frame.jpg", frame, "image/jpeg"))])
+    response.raise_for_status()
+    message_data: Dict[str, Any] = response.json()
+    deadline: float = time.monotonic() + timeout_seconds
+
+    #   vita-api only queues the message, so the alert is only delivered once its outbox reports it as sent
+    while message_data["status"] == "QUEUED" and time.monotonic() < deadline:
+        await asyncio.sleep(ALERT_DELIVERY_POLL_INTERVAL_SECONDS)
+        response = await vita_api.get(f"/discord/messages/{message_data["id"]}")
+        response.raise_for_status()
+        message_data = response.json()
+
+    return message_data["status"] == "SENT"
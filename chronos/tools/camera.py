@@ -0,0 +1,130 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+from tools.metrics import Stage, measure
+
+RECONNECT_MIN_BACKOFF_SECONDS: float = float(os.getenv("RTSP_RECONNECT_MIN_BACKOFF_SECONDS", "1"))
+RECONNECT_MAX_BACKOFF_SECONDS: float = float(os.getenv("RTSP_RECONNECT_MAX_BACKOFF_SECONDS", "60"))
+DECODE_INTERVAL_SECONDS: float = float(os.getenv("RTSP_DECODE_INTERVAL_SECONDS", "0.5"))
+IDLE_TIMEOUT_SECONDS: float = float(os.getenv("RTSP_IDLE_TIMEOUT_SECONDS", "300"))
+logger = logging.getLogger(__name__)
+_frame_grabber_dict: Dict[str, "FrameGrabber"] = {}
+_frame_grabber_dict_lock: threading.Lock = threading.Lock()
+
+
+class FrameGrabber:
+    url: str
+    frames_grabbed: int = 0
+    frames_decoded: int = 0
+    reconnect_count: int = 0
+    is_connected: bool = False
+    last_used_at: float
+    _frame: np.ndarray | None = None
+    _frame_timestamp: float = 0.0
+    _frame_lock: threading.Lock
+    _frame_event: threading.Event
+    _stop_event: threading.Event
+    _thread: threading.Thread | None = None
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.last_used_at = time.monotonic()
+        self._frame_lock = threading.Lock()
+        self._frame_event = threading.Event()
+        self._stop_event = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="frame-grabber", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def get_latest_frame(self, timeout_seconds: float = 0.0, max_age_seconds: float | None = None) -> np.ndarray | None:
+        self.last_used_at = time.monotonic()
+        if not self._frame_event.wait(timeout_seconds):
+            return None
+
+        with self._frame_lock:
+            if max_age_seconds is not None and time.monotonic() - self._frame_timestamp > max_age_seconds:
+                return None
+
+            return self._frame
+
+    def _run(self) -> None:
+        backoff_seconds: float = RECONNECT_MIN_BACKOFF_SECONDS
+
+        while not self._stop_event.is_set():
+            capture: cv2.VideoCapture = cv2.VideoCapture(self.url)
+            capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            self.is_connected = capture.isOpened()
+            last_decoded_at: float = 0.0
+
+            while self.is_connected and not self._stop_event.is_set():
+                #   Every packet is grabbed to keep the stream drained, but only decoded into a frame at most once per DECODE_INTERVAL_SECONDS
+                if not capture.grab():
+                    break
+
+                self.frames_grabbed += 1
+                if time.monotonic() - last_decoded_at < DECODE_INTERVAL_SECONDS:
+                    continue
+
+                with measure(Stage.FRAME_CAPTURE):
+                    successful_frame_read, frame = capture.retrieve()
+                if not successful_frame_read:
+                    break
+
+                last_decoded_at = time.monotonic()
+                self.frames_decoded += 1
+                backoff_seconds = RECONNECT_MIN_BACKOFF_SECONDS
+                with self._frame_lock:
+                    self._frame, self._frame_timestamp = frame, last_decoded_at
+                self._frame_event.set()
+
+            capture.release()
+            self.is_connected = False
+            if not self._stop_event.is_set():
+                self.reconnect_count += 1
+                logger.warning(f"Camera stream disconnected, reconnecting in {backoff_seconds:.0f} seconds")
+                self._stop_event.wait(backoff_seconds)
+                backoff_seconds = min(backoff_seconds * 2, RECONNECT_MAX_BACKOFF_SECONDS)
+
+
+def get_frame_grabber(url: str) -> FrameGrabber:
+    with _frame_grabber_dict_lock:
+        if url not in _frame_grabber_dict:
+            _frame_grabber_dict[url] = FrameGrabber(url)
+            _frame_grabber_dict[url].start()
+
+        _frame_grabber_dict[url].last_used_at = time.monotonic()
+        return _frame_grabber_dict[url]
+
+
+def evict_idle_frame_grabbers(idle_timeout_seconds: float = IDLE_TIMEOUT_SECONDS) -> int:
+    #   Streams that are no longer analyzed (e.g. a one-off /analyze_camera call or a removed camera) are closed instead of being grabbed forever
+    with _frame_grabber_dict_lock:
+        idle_url_list: List[str] = [url for url, frame_grabber in _frame_grabber_dict.items() if time.monotonic() - frame_grabber.last_used_at > idle_timeout_seconds]
+        idle_frame_grabber_list: List[FrameGrabber] = [_frame_grabber_dict.pop(url) for url in idle_url_list]
+
+    for frame_grabber in idle_frame_grabber_list:
+        frame_grabber.stop()
+
+    return len(idle_frame_grabber_list)
+
+
+def stop_all_frame_grabbers() -> None:
+    with _frame_grabber_dict_lock:
+        for frame_grabber in _frame_grabber_dict.values():
+            frame_grabber.stop()
+
+        _frame_grabber_dict.clear()
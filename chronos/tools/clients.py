@@ -0,0 +1,65 @@
+import os
+
+import httpx
+from sirius import common
+from sirius.common import DataClass
+
+HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "16"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "8"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+HTTP_READ_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_READ_TIMEOUT_SECONDS", "30"))
+IS_HTTP2_ENABLED: bool = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+_service_clients: "ServiceClients | None" = None
+
+
+class ChronosSettings(DataClass):
+    apollo_base_url: str
+    vita_api_base_url: str
+    api_key: str
+
+    @staticmethod
+    def load() -> "ChronosSettings":
+        return ChronosSettings(
+            apollo_base_url=common.get_environmental_secret("APOLLO_BASE_URL"),
+            vita_api_base_url=common.get_environmental_secret("VITA_API_BASE_URL"),
+            api_key=common.get_environmental_secret("API_KEY"),
+        )
+
+
+class ServiceClients:
+    settings: ChronosSettings
+    apollo: httpx.AsyncClient
+    vita_api: httpx.AsyncClient
+
+    def __init__(self, settings: ChronosSettings) -> None:
+        self.settings = settings
+        self.apollo = self._create_client(settings.apollo_base_url)
+        self.vita_api = self._create_client(settings.vita_api_base_url)
+
+    def _create_client(self, base_url: str) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {self.settings.api_key}"},
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS, keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS),
+            timeout=httpx.Timeout(connect=5.0, read=HTTP_READ_TIMEOUT_SECONDS, write=10.0, pool=5.0),
+            http2=IS_HTTP2_ENABLED,
+        )
+
+    async def aclose(self) -> None:
+        await self.apollo.aclose()
+        await self.vita_api.aclose()
+
+
+def get_service_clients() -> ServiceClients:
+    global _service_clients
+    if _service_clients is None:
+        _service_clients = ServiceClients(ChronosSettings.load())
+
+    return _service_clients
+
+
+async def close_service_clients() -> None:
+    global _service_clients
+    if _service_clients is not None:
+        await _service_clients.aclose()
+        _service_clients = None
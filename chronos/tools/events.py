@@ -0,0 +1,245 @@
+import datetime
+import json
+import os
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Dict, Tuple, BinaryIO, Any
+
+import cv2
+import numpy as np
+from sirius.common import DataClass
+
+from tools.transport import DetectedObject
+
+EVENT_STORE_DIRECTORY: str = os.getenv("EVENT_STORE_DIRECTORY", "events")
+EVENT_STORE_SEGMENT_SIZE_BYTES: int = int(os.getenv("EVENT_STORE_SEGMENT_SIZE_BYTES", str(64 * 1024 * 1024)))
+EVENT_STORE_MAX_SIZE_BYTES: int = int(os.getenv("EVENT_STORE_MAX_SIZE_BYTES", str(2 * 1024 * 1024 * 1024)))
+EVENT_THUMBNAIL_WIDTH: int = int(os.getenv("EVENT_THUMBNAIL_WIDTH", "320"))
+EVENT_THUMBNAIL_QUALITY: int = int(os.getenv("EVENT_THUMBNAIL_QUALITY", "70"))
+RECORD_HEADER: struct.Struct = struct.Struct("<II")
+#   One row per (event, class) so that a class filter is a single vectorised comparison; the segment is implied by the file the row belongs to
+INDEX_DTYPE: np.dtype = np.dtype([("timestamp", "<i8"), ("offset", "<u4"), ("camera_id", "<u2"), ("class_id", "<u2")])
+_event_store: "EventStore | None" = None
+
+
+class EventNotFoundException(Exception):
+    pass
+
+
+class DetectionEvent(DataClass):
+    id: str
+    timestamp: datetime.datetime
+    camera_name: str
+    object_list: List[DetectedObject]
+
+
+@dataclass
+class Segment:
+    segment_id: int
+    segment_path: Path
+    index_path: Path
+    index: np.ndarray
+    pending_row_list: List[Tuple[int, int, int, int]] = field(default_factory=list)
+    size: int = 0
+
+    def get_index(self) -> np.ndarray:
+        if len(self.pending_row_list) > 0:
+            self.index = np.concatenate([self.index, np.array(self.pending_row_list, dtype=INDEX_DTYPE)])
+            self.pending_row_list = []
+
+        return self.index
+
+    @property
+    def first_timestamp(self) -> int:
+        if len(self.index) > 0:
+            return int(self.index["timestamp"][0])
+
+        return self.pending_row_list[0][0] if len(self.pending_row_list) > 0 else self.segment_id
+
+    @property
+    def last_timestamp(self) -> int:
+        if len(self.pending_row_list) > 0:
+            return self.pending_row_list[-1][0]
+
+        return int(self.index["timestamp"][-1]) if len(self.index) > 0 else self.segment_id
+
+
+def get_datetime(timestamp_ms: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(timestamp_ms / 1000, tz=datetime.timezone.utc)
+
+
+def encode_thumbnail(frame: np.ndarray, width: int = EVENT_THUMBNAIL_WIDTH) -> bytes:
+    height: int = max(1, round(frame.shape[0] * width / frame.shape[1]))
+    successful_encoding, encoded_thumbnail = cv2.imencode(".jpg", cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA), [cv2.IMWRITE_JPEG_QUALITY, EVENT_THUMBNAIL_QUALITY])
+    return encoded_thumbnail.tobytes()
+
+
+class EventStore:
+    directory: Path
+    segment_size_bytes: int
+    max_size_bytes: int
+    segment_list: List[Segment]
+    camera_list: List[str]
+    class_list: List[str]
+    _segment_file: BinaryIO | None = None
+    _index_file: BinaryIO | None = None
+    _lock: threading.Lock
+
+    def __init__(self, directory: str = EVENT_STORE_DIRECTORY, segment_size_bytes: int = EVENT_STORE_SEGMENT_SIZE_BYTES, max_size_bytes: int = EVENT_STORE_MAX_SIZE_BYTES) -> None:
+        self.directory = Path(directory)
+        self.segment_size_bytes = segment_size_bytes
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        name_path: Path = self.directory / "names.json"
+        name_dict: Dict[str, List[str]] = json.loads(name_path.read_text()) if name_path.exists() else {}
+        self.camera_list = name_dict.get("camera_list", [])
+        self.class_list = name_dict.get("class_list", [])
+        self.segment_list = [self._load_segment(segment_path) for segment_path in sorted(self.directory.glob("*.segment"), key=lambda path: int(path.stem))]
+
+    def append(self, camera_name: str, object_list: List[DetectedObject], frame: np.ndarray, timestamp: float | None = None) -> DetectionEvent:
+        thumbnail: bytes = encode_thumbnail(frame)
+
+        with self._lock:
+            timestamp_ms: int = round((time.time() if timestamp is None else timestamp) * 1000)
+            segment: Segment = self._get_writable_segment(timestamp_ms)
+            #   The index must stay sorted for the binary search, so a clock that steps backwards is clamped to the last event
+            timestamp_ms = max(timestamp_ms, segment.last_timestamp)
+            metadata: bytes = json.dumps({"timestamp": timestamp_ms, "camera_name": camera_name, "object_list": [detected_object.model_dump() for detected_object in object_list]}).encode("utf-8")
+            offset: int = segment.size
+
+            self._segment_file.write(RECORD_HEADER.pack(len(metadata), len(thumbnail)) + metadata + thumbnail)
+            self._segment_file.flush()
+            segment.size += RECORD_HEADER.size + len(metadata) + len(thumbnail)
+
+            camera_id: int = self._get_name_id(self.camera_list, camera_name)
+            row_list: List[Tuple[int, int, int, int]] = [(timestamp_ms, offset, camera_id, self._get_name_id(self.class_list, class_name)) for class_name in sorted({detected_object.description for detected_object in object_list})]
+            self._index_file.write(np.array(row_list, dtype=INDEX_DTYPE).tobytes())
+            self._index_file.flush()
+            segment.pending_row_list.extend(row_list)
+
+            self._enforce_retention()
+
+        return DetectionEvent(id=f"{segment.segment_id}-{offset}", timestamp=get_datetime(timestamp_ms), camera_name=camera_name, object_list=object_list)
+
+    def query(self, start_time: float | None = None, end_time: float | None = None, camera_name: str | None = None, object_class: str | None = None, limit: int = 100) -> List[DetectionEvent]:
+        start_timestamp: int = round(start_time * 1000) if start_time is not None else np.iinfo(np.int64).min
+        end_timestamp: int = round(end_time * 1000) if end_time is not None else np.iinfo(np.int64).max
+        event_list: List[DetectionEvent] = []
+
+        with self._lock:
+            if (camera_name is not None and camera_name not in self.camera_list) or (object_class is not None and object_class not in self.class_list):
+                return []
+
+            camera_id: int | None = self.camera_list.index(camera_name) if camera_name is not None else None
+            class_id: int | None = self.class_list.index(object_class) if object_class is not None else None
+
+            for segment in reversed(self.segment_list):
+                if len(event_list) >= limit:
+                    break
+                if segment.first_timestamp > end_timestamp or segment.last_timestamp < start_timestamp:
+                    continue
+
+                index: np.ndarray = segment.get_index()
+                index = index[np.searchsorted(index["timestamp"], start_timestamp, side="left"):np.searchsorted(index["timestamp"], end_timestamp, side="right")]
+                if camera_id is not None:
+                    index = index[index["camera_id"] == camera_id]
+                if class_id is not None:
+                    index = index[index["class_id"] == class_id]
+
+                #   Offsets increase with time within a segment, so the newest events are the largest unique offsets
+                offset_array: np.ndarray = np.unique(index["offset"])[::-1][:limit - len(event_list)]
+                with segment.segment_path.open("rb") as segment_file:
+                    event_list.extend(self._read_event(segment, segment_file, int(offset))[0] for offset in offset_array)
+
+        return event_list
+
+    def get_thumbnail(self, event_id: str) -> bytes:
+        with self._lock:
+            segment, offset = self._find_event(event_id)
+            with segment.segment_path.open("rb") as segment_file:
+                return self._read_event(segment, segment_file, offset)[1]
+
+    def get_size(self) -> int:
+        return sum(segment.size + segment.index.nbytes + len(segment.pending_row_list) * INDEX_DTYPE.itemsize for segment in self.segment_list)
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_files()
+
+    def _load_segment(self, segment_path: Path) -> Segment:
+        index_path: Path = segment_path.with_suffix(".index")
+        index: np.ndarray = np.fromfile(index_path, dtype=INDEX_DTYPE) if index_path.exists() else np.empty(0, dtype=INDEX_DTYPE)
+        segment_size: int = segment_path.stat().st_size
+        #   Rows whose record did not make it to disk (e.g. a crash between the two writes) are dropped
+        return Segment(segment_id=int(segment_path.stem), segment_path=segment_path, index_path=index_path, index=index[index["offset"] < segment_size], size=segment_size)
+
+    def _get_writable_segment(self, timestamp_ms: int) -> Segment:
+        if self._segment_file is None or len(self.segment_list) == 0 or self.segment_list[-1].size >= self.segment_size_bytes:
+            self._close_files()
+            if len(self.segment_list) == 0 or self.segment_list[-1].size >= self.segment_size_bytes:
+                segment_id: int = max(timestamp_ms, self.segment_list[-1].last_timestamp + 1) if len(self.segment_list) > 0 else timestamp_ms
+                segment_path: Path = self.directory / f"{segment_id}.segment"
+                self.segment_list.append(Segment(segment_id=segment_id, segment_path=segment_path, index_path=segment_path.with_suffix(".index"), index=np.empty(0, dtype=INDEX_DTYPE)))
+
+            self._segment_file = self.segment_list[-1].segment_path.open("ab")
+            self._index_file = self.segment_list[-1].index_path.open("ab")
+
+        return self.segment_list[-1]
+
+    def _get_name_id(self, name_list: List[str], name: str) -> int:
+        if name not in name_list:
+            name_list.append(name)
+            (self.directory / "names.json").write_text(json.dumps({"camera_list": self.camera_list, "class_list": self.class_list}))
+
+        return name_list.index(name)
+
+    def _enforce_retention(self) -> None:
+        while len(self.segment_list) > 1 and self.get_size() > self.max_size_bytes:
+            segment: Segment = self.segment_list.pop(0)
+            segment.segment_path.unlink(missing_ok=True)
+            segment.index_path.unlink(missing_ok=True)
+
+    def _find_event(self, event_id: str) -> Tuple[Segment, int]:
+        try:
+            segment_id, offset = (int(part) for part in event_id.split("-"))
+        except ValueError:
+            raise EventNotFoundException(f"Event '{event_id}' is not a valid event ID")
+
+        segment: Segment | None = next(filter(lambda s: s.segment_id == segment_id, self.segment_list), None)
+        if segment is None or offset not in segment.get_index()["offset"]:
+            raise EventNotFoundException(f"Event '{event_id}' does not exist or has been removed by the retention policy")
+
+        return segment, offset
+
+    def _read_event(self, segment: Segment, segment_file: BinaryIO, offset: int) -> Tuple[DetectionEvent, bytes]:
+        segment_file.seek(offset)
+        metadata_length, thumbnail_length = RECORD_HEADER.unpack(segment_file.read(RECORD_HEADER.size))
+        metadata: Dict[str, Any] = json.loads(segment_file.read(metadata_length))
+        return DetectionEvent(id=f"{segment.segment_id}-{offset}", timestamp=get_datetime(metadata["timestamp"]), camera_name=metadata["camera_name"], object_list=[DetectedObject(**data) for data in metadata["object_list"]]), segment_file.read(thumbnail_length)
+
+    def _close_files(self) -> None:
+        for file in [self._segment_file, self._index_file]:
+            if file is not None:
+                file.close()
+
+        self._segment_file, self._index_file = None, None
+
+
+def get_event_store() -> EventStore:
+    global _event_store
+    if _event_store is None:
+        _event_store = EventStore()
+
+    return _event_store
+
+
+def close_event_store() -> None:
+    global _event_store
+    if _event_store is not None:
+        _event_store.close()
+        _event_store = None
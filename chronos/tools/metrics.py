@@ -0,0 +1,47 @@
+import time
+from contextlib import contextmanager
+from enum import Enum
+from typing import Generator, Tuple
+
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from starlette.responses import Response
+
+LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Stage(Enum):
+    FRAME_CAPTURE = "FRAME_CAPTURE"
+    MOTION_DETECTION = "MOTION_DETECTION"
+    JPEG_ENCODE = "JPEG_ENCODE"
+    APOLLO_INFERENCE = "APOLLO_INFERENCE"
+    DISCORD_SEND = "DISCORD_SEND"
+    EVENT_STORE = "EVENT_STORE"
+
+
+class AlertOutcome(Enum):
+    SENT = "SENT"
+    SUPPRESSED = "SUPPRESSED"
+    FAILED = "FAILED"
+
+
+STAGE_DURATION_SECONDS: Histogram = Histogram("chronos_stage_duration_seconds", "Time spent in each processing stage.", ["stage"], buckets=LATENCY_BUCKETS)
+SCHEDULER_LAG_SECONDS: Histogram = Histogram("chronos_scheduler_lag_seconds", "Delay between the scheduled and the actual start time of a job.", ["job"], buckets=LATENCY_BUCKETS)
+JOB_COMPLETION_SECONDS: Histogram = Histogram("chronos_job_completion_seconds", "Time between the scheduled start time and the completion of a job.", ["job"], buckets=LATENCY_BUCKETS)
+ALERTS: Counter = Counter("chronos_alerts", "Number of alerts by outcome: sent to Discord, suppressed by the cooldown or failed to send.", ["outcome"])
+
+
+def observe_stage_duration(stage: Stage, duration_seconds: float) -> None:
+    STAGE_DURATION_SECONDS.labels(stage.value).observe(duration_seconds)
+
+
+@contextmanager
+def measure(stage: Stage) -> Generator[None, None, None]:
+    started_at: float = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage_duration(stage, time.perf_counter() - started_at)
+
+
+def get_metrics_response() -> Response:
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,89 @@
+import os
+import threading
+from typing import Dict
+
+import cv2
+import numpy as np
+from sirius.common import DataClass
+
+MOTION_THRESHOLD: float = float(os.getenv("MOTION_THRESHOLD", "0.005"))
+MOTION_PIXEL_THRESHOLD: int = int(os.getenv("MOTION_PIXEL_THRESHOLD", "25"))
+MOTION_FRAME_WIDTH: int = int(os.getenv("MOTION_FRAME_WIDTH", "160"))
+MOTION_BACKGROUND_LEARNING_RATE: float = float(os.getenv("MOTION_BACKGROUND_LEARNING_RATE", "0.1"))
+_motion_detector_dict: Dict[str, "MotionDetector"] = {}
+_motion_detector_dict_lock: threading.Lock = threading.Lock()
+
+
+class MotionStatistics(DataClass):
+    threshold: float
+    frames_analyzed: int
+    frames_forwarded: int
+    forward_rate: float
+    last_motion_score: float | None
+    max_motion_score: float | None
+
+
+class MotionDetector:
+    threshold: float
+    frames_analyzed: int = 0
+    frames_forwarded: int = 0
+    last_motion_score: float | None = None
+    max_motion_score: float | None = None
+    _background: np.ndarray | None = None
+    _lock: threading.Lock
+
+    def __init__(self, threshold: float = MOTION_THRESHOLD) -> None:
+        self.threshold = threshold
+        self._lock = threading.Lock()
+
+    def get_motion_score(self, frame: np.ndarray) -> float:
+        height: int = max(1, round(frame.shape[0] * MOTION_FRAME_WIDTH / frame.shape[1]))
+        grayscale_frame: np.ndarray = cv2.cvtColor(cv2.resize(frame, (MOTION_FRAME_WIDTH, height), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        grayscale_frame = cv2.GaussianBlur(grayscale_frame, (5, 5), 0)
+
+        with self._lock:
+            if self._background is None or self._background.shape != grayscale_frame.shape:
+                self._background = grayscale_frame.astype(np.float32)
+                return 1.0
+
+            difference: np.ndarray = cv2.absdiff(grayscale_frame, cv2.convertScaleAbs(self._background))
+            cv2.accumulateWeighted(grayscale_frame, self._background, MOTION_BACKGROUND_LEARNING_RATE)
+
+        return float(np.count_nonzero(difference > MOTION_PIXEL_THRESHOLD)) / difference.size
+
+    def is_motion_detected(self, frame: np.ndarray) -> bool:
+        motion_score: float = self.get_motion_score(frame)
+        is_motion_detected: bool = motion_score >= self.threshold
+        self.frames_analyzed += 1
+        if is_motion_detected:
+            self.frames_forwarded += 1
+
+        self.last_motion_score = motion_score
+        self.max_motion_score = motion_score if self.max_motion_score is None else max(self.max_motion_score, motion_score)
+        return is_motion_detected
+
+    def get_statistics(self) -> MotionStatistics:
+        return MotionStatistics(
+            threshold=self.threshold,
+            frames_analyzed=self.frames_analyzed,
+            frames_forwarded=self.frames_forwarded,
+            forward_rate=self.frames_forwarded / self.frames_analyzed if self.frames_analyzed > 0 else 0.0,
+            last_motion_score=self.last_motion_score,
+            max_motion_score=self.max_motion_score,
+        )
+
+
+def get_motion_detector(camera_name: str, threshold: float | None = None) -> MotionDetector:
+    with _motion_detector_dict_lock:
+        if camera_name not in _motion_detector_dict:
+            _motion_detector_dict[camera_name] = MotionDetector()
+
+        if threshold is not None:
+            _motion_detector_dict[camera_name].threshold = threshold
+
+        return _motion_detector_dict[camera_name]
+
+
+def get_all_motion_statistics() -> Dict[str, MotionStatistics]:
+    with _motion_detector_dict_lock:
+        return {camera_name: motion_detector.get_statistics() for camera_name, motion_detector in _motion_detector_dict.items()}
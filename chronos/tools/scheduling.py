@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import List, Dict, Any, Callable, AsyncGenerator, Tuple
+
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED, JobEvent
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from sirius import common
+from sirius.common import DataClass
+
+CAMERA_CONFIGURATION: str | None = os.getenv("CAMERA_CONFIGURATION")
+MAX_IN_FLIGHT_APOLLO_REQUESTS: int = int(os.getenv("MAX_IN_FLIGHT_APOLLO_REQUESTS", "4"))
+APOLLO_TARGET_LATENCY_SECONDS: float = float(os.getenv("APOLLO_TARGET_LATENCY_SECONDS", "1.0"))
+MAX_INTERVAL_MULTIPLIER: float = float(os.getenv("MAX_INTERVAL_MULTIPLIER", "6.0"))
+LATENCY_SMOOTHING_FACTOR: float = 0.2
+logger = logging.getLogger(__name__)
+
+
+class TickShedException(Exception):
+    pass
+
+
+class RegionOfInterest(DataClass):
+    name: str
+    polygon: List[Tuple[float, float]]
+
+
+class CameraConfiguration(DataClass):
+    name: str
+    url: str | None = None
+    url_secret_key: str | None = None
+    interval_seconds: float = 5.0
+    priority: int = 0
+    motion_threshold: float | None = None
+    region_of_interest_list: List[RegionOfInterest] = []
+    inference_size: int | None = None
+    is_enabled: bool = True
+
+    @property
+    def is_apollo_source(self) -> bool:
+        return len(self.region_of_interest_list) > 0 or self.inference_size is not None
+
+    def get_url(self) -> str:
+        return self.url if self.url is not None else common.get_environmental_secret(self.url_secret_key)
+
+
+class CameraStatistics(DataClass):
+    interval_seconds: float
+    priority: int
+    apollo_requests: int = 0
+    shed_ticks: int = 0
+    missed_ticks: int = 0
+
+
+DEFAULT_CAMERA_CONFIGURATION_LIST: List[CameraConfiguration] = [
+    CameraConfiguration(name="front", url_secret_key="RTSP_URL_FRONT_CAMERA"),
+    CameraConfiguration(name="backyard", url_secret_key="RTSP_URL_BACKYARD_CAMERA"),
+    CameraConfiguration(name="garage", url_secret_key="RTSP_URL_GARAGE_CAMERA", priority=1),
+    CameraConfiguration(name="left_corridor", url_secret_key="RTSP_URL_LEFT_CORRIDOR_CAMERA"),
+]
+
+
+def load_camera_configuration_list(camera_configuration: str | None = CAMERA_CONFIGURATION) -> List[CameraConfiguration]:
+    if camera_configuration is None:
+        return DEFAULT_CAMERA_CONFIGURATION_LIST
+
+    camera_configuration_json: str = camera_configuration if camera_configuration.lstrip().startswith("[") else Path(camera_configuration).read_text()
+    return [CameraConfiguration(**data) for data in json.loads(camera_configuration_json)]
+
+
+class CameraScheduler:
+    scheduler: AsyncIOScheduler
+    camera_dict: Dict[str, CameraConfiguration]
+    statistics_dict: Dict[str, CameraStatistics]
+    apollo_latency_seconds: float | None = None
+    _apollo_request_semaphore: asyncio.Semaphore | None = None
+    _max_in_flight_apollo_requests: int
+
+    def __init__(self, scheduler: AsyncIOScheduler, camera_configuration_list: List[CameraConfiguration], max_in_flight_apollo_requests: int = MAX_IN_FLIGHT_APOLLO_REQUESTS) -> None:
+        self.scheduler = scheduler
+        self.camera_dict = {camera.name: camera for camera in camera_configuration_list if camera.is_enabled}
+        self.statistics_dict = {camera.name: CameraStatistics(interval_seconds=camera.interval_seconds, priority=camera.priority) for camera in self.camera_dict.values()}
+        self._max_in_flight_apollo_requests = max_in_flight_apollo_requests
+        self.scheduler.add_listener(self._on_tick_skipped, EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
+
+    @property
+    def apollo_request_semaphore(self) -> asyncio.Semaphore:
+        if self._apollo_request_semaphore is None:
+            self._apollo_request_semaphore = asyncio.Semaphore(self._max_in_flight_apollo_requests)
+
+        return self._apollo_request_semaphore
+
+    def schedule_all(self, analyze_camera: Callable[..., Any]) -> List[str]:
+        url_list: List[str] = []
+
+        for camera in list(self.camera_dict.values()):
+            try:
+                url: str = camera.get_url()
+            except Exception:
+                logger.exception(f"Camera '{camera.name}' is skipped because its URL could not be resolved")
+                del self.camera_dict[camera.name], self.statistics_dict[camera.name]
+                continue
+
+            self.scheduler.add_job(analyze_camera, IntervalTrigger(seconds=camera.interval_seconds), args=[url, camera.name, camera.motion_threshold], id=camera.name, max_instances=1, coalesce=True)
+            url_list.append(url)
+
+        return url_list
+
+    @asynccontextmanager
+    async def apollo_request_slot(self, camera_name: str) -> AsyncGenerator[None, None]:
+        camera: CameraConfiguration | None = self.camera_dict.get(camera_name)
+        statistics: CameraStatistics | None = self.statistics_dict.get(camera_name)
+        semaphore: asyncio.Semaphore = self.apollo_request_semaphore
+
+        try:
+            if camera is None:
+                await semaphore.acquire()
+            elif camera.priority > 0:
+                #   Higher priority cameras wait up to one interval for a free slot, while the others shed the tick immediately
+                await asyncio.wait_for(semaphore.acquire(), timeout=camera.interval_seconds)
+            elif semaphore.locked():
+                raise asyncio.TimeoutError()
+            else:
+                await semaphore.acquire()
+        except asyncio.TimeoutError:
+            if statistics is not None:
+                statistics.shed_ticks += 1
+            raise TickShedException(f"Tick for camera '{camera_name}' is shed as {self._max_in_flight_apollo_requests} Apollo requests are already in flight")
+
+        started_at: float = time.monotonic()
+        try:
+            if statistics is not None:
+                statistics.apollo_requests += 1
+            yield
+            self._record_apollo_latency(time.monotonic() - started_at)
+        finally:
+            semaphore.release()
+
+    def get_statistics(self) -> Dict[str, CameraStatistics]:
+        return self.statistics_dict
+
+    def _record_apollo_latency(self, latency_seconds: float) -> None:
+        self.apollo_latency_seconds = latency_seconds if self.apollo_latency_seconds is None else LATENCY_SMOOTHING_FACTOR * latency_seconds + (1 - LATENCY_SMOOTHING_FACTOR) * self.apollo_latency_seconds
+        interval_multiplier: float = min(max(self.apollo_latency_seconds / APOLLO_TARGET_LATENCY_SECONDS, 1.0), MAX_INTERVAL_MULTIPLIER)
+
+        for camera in self.camera_dict.values():
+            statistics: CameraStatistics = self.statistics_dict[camera.name]
+            interval_seconds: float = camera.interval_seconds * interval_multiplier
+            if abs(interval_seconds - statistics.interval_seconds) / statistics.interval_seconds > 0.1 and self.scheduler.get_job(camera.name) is not None:
+                logger.info(f"Rescheduling camera '{camera.name}' to every {interval_seconds:.1f} seconds (Apollo latency: {self.apollo_latency_seconds:.2f} seconds)")
+                self.scheduler.reschedule_job(camera.name, trigger=IntervalTrigger(seconds=interval_seconds))
+                statistics.interval_seconds = interval_seconds
+
+    def _on_tick_skipped(self, event: JobEvent) -> None:
+        if event.job_id in self.statistics_dict:
+            self.statistics_dict[event.job_id].missed_ticks += 1
@@ -0,0 +1,190 @@
+import asyncio
+import importlib
+import os
+import sys
+from abc import ABC, abstractmethod
+from enum import Enum
+from pathlib import Path
+from types import ModuleType
+from typing import List, Dict, Any
+
+import cv2
+import httpx
+import numpy as np
+from sirius import common
+from sirius.common import DataClass
+
+from tools.clients import ServiceClients, get_service_clients, HTTP_READ_TIMEOUT_SECONDS
+from tools.metrics import Stage, measure
+from tools.scheduling import CameraConfiguration
+
+
+class TransportType(Enum):
+    HTTP = "HTTP"
+    IN_PROCESS = "IN_PROCESS"
+    UNIX_SOCKET = "UNIX_SOCKET"
+
+
+DETECTION_TRANSPORT: TransportType = TransportType(os.getenv("DETECTION_TRANSPORT", TransportType.HTTP.value).upper())
+APOLLO_DIRECTORY: str = os.getenv("APOLLO_DIRECTORY", str(Path(__file__).resolve().parents[2] / "apollo"))
+APOLLO_UNIX_SOCKET_PATH: str = os.getenv("APOLLO_UNIX_SOCKET_PATH", "/tmp/apollo.sock")
+_detection_transport: "DetectionTransport | None" = None
+
+
+class TransportNotAvailableException(Exception):
+    pass
+
+
+class DetectedObject(DataClass):
+    description: str
+    confidence: float
+    xyxy: List[float]
+
+
+def encode_frame(frame: np.ndarray) -> bytes:
+    with measure(Stage.JPEG_ENCODE):
+        successful_encoding, encoded_frame = cv2.imencode(".jpg", frame)
+    return encoded_frame.tobytes()
+
+
+def get_source_data(camera: CameraConfiguration) -> Dict[str, Any]:
+    return {"region_of_interest_list": [region_of_interest.model_dump() for region_of_interest in camera.region_of_interest_list], "inference_size": camera.inference_size}
+
+
+def import_apollo_module(module_name: str, apollo_directory: str = APOLLO_DIRECTORY, environment_dict: Dict[str, str] | None = None) -> ModuleType:
+    #   Both services name their package "tools", so Chronos' modules are set aside while Apollo's are imported and then restored, leaving Apollo's modules reachable only through the returned module
+    chronos_module_dict: Dict[str, ModuleType] = {name: module for name, module in sys.modules.items() if name == "tools" or name.startswith("tools.")}
+    for name in chronos_module_dict:
+        del sys.modules[name]
+
+    #   Apollo reads its settings when its modules are imported, so the overrides only need to be in place for the import
+    previous_environment_dict: Dict[str, str | None] = {name: os.environ.get(name) for name in (environment_dict or {})}
+    os.environ.update(environment_dict or {})
+    sys.path.insert(0, apollo_directory)
+    try:
+        return importlib.import_module(module_name)
+    finally:
+        sys.path.remove(apollo_directory)
+        for name, value in previous_environment_dict.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
+        for name in [name for name in sys.modules if name == "tools" or name.startswith("tools.")]:
+            del sys.modules[name]
+        sys.modules.update(chronos_module_dict)
+
+
+class DetectionTransport(ABC):
+    last_cache_status: str | None = None
+
+    async def start(self) -> None:
+        pass
+
+    @abstractmethod
+    async def register_source(self, camera: CameraConfiguration) -> None:
+        ...
+
+    @abstractmethod
+    async def detect(self, frame: np.ndarray, camera_name: str) -> List[DetectedObject]:
+        ...
+
+    async def aclose(self) -> None:
+        pass
+
+
+class HTTPDetectionTransport(DetectionTransport):
+    service_clients: ServiceClients
+
+    def __init__(self, service_clients: ServiceClients | None = None) -> None:
+        self.service_clients = get_service_clients() if service_clients is None else service_clients
+
+    async def register_source(self, camera: CameraConfiguration) -> None:
+        response: httpx.Response = await self.service_clients.apollo.put(f"/media/sources/{camera.name}", json=get_source_data(camera))
+        response.raise_for_status()
+
+    async def detect(self, frame: np.ndarray, camera_name: str) -> List[DetectedObject]:
+        image_bytes: bytes = await asyncio.to_thread(encode_frame, frame)
+        query_params: Dict[str, str] = {"response_format": "BOXES", "source": camera_name}
+        response: httpx.Response = await self.service_clients.apollo.post("/media/object_detection", params=query_params, files={"image": ("image.jpeg", image_bytes, "image/jpeg")})
+        response.raise_for_status()
+        self.last_cache_status = response.headers.get("X-Cache")
+        return [DetectedObject(**data) for data in response.json()]
+
+
+class UnixSocketDetectionTransport(DetectionTransport):
+    client: httpx.AsyncClient
+
+    def __init__(self, socket_path: str = APOLLO_UNIX_SOCKET_PATH, api_key: str | None = None) -> None:
+        headers: Dict[str, str] = {"Authorization": f"Bearer {api_key}"} if api_key is not None else {}
+        self.client = httpx.AsyncClient(base_url="http://apollo", headers=headers, transport=httpx.AsyncHTTPTransport(uds=socket_path), timeout=httpx.Timeout(connect=5.0, read=HTTP_READ_TIMEOUT_SECONDS, write=10.0, pool=5.0))
+
+    async def register_source(self, camera: CameraConfiguration) -> None:
+        response: httpx.Response = await self.client.put(f"/media/sources/{camera.name}", json=get_source_data(camera))
+        response.raise_for_status()
+
+    async def detect(self, frame: np.ndarray, camera_name: str) -> List[DetectedObject]:
+        query_params: Dict[str, Any] = {"width": frame.shape[1], "height": frame.shape[0], "response_format": "BOXES", "source": camera_name}
+        response: httpx.Response = await self.client.post("/media/object_detection/raw", params=query_params, content=np.ascontiguousarray(frame).tobytes(), headers={"Content-Type": "application/octet-stream"})
+        response.raise_for_status()
+        self.last_cache_status = response.headers.get("X-Cache")
+        return [DetectedObject(**data) for data in response.json()]
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+class InProcessDetectionTransport(DetectionTransport):
+    media: ModuleType
+
+    def __init__(self, apollo_directory: str = APOLLO_DIRECTORY) -> None:
+        #   Only meant for development and benchmarks: the Chronos image ships neither Apollo's source nor its requirements (ultralytics, torch)
+        if common.is_production_environment():
+            raise TransportNotAvailableException(f"The {TransportType.IN_PROCESS.value} transport is not available in production, use {TransportType.HTTP.value} or {TransportType.UNIX_SOCKET.value}")
+        if not (Path(apollo_directory) / "tools" / "media.py").is_file():
+            raise TransportNotAvailableException(f"The {TransportType.IN_PROCESS.value} transport needs Apollo's source in APOLLO_DIRECTORY: {apollo_directory}")
+
+        try:
+            #   A process pool would re-import Apollo's modules by name in its workers, where "tools" resolves to Chronos' package
+            self.media = import_apollo_module("tools.media", apollo_directory, {"APOLLO_EXECUTOR_TYPE": "THREAD"})
+        except ModuleNotFoundError as e:
+            raise TransportNotAvailableException(f"The {TransportType.IN_PROCESS.value} transport needs Apollo's requirements to be installed (missing: {e.name})") from e
+
+    async def start(self) -> None:
+        await self.media.model_registry.start()
+
+    async def register_source(self, camera: CameraConfiguration) -> None:
+        self.media.set_source_configuration(camera.name, self.media.SourceConfiguration(**get_source_data(camera)))
+        self.media.frame_cache.clear()
+
+    async def detect(self, frame: np.ndarray, camera_name: str) -> List[DetectedObject]:
+        detection_list, header_dict = await self.media.detect(self.media.DetectionRequest(frame=frame, include_crops=False), camera_name)
+        self.last_cache_status = header_dict.get("X-Cache")
+        return [DetectedObject(description=detection.description, confidence=detection.confidence, xyxy=detection.box) for detection in detection_list]
+
+    async def aclose(self) -> None:
+        self.media.model_registry.shutdown()
+
+
+def create_detection_transport(transport_type: TransportType = DETECTION_TRANSPORT) -> DetectionTransport:
+    if transport_type == TransportType.IN_PROCESS:
+        return InProcessDetectionTransport()
+    elif transport_type == TransportType.UNIX_SOCKET:
+        return UnixSocketDetectionTransport(api_key=get_service_clients().settings.api_key)
+
+    return HTTPDetectionTransport()
+
+
+def get_detection_transport() -> DetectionTransport:
+    global _detection_transport
+    if _detection_transport is None:
+        _detection_transport = create_detection_transport()
+
+    return _detection_transport
+
+
+async def close_detection_transport() -> None:
+    global _detection_transport
+    if _detection_transport is not None:
+        await _detection_transport.aclose()
+        _detection_transport = None
@@ -1,9 +1,20 @@
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Any
+
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sirius import common
 from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response
 
 from tools import discord, ibkr, wise
+from tools.ledger import close_ledger
+from tools.metrics import get_metrics_response
+from tools.responses import ORJSONResponse
+
+GZIP_MINIMUM_SIZE_BYTES: int = int(os.getenv("GZIP_MINIMUM_SIZE_BYTES", "1024"))
 
 
 def verify_token(token: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False))) -> None:
@@ -14,7 +25,17 @@ def verify_token(token: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_e
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, headers={"WWW-Authenticate": "Bearer"}, )
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncGenerator[None, Any]:
+    await discord.start()
+    yield
+
+    await discord.outbox.stop()
+    await ibkr.close_ibkr_client()
+    close_ledger()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -22,10 +43,17 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE_BYTES)
 app.include_router(discord.router, prefix="/discord", dependencies=[Depends(verify_token)])
 app.include_router(ibkr.router, prefix="/ibkr", dependencies=[Depends(verify_token)])
 app.include_router(wise.router, prefix="/wise", dependencies=[Depends(verify_token)])
 
+
+@app.get("/metrics", summary="Returns the timing histograms of each processing stage in the Prometheus text format.")
+async def metrics() -> Response:
+    return get_metrics_response()
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -5,14 +5,61 @@ load_dotenv()
 from fastapi.testclient import TestClient
 
 from main import app
+from tools import discord
+from tools.cache import AsyncTTLCache
 from tools.discord import SendMessage
+from tools.contracts import OptionRight, parse_contract_description, get_portfolio_analytics
+from tools.ibkr import Contract
+from tools.ledger import TransactionLedger
+from tools.responses import dump_json
+from tools.wise import WiseTransaction
+
+import asyncio
+import datetime
+from decimal import Decimal
+from functools import partial
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List
+
+import httpx
+import pytest
+from sirius.common import Currency
+from sirius.communication.discord import DiscordMedia
+from sirius.wise import Transaction
 
 client = TestClient(app)
 
 
 def test_send_discord_message() -> None:
     response = client.post("/discord/send_message/", json=SendMessage(message="Hello World").model_dump())
-    assert response.status_code == 200
+    assert response.status_code == 202
+
+    response = client.get(f"/discord/messages/{response.json()["id"]}")
+    assert response.status_code == 200 and response.json()["status"] in ["QUEUED", "SENT"]
+
+
+def test_discord_messages_are_sent_with_the_bot_token(monkeypatch: pytest.MonkeyPatch) -> None:
+    request_list: List[httpx.Request] = []
+
+    def handle_request(request: httpx.Request) -> httpx.Response:
+        request_list.append(request)
+        return httpx.Response(200, json={"id": str(len(request_list))})
+
+    text_channel = SimpleNamespace(id=3, http_session=SimpleNamespace(client=httpx.AsyncClient(transport=httpx.MockTransport(handle_request))))
+
+    async def get_text_channel() -> SimpleNamespace:
+        return text_channel
+
+    monkeypatch.setattr(discord, "get_text_channel", get_text_channel)
+    monkeypatch.setattr(discord, "_authorization_header_dict", None)
+    monkeypatch.setattr(discord.common, "get_environmental_secret", lambda key: f"{key.lower()}_value")
+
+    #   Both the JSON and the multipart requests bypass the SDK's session, which is what normally adds the header
+    asyncio.run(discord.post_message("Hello World", []))
+    asyncio.run(discord.post_message("Hello World", [DiscordMedia(media=b"\xff\xd8\xff\xe0" + bytes(16), file_extension="jpg")]))
+    assert [request.headers.get("Authorization") for request in request_list] == ["Bot discord_bot_token_value"] * 2
+    assert request_list[1].headers["Content-Type"].startswith("multipart/form-data")
 
 
 def test_get_ibkr_account_summary() -> None:
@@ -20,6 +67,40 @@ def test_get_ibkr_account_summary() -> None:
     assert response.status_code == 200
 
 
+def test_get_ibkr_portfolio_analytics() -> None:
+    response = client.get("/ibkr/portfolio_analytics")
+    assert response.status_code == 200
+
+
+def test_parse_contract_description() -> None:
+    contract_details = parse_contract_description("QQQ    SEP2025 610 C [QQQ   250919C00610000 100]")
+    assert (contract_details.underlying, contract_details.expiry_date, contract_details.strike, contract_details.right, contract_details.multiplier) == ("QQQ", datetime.date(2025, 9, 19), Decimal("610"), OptionRight.CALL, 100)
+
+    contract_details = parse_contract_description("ES     DEC2025 6000 C [EW4Z5 C6000 50]")
+    assert (contract_details.underlying, contract_details.expiry_date, contract_details.expiry_month, contract_details.strike, contract_details.right, contract_details.multiplier) == ("ES", None, "2025-12", Decimal("6000"), OptionRight.CALL, 50)
+
+    contract_details = parse_contract_description("NQ     MAR2026 23500 P")
+    assert (contract_details.underlying, contract_details.expiry_month, contract_details.strike, contract_details.right) == ("NQ", "2026-03", Decimal("23500"), OptionRight.PUT)
+    assert parse_contract_description("NQ       MAR2026").expiry_month == "2026-03" and parse_contract_description("BRK B").underlying == "BRK B"
+
+
+def test_get_portfolio_analytics() -> None:
+    contract_list = [
+        Contract(description=description, currency=Currency("USD"), position=Decimal(position), average_cost=Decimal(average_cost), market_value=Decimal(market_price), position_value=position_value, unrealized_pnl=unrealized_pnl, type="", details=parse_contract_description(description))
+        for description, position, average_cost, market_price, position_value, unrealized_pnl in [
+            ("AAPL", "10", "150", "200", None, None),
+            ("ES     DEC2025 6000 C [EW4Z5 C6000 50]", "2", "8", "10", None, None),
+            ("NQ       MAR2026", "1", "19000", "20000", Decimal("400000"), Decimal("20000")),
+            ("NQ     MAR2026 23500 P", "1", "100", "120", None, None),
+        ]
+    ]
+
+    portfolio_analytics = get_portfolio_analytics(contract_list, today=datetime.date(2025, 9, 1))
+    assert {exposure_group.name: exposure_group.market_value for exposure_group in portfolio_analytics.by_underlying} == {"NQ": Decimal("400000"), "AAPL": Decimal("2000"), "ES": Decimal("1000")}
+    assert (portfolio_analytics.by_currency[0].unrealized_pnl, portfolio_analytics.by_currency[0].number_of_contracts) == (Decimal("20700"), 3)
+    assert portfolio_analytics.unknown_multiplier_contract_list == ["NQ     MAR2026 23500 P"]
+
+
 def test_get_latest_transactions() -> None:
     response = client.get("/wise/latest_transactions/")
     assert response.status_code == 200
@@ -28,3 +109,80 @@ def test_get_latest_transactions() -> None:
 def test_get_account_summary() -> None:
     response = client.get("/wise/account_summary/")
     assert response.status_code == 200
+
+
+def test_metrics() -> None:
+    response = client.get("/metrics")
+    assert response.status_code == 200 and "vita_api_stage_duration_seconds" in response.text
+
+
+def test_invalidate_ibkr_cache() -> None:
+    response = client.post("/ibkr/cache/invalidate")
+    assert response.status_code == 204
+
+
+def test_invalidate_cache_key_keeps_other_loads() -> None:
+    cache: AsyncTTLCache[str] = AsyncTTLCache("test", ttl_seconds=60)
+
+    async def load(value: str) -> str:
+        await asyncio.sleep(0.05)
+        return value
+
+    async def run() -> None:
+        load_task_list = [asyncio.create_task(cache.get(account_id, partial(load, f"{account_id} before"))) for account_id in ["U1", "U2"]]
+        await asyncio.sleep(0.01)
+        cache.invalidate("U1")
+        await asyncio.gather(*load_task_list)
+
+        #   Only the invalidated key's in-flight result is discarded
+        assert await cache.get("U1", lambda: load("U1 after")) == ("U1 after", 0.0)
+        assert (await cache.get("U2", lambda: load("U2 after")))[0] == "U2 before"
+
+        cache.invalidate()
+        assert (await cache.get("U2", lambda: load("U2 after")))[0] == "U2 after"
+
+    asyncio.run(run())
+
+
+def test_ledger_deduplicates_transactions(tmp_path: Path) -> None:
+    ledger = TransactionLedger(str(tmp_path / "ledger.sqlite3"))
+    time_now = datetime.datetime.now(datetime.timezone.utc)
+    transaction_list = [Transaction(amount=Decimal("-10.50"), currency=Currency.NZD, description=f"Card payment {index}", running_balance=Decimal("100"), timestamp=time_now - datetime.timedelta(hours=index)) for index in range(5)]
+
+    assert ledger.get_backfill_window(Currency.NZD, time_now - datetime.timedelta(hours=12)) is not None
+    assert ledger.add_transactions(Currency.NZD, transaction_list[:3], time_now - datetime.timedelta(days=1), time_now) == 3
+    assert ledger.add_transactions(Currency.NZD, transaction_list, time_now - datetime.timedelta(days=1), time_now) == 2
+    assert [transaction.description for transaction in ledger.get_transactions(Currency.NZD, time_now - datetime.timedelta(hours=3, minutes=30), time_now, limit=2, offset=1)] == ["Card payment 1", "Card payment 2"]
+    assert ledger.get_sync_window(Currency.NZD, time_now)[0] < time_now
+
+    #   Only a window that starts before the synced range is backfilled, up to where the synced range starts
+    assert ledger.get_backfill_window(Currency.NZD, time_now - datetime.timedelta(hours=12)) is None
+    from_time, to_time = ledger.get_backfill_window(Currency.NZD, time_now - datetime.timedelta(days=3)) or (None, None)
+    assert from_time == time_now - datetime.timedelta(days=3) and to_time is not None and to_time > time_now - datetime.timedelta(days=1)
+    ledger.add_transactions(Currency.NZD, [], time_now - datetime.timedelta(days=3), time_now - datetime.timedelta(days=1))
+    assert ledger.get_backfill_window(Currency.NZD, time_now - datetime.timedelta(days=3)) is None and ledger.get_sync_window(Currency.NZD, time_now)[0] > time_now - datetime.timedelta(hours=1)
+
+
+def test_get_latest_transactions_rejects_windows_beyond_the_history_limit() -> None:
+    response = client.get("/wise/latest_transactions/", params={"from_time": "2000-01-01T00:00:00Z"})
+    assert response.status_code == 400 and "WISE_LEDGER_MAX_HISTORY_DAYS" in response.json()["detail"]
+
+
+def test_send_discord_multipart_message() -> None:
+    response = client.post("/discord/send_message/multipart", data={"message": "Hello World"}, files=[("media_list", ("image", b"\xff\xd8\xff\xe0" + bytes(16), "application/octet-stream"))])
+    assert response.status_code == 202
+
+    response = client.post("/discord/send_message/multipart", data={"message": "Hello World"}, files=[("media_list", ("image", bytes(16), "application/octet-stream"))])
+    assert response.status_code == 415
+
+
+def test_conditional_get() -> None:
+    response = client.get("/wise/account_summary")
+    assert response.status_code == 200 and response.headers["ETag"].startswith('W/"')
+
+    response = client.get("/wise/account_summary", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304 and response.content == b""
+
+
+def test_dump_json() -> None:
+    assert dump_json([WiseTransaction(id="1", description="Coffee", currency=Currency.NZD, amount=Decimal("-4.50"), timestamp=datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc))]) == b'[{"id":"1","description":"Coffee","currency":"NZD","amount":"-4.50","timestamp":"2025-01-01T00:00:00Z"}]'
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar, Generic
+
+T = TypeVar("T")
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry(Generic[T]):
+    value: T
+    updated_at: float
+
+    @property
+    def age_seconds(self) -> float:
+        return time.monotonic() - self.updated_at
+
+
+class AsyncTTLCache(Generic[T]):
+    name: str
+    ttl_seconds: float
+    max_stale_seconds: float
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    _generation: int = 0
+    _generation_dict: Dict[Hashable, int]
+    _entry_dict: Dict[Hashable, CacheEntry[T]]
+    _in_flight_dict: Dict[Hashable, "asyncio.Task[T]"]
+
+    def __init__(self, name: str, ttl_seconds: float, max_stale_seconds: float = 0.0) -> None:
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self._generation_dict = {}
+        self._entry_dict = {}
+        self._in_flight_dict = {}
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> Tuple[T, float]:
+        entry: CacheEntry[T] | None = self._entry_dict.get(key)
+
+        if entry is not None and entry.age_seconds < self.ttl_seconds:
+            self.hits += 1
+            return entry.value, entry.age_seconds
+
+        if entry is not None and entry.age_seconds < self.ttl_seconds + self.max_stale_seconds:
+            #   Stale-while-revalidate: the caller gets the stale value immediately while a single refresh runs in the background
+            self.stale_hits += 1
+            self._refresh(key, loader)
+            return entry.value, entry.age_seconds
+
+        self.misses += 1
+        #   Shielded so that a caller which is cancelled (e.g. the client disconnected) does not cancel the load for the other callers
+        value: T = await asyncio.shield(self._refresh(key, loader))
+        return value, 0.0
+
+    def invalidate(self, key: Hashable | None = None) -> None:
+        #   Loads that are already in flight may have read the upstream before the invalidation, so they are detached and their results discarded, while those of the other keys are kept
+        if key is None:
+            self._generation += 1
+            self._entry_dict.clear()
+            self._in_flight_dict.clear()
+        else:
+            self._generation_dict[key] = self._generation_dict.get(key, 0) + 1
+            self._entry_dict.pop(key, None)
+            self._in_flight_dict.pop(key, None)
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> "asyncio.Task[T]":
+        #   Single-flight: concurrent callers share the in-flight upstream call instead of each making their own
+        task: asyncio.Task[T] | None = self._in_flight_dict.get(key)
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.create_task(self._load(key, loader))
+            task.add_done_callback(lambda t: self._on_refreshed(key, t))
+            self._in_flight_dict[key] = task
+
+        return task
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> T:
+        generation: Tuple[int, int] = self._get_generation(key)
+        value: T = await loader()
+        if generation == self._get_generation(key):
+            self._entry_dict[key] = CacheEntry(value=value, updated_at=time.monotonic())
+
+        return value
+
+    def _get_generation(self, key: Hashable) -> Tuple[int, int]:
+        return self._generation, self._generation_dict.get(key, 0)
+
+    def _on_refreshed(self, key: Hashable, task: "asyncio.Task[Any]") -> None:
+        if self._in_flight_dict.get(key) is task:
+            del self._in_flight_dict[key]
+
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Refreshing '{key}' in the {self.name} cache failed: {task.exception()!r}")
@@ -0,0 +1,138 @@
+import datetime
+import re
+from decimal import Decimal
+from enum import Enum
+from functools import lru_cache
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+from sirius.common import DataClass
+
+MONTH_DICT: Dict[str, int] = {month: index for index, month in enumerate(["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"], start=1)}
+#   e.g. "QQQ    SEP2025 610 C [QQQ   250919C00610000 100]" (option), "ES     DEC2025 6000 C [EW4Z5 C6000 50]" and "NQ     MAR2026 23500 P" (future's options)
+OPTION_DESCRIPTION_PATTERN: re.Pattern[str] = re.compile(r"^(?P<underlying>\S+)\s+(?P<month>[A-Z]{3})(?P<year>\d{4})\s+(?P<strike>\d+(?:\.\d+)?)\s+(?P<right>[CP])(?:\s+\[(?P<local_symbol>\S+(?:\s+\S+)?)\s+(?P<multiplier>\d+)\])?\s*$")
+#   e.g. "QQQ   250919C00610000" (OCC option symbol, which is the only local symbol with the exact expiry date)
+OCC_SYMBOL_PATTERN: re.Pattern[str] = re.compile(r"^\S{1,6}\s*(?P<expiry_date>\d{6})[CP]\d{8}$")
+#   e.g. "NQ       MAR2026" (future)
+FUTURE_DESCRIPTION_PATTERN: re.Pattern[str] = re.compile(r"^(?P<underlying>\S+)\s+(?P<month>[A-Z]{3})(?P<year>\d{4})\s*$")
+EXPIRY_BUCKET_LIST: List[Tuple[str, int]] = [("EXPIRED", 0), ("0-7 DAYS", 8), ("8-30 DAYS", 31), ("31-90 DAYS", 91), ("91-365 DAYS", 366), ("OVER 365 DAYS", np.iinfo(np.int32).max)]
+NO_EXPIRY_BUCKET: str = "NO EXPIRY"
+
+
+class OptionRight(Enum):
+    CALL = "CALL"
+    PUT = "PUT"
+
+
+class ContractDetails(DataClass):
+    underlying: str
+    expiry_date: datetime.date | None = None
+    expiry_month: str | None = None
+    strike: Decimal | None = None
+    right: OptionRight | None = None
+    multiplier: int | None = None
+
+    @property
+    def is_multiplier_required(self) -> bool:
+        return self.expiry_month is not None
+
+
+class ExposureGroup(DataClass):
+    name: str
+    currency: str
+    market_value: Decimal
+    unrealized_pnl: Decimal
+    number_of_contracts: int
+
+
+class PortfolioAnalytics(DataClass):
+    by_underlying: List[ExposureGroup]
+    by_expiry_bucket: List[ExposureGroup]
+    by_currency: List[ExposureGroup]
+    unknown_multiplier_contract_list: List[str] = []
+
+
+def get_last_day_of_month(year: int, month: int) -> datetime.date:
+    return datetime.date(year + month // 12, month % 12 + 1, 1) - datetime.timedelta(days=1)
+
+
+@lru_cache(maxsize=4096)
+def parse_contract_description(description: str) -> ContractDetails:
+    option_match: re.Match[str] | None = OPTION_DESCRIPTION_PATTERN.match(description)
+    if option_match is not None:
+        occ_symbol_match: re.Match[str] | None = OCC_SYMBOL_PATTERN.match(option_match["local_symbol"]) if option_match["local_symbol"] is not None else None
+        return ContractDetails(
+            underlying=option_match["underlying"],
+            expiry_date=datetime.datetime.strptime(occ_symbol_match["expiry_date"], "%y%m%d").date() if occ_symbol_match is not None else None,
+            expiry_month=f"{option_match["year"]}-{MONTH_DICT[option_match["month"]]:02d}",
+            strike=Decimal(option_match["strike"]),
+            right=OptionRight.CALL if option_match["right"] == "C" else OptionRight.PUT,
+            multiplier=int(option_match["multiplier"]) if option_match["multiplier"] is not None else None,
+        )
+
+    future_match: re.Match[str] | None = FUTURE_DESCRIPTION_PATTERN.match(description)
+    if future_match is not None and future_match["month"] in MONTH_DICT:
+        return ContractDetails(underlying=future_match["underlying"], expiry_month=f"{future_match["year"]}-{MONTH_DICT[future_match["month"]]:02d}")
+
+    return ContractDetails(underlying=description.strip())
+
+
+def get_expiry(contract_details: ContractDetails) -> datetime.date | None:
+    if contract_details.expiry_date is not None:
+        return contract_details.expiry_date
+    elif contract_details.expiry_month is not None:
+        #   Only the month is known for futures and futures' options, so they are bucketed by the end of their expiry month
+        year, month = (int(part) for part in contract_details.expiry_month.split("-"))
+        return get_last_day_of_month(year, month)
+
+    return None
+
+
+def get_exposure_group_list(name_array: np.ndarray, currency_array: np.ndarray, market_value_array: np.ndarray, unrealized_pnl_array: np.ndarray) -> List[ExposureGroup]:
+    group_array, group_index_array = np.unique(np.char.add(np.char.add(name_array, "\t"), currency_array), return_inverse=True)
+    market_value_sum_array: np.ndarray = np.bincount(group_index_array, weights=market_value_array, minlength=len(group_array))
+    unrealized_pnl_sum_array: np.ndarray = np.bincount(group_index_array, weights=unrealized_pnl_array, minlength=len(group_array))
+    count_array: np.ndarray = np.bincount(group_index_array, minlength=len(group_array))
+    exposure_group_list: List[ExposureGroup] = [
+        ExposureGroup(name=str(group).split("\t")[0], currency=str(group).split("\t")[1], market_value=round(Decimal(float(market_value)), 2), unrealized_pnl=round(Decimal(float(unrealized_pnl)), 2), number_of_contracts=int(count))
+        for group, market_value, unrealized_pnl, count in zip(group_array, market_value_sum_array, unrealized_pnl_sum_array, count_array)
+    ]
+
+    return sorted(exposure_group_list, key=lambda exposure_group: abs(exposure_group.market_value), reverse=True)
+
+
+def get_portfolio_analytics(contract_list: List[Any], today: datetime.date | None = None) -> PortfolioAnalytics:
+    today = datetime.date.today() if today is None else today
+    if len(contract_list) == 0:
+        return PortfolioAnalytics(by_underlying=[], by_expiry_bucket=[], by_currency=[])
+
+    position_array: np.ndarray = np.array([float(contract.position) for contract in contract_list])
+    market_price_array: np.ndarray = np.array([float(contract.market_value) for contract in contract_list])
+    average_cost_array: np.ndarray = np.array([float(contract.average_cost) for contract in contract_list])
+    #   Stocks and bonds have no multiplier, while that of futures and futures' options is not always in the description, so it is left unknown (NaN) rather than assumed to be 1
+    multiplier_array: np.ndarray = np.array([contract.details.multiplier if contract.details.multiplier is not None else np.nan if contract.details.is_multiplier_required else 1 for contract in contract_list], dtype=np.float64)
+    gateway_market_value_array: np.ndarray = np.array([float(contract.position_value) if contract.position_value is not None else np.nan for contract in contract_list])
+    gateway_unrealized_pnl_array: np.ndarray = np.array([float(contract.unrealized_pnl) if contract.unrealized_pnl is not None else np.nan for contract in contract_list])
+
+    #   The gateway's market value and unrealized P&L already include the multiplier, so they are preferred over the computed ones
+    market_value_array: np.ndarray = np.where(np.isnan(gateway_market_value_array), position_array * market_price_array * multiplier_array, gateway_market_value_array)
+    unrealized_pnl_array: np.ndarray = np.where(np.isnan(gateway_unrealized_pnl_array), position_array * (market_price_array - average_cost_array) * multiplier_array, gateway_unrealized_pnl_array)
+    is_valued_array: np.ndarray = ~np.isnan(market_value_array) & ~np.isnan(unrealized_pnl_array)
+    unknown_multiplier_contract_list: List[str] = [contract.description for contract, is_valued in zip(contract_list, is_valued_array) if not is_valued]
+
+    contract_list = [contract for contract, is_valued in zip(contract_list, is_valued_array) if is_valued]
+    market_value_array, unrealized_pnl_array = market_value_array[is_valued_array], unrealized_pnl_array[is_valued_array]
+    currency_array: np.ndarray = np.array([contract.currency.value for contract in contract_list], dtype=str)
+    underlying_array: np.ndarray = np.array([contract.details.underlying for contract in contract_list], dtype=str)
+    expiry_list: List[datetime.date | None] = [get_expiry(contract.details) for contract in contract_list]
+    days_to_expiry_array: np.ndarray = np.array([(expiry - today).days if expiry is not None else -1 for expiry in expiry_list], dtype=np.int64)
+
+    bucket_array: np.ndarray = np.array([bucket for bucket, _ in EXPIRY_BUCKET_LIST])[np.searchsorted(np.array([upper_bound for _, upper_bound in EXPIRY_BUCKET_LIST]), days_to_expiry_array, side="right")]
+    bucket_array = np.where(np.array([expiry is None for expiry in expiry_list]), NO_EXPIRY_BUCKET, bucket_array)
+
+    return PortfolioAnalytics(
+        by_underlying=get_exposure_group_list(underlying_array, currency_array, market_value_array, unrealized_pnl_array),
+        by_expiry_bucket=get_exposure_group_list(bucket_array, currency_array, market_value_array, unrealized_pnl_array),
+        by_currency=get_exposure_group_list(currency_array, currency_array, market_value_array, unrealized_pnl_array),
+        unknown_multiplier_contract_list=unknown_multiplier_contract_list,
+    )
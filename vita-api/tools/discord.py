@@ -1,12 +1,34 @@
+import asyncio
 import base64
-from typing import List
+import json
+import mimetypes
+import os
+from typing import List, Dict, Any, Tuple
 
-from fastapi import APIRouter, Response, status
+import httpx
+from fastapi import APIRouter, HTTPException, status, UploadFile, File, Form
 from sirius import common
 from sirius.common import DataClass
-from sirius.communication.discord import Server, TextChannel, Bot, DiscordMedia
+from sirius.communication.discord import Server, TextChannel, Bot, DiscordMedia, constants
 
+from tools.metrics import Stage, measure
+from tools.outbox import DiscordOutbox, OutboxMessage, OutboxFullException
+
+DISCORD_MAX_ATTACHMENT_SIZE_BYTES: int = int(os.getenv("DISCORD_MAX_ATTACHMENT_SIZE_BYTES", str(10 * 1024 * 1024)))
+DISCORD_MAX_UPLOAD_SIZE_BYTES: int = int(os.getenv("DISCORD_MAX_UPLOAD_SIZE_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE_BYTES: int = 64 * 1024
+FILE_SIGNATURE_LIST: List[Tuple[bytes, int, str]] = [
+    (b"\xff\xd8\xff", 0, "jpg"),
+    (b"\x89PNG\r\n\x1a\n", 0, "png"),
+    (b"GIF8", 0, "gif"),
+    (b"WEBP", 8, "webp"),
+    (b"ftyp", 4, "mp4"),
+    (b"%PDF", 0, "pdf"),
+]
 router = APIRouter()
+_text_channel: TextChannel | None = None
+_text_channel_lock = asyncio.Lock()
+_authorization_header_dict: Dict[str, str] | None = None
 
 
 class Media(DataClass):
@@ -19,16 +41,140 @@ class SendMessage(DataClass):
     media_list: List[Media] | None = []
 
 
-@router.post("/send_message", summary="Sends a message on Discord")
-async def send_message(message: SendMessage) -> Response:
-    server_name: str = common.get_environmental_secret("DISCORD_SERVER_NAME")
-    channel_name: str = common.get_environmental_secret("DISCORD_CHANNEL_NAME")
-    bot: Bot = await Bot.get()
-    server_list: List[Server] = await Server.get_all_servers(bot)
-    server: Server = next(filter(lambda s: s.name == server_name, server_list))
-    channel_list: List[TextChannel] = await TextChannel.get_all(server)
-    channel: TextChannel = next(filter(lambda t: t.name == channel_name, channel_list))
-    media_list: List[DiscordMedia] = [DiscordMedia(media=base64.b64decode(media.media_base64), file_extension=media.file_extension) for media in message.media_list]
+class MediaTooLargeException(Exception):
+    pass
+
+
+class UnsupportedMediaException(Exception):
+    pass
+
+
+def get_file_extension(content: bytes, declared_file_extension: str | None) -> str:
+    #   The content's signature takes precedence over the declared extension, which clients have been known to mislabel
+    for signature, offset, file_extension in FILE_SIGNATURE_LIST:
+        if content[offset:offset + len(signature)] == signature:
+            return file_extension
+
+    if declared_file_extension:
+        return declared_file_extension.lstrip(".").lower()
+
+    raise UnsupportedMediaException("The type of the media could not be detected and no file extension was provided")
+
+
+def get_discord_media_list(content_list: List[Tuple[bytes, str | None]]) -> List[DiscordMedia]:
+    if any(len(content) > DISCORD_MAX_ATTACHMENT_SIZE_BYTES for content, _ in content_list):
+        raise MediaTooLargeException(f"Each media file must be at most {DISCORD_MAX_ATTACHMENT_SIZE_BYTES} bytes")
+    if sum(len(content) for content, _ in content_list) > DISCORD_MAX_UPLOAD_SIZE_BYTES:
+        raise MediaTooLargeException(f"The media files must be at most {DISCORD_MAX_UPLOAD_SIZE_BYTES} bytes in total")
+
+    return [DiscordMedia(media=content, file_extension=get_file_extension(content, declared_file_extension)) for content, declared_file_extension in content_list]
+
+
+async def read_upload(upload_file: UploadFile) -> bytes:
+    chunk_list: List[bytes] = []
+    size: int = 0
+
+    while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE_BYTES):
+        size += len(chunk)
+        if size > DISCORD_MAX_ATTACHMENT_SIZE_BYTES:
+            raise MediaTooLargeException(f"Each media file must be at most {DISCORD_MAX_ATTACHMENT_SIZE_BYTES} bytes")
+        chunk_list.append(chunk)
+
+    return b"".join(chunk_list)
+
+
+def submit_message(message: str, media_list: List[DiscordMedia]) -> OutboxMessage:
+    try:
+        return outbox.submit(message, media_list)
+    except OutboxFullException as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "5"})
+
+
+async def get_text_channel() -> TextChannel:
+    global _text_channel
+    if _text_channel is None:
+        async with _text_channel_lock:
+            if _text_channel is None:
+                server_name: str = common.get_environmental_secret("DISCORD_SERVER_NAME")
+                channel_name: str = common.get_environmental_secret("DISCORD_CHANNEL_NAME")
+                bot: Bot = await Bot.get()
+                server_list: List[Server] = await Server.get_all_servers(bot)
+                server: Server = next(filter(lambda s: s.name == server_name, server_list))
+                channel_list: List[TextChannel] = await TextChannel.get_all(server)
+                _text_channel = next(filter(lambda t: t.name == channel_name, channel_list))
+
+    return _text_channel
+
+
+def get_authorization_header_dict() -> Dict[str, str]:
+    global _authorization_header_dict
+    if _authorization_header_dict is None:
+        _authorization_header_dict = {"Authorization": f"Bot {common.get_environmental_secret("DISCORD_BOT_TOKEN")}"}
+
+    return _authorization_header_dict
+
+
+async def post_message(message: str, media_list: List[DiscordMedia]) -> httpx.Response:
+    #   Unlike TextChannel.send_message, which fires the request and forgets it, the response is returned so that the outbox can retry and pace on it
+    #   The raw client is used for that, so the bot's Authorization header, which the SDK's session adds to its own requests, is set here
+    channel: TextChannel = await get_text_channel()
+    url: str = constants.ENDPOINT__CHANNEL__SEND_MESSAGE.replace("$channelID", str(channel.id))
+    data: Dict[str, Any] = {"content": message}
+    file_dict: Dict[str, Tuple[str, bytes, str]] = {}
+
+    for index, media in enumerate(media_list):
+        file_name: str = f"media_{index}.{media.file_extension.replace(".", "")}"
+        file_dict[f"files[{index}]"] = (file_name, media.media, mimetypes.guess_type(file_name)[0] or "application/octet-stream")
+
+    with measure(Stage.DISCORD_SEND):
+        if len(file_dict) > 0:
+            return await channel.http_session.client.post(url, data={"payload_json": json.dumps(data)}, files=file_dict, headers=get_authorization_header_dict())
+
+        return await channel.http_session.client.post(url, json=data, headers=get_authorization_header_dict())
+
+
+outbox: DiscordOutbox = DiscordOutbox(post_message)
+
+
+async def start() -> None:
+    outbox.start()
+    try:
+        await get_text_channel()
+    except Exception:
+        #   The channel is resolved again on the first message, so a Discord outage at startup does not prevent the service from starting
+        pass
+
+
+@router.post("/send_message", status_code=status.HTTP_202_ACCEPTED, summary="Queues a message to be sent on Discord", description="Returns immediately with the message's ID; use /discord/messages/{message_id} to check if it has been sent. Messages queued within a short window of each other are sent together.")
+async def send_message(message: SendMessage) -> OutboxMessage:
+    try:
+        media_list: List[DiscordMedia] = get_discord_media_list([(base64.b64decode(media.media_base64), media.file_extension) for media in message.media_list])
+    except MediaTooLargeException as e:
+        raise HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail=str(e))
+    except UnsupportedMediaException as e:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+
+    return submit_message(message.message, media_list)
+
+
+@router.post("/send_message/multipart", status_code=status.HTTP_202_ACCEPTED, summary="Queues a message with media files, uploaded as multipart/form-data, to be sent on Discord",
+             description="Same as /discord/send_message, but the media files are sent as raw file parts instead of base64 encoded JSON. The type of each file is detected from its content, falling back to the uploaded file name's extension.")
+async def send_multipart_message(message: str = Form(...), media_list: List[UploadFile] = File([])) -> OutboxMessage:
+    try:
+        content_list: List[Tuple[bytes, str | None]] = [(await read_upload(upload_file), os.path.splitext(upload_file.filename or "")[1] or None) for upload_file in media_list]
+        discord_media_list: List[DiscordMedia] = get_discord_media_list(content_list)
+    except MediaTooLargeException as e:
+        raise HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail=str(e))
+    except UnsupportedMediaException as e:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+
+    return submit_message(message, discord_media_list)
+
+
+@router.get("/messages/{message_id}", summary="Returns the delivery status of a queued Discord message")
+async def get_message_status(message_id: str) -> OutboxMessage:
+    message: OutboxMessage | None = outbox.get_message(message_id)
+    if message is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Message '{message_id}' does not exist or is too old")
 
-    channel.send_message(message.message, media_list=media_list)
-    return Response(status_code=status.HTTP_200_OK)
+    return message
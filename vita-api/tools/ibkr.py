@@ -1,16 +1,65 @@
 import asyncio
+import os
 from decimal import Decimal
-from typing import List, Dict
+from functools import partial
+from typing import List, Dict, Any, Tuple
 
 import httpx
-from fastapi import APIRouter
+from fastapi import APIRouter, Request, Response, status
 from sirius import common
 from sirius.common import DataClass, Currency
-from sirius.http_requests import AsyncHTTPSession, HTTPResponse
 
+from tools.cache import AsyncTTLCache
+from tools.contracts import ContractDetails, PortfolioAnalytics, parse_contract_description, get_portfolio_analytics
+from tools.metrics import Stage, measure
+from tools.responses import get_conditional_response
+
+IBKR_MAX_CONCURRENT_REQUESTS: int = int(os.getenv("IBKR_MAX_CONCURRENT_REQUESTS", "4"))
+IBKR_READ_TIMEOUT_SECONDS: float = float(os.getenv("IBKR_READ_TIMEOUT_SECONDS", "30"))
+IBKR_ACCOUNTS_CACHE_TTL_SECONDS: float = float(os.getenv("IBKR_ACCOUNTS_CACHE_TTL_SECONDS", "3600"))
+IBKR_POSITIONS_CACHE_TTL_SECONDS: float = float(os.getenv("IBKR_POSITIONS_CACHE_TTL_SECONDS", "30"))
+IBKR_CACHE_MAX_STALE_SECONDS: float = float(os.getenv("IBKR_CACHE_MAX_STALE_SECONDS", "300"))
+IBKR_POSITIONS_PAGE_SIZE: int = 100
 router = APIRouter()
-_account_list: List["IBKRAccount"] = []
-_account_list_lock = asyncio.Lock()
+account_cache: AsyncTTLCache[List["IBKRAccount"]] = AsyncTTLCache("IBKR accounts", IBKR_ACCOUNTS_CACHE_TTL_SECONDS, IBKR_CACHE_MAX_STALE_SECONDS)
+position_cache: AsyncTTLCache[List["Contract"]] = AsyncTTLCache("IBKR positions", IBKR_POSITIONS_CACHE_TTL_SECONDS, IBKR_CACHE_MAX_STALE_SECONDS)
+_ibkr_client: httpx.AsyncClient | None = None
+_ibkr_request_semaphore: asyncio.Semaphore | None = None
+_ibkr_event_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_ibkr_client() -> httpx.AsyncClient:
+    global _ibkr_client, _ibkr_request_semaphore, _ibkr_event_loop
+    #   The pooled connections belong to the event loop they were opened on, so the client is recreated if the loop changes
+    if _ibkr_client is None or _ibkr_event_loop is not asyncio.get_running_loop():
+        _ibkr_event_loop = asyncio.get_running_loop()
+        _ibkr_request_semaphore = asyncio.Semaphore(IBKR_MAX_CONCURRENT_REQUESTS)
+        _ibkr_client = httpx.AsyncClient(
+            base_url=common.get_environmental_secret("IBKR_SERVICE_BASE_URL"),
+            verify=False,
+            limits=httpx.Limits(max_connections=IBKR_MAX_CONCURRENT_REQUESTS, max_keepalive_connections=IBKR_MAX_CONCURRENT_REQUESTS),
+            timeout=httpx.Timeout(connect=5.0, read=IBKR_READ_TIMEOUT_SECONDS, write=10.0, pool=IBKR_READ_TIMEOUT_SECONDS),
+        )
+
+    return _ibkr_client
+
+
+async def close_ibkr_client() -> None:
+    global _ibkr_client, _ibkr_event_loop
+    if _ibkr_client is not None and _ibkr_event_loop is asyncio.get_running_loop():
+        await _ibkr_client.aclose()
+
+    _ibkr_client, _ibkr_event_loop = None, None
+
+
+async def get_ibkr_data(path: str) -> Any:
+    ibkr_client: httpx.AsyncClient = get_ibkr_client()
+    async with _ibkr_request_semaphore:
+        with measure(Stage.IBKR_UPSTREAM):
+            response: httpx.Response = await ibkr_client.get(path)
+
+    response.raise_for_status()
+    return response.json()
 
 
 class Contract(DataClass):
@@ -19,18 +68,26 @@ class Contract(DataClass):
     position: Decimal
     average_cost: Decimal
     market_value: Decimal
+    position_value: Decimal | None = None
+    unrealized_pnl: Decimal | None = None
     type: str
+    details: ContractDetails
 
     @staticmethod
     async def get_all(account_id: str) -> List["Contract"]:
         contract_type_dict: Dict[str, str] = {"STK": "Stock", "OPT": "Option", "FUT": "Future", "FOP": "Future's Option", "BND": "Bond"}
-        base_url: str = common.get_environmental_secret("IBKR_SERVICE_BASE_URL")
-        url: str = f"{base_url}/portfolio/{account_id}/positions/"
-        session: AsyncHTTPSession = AsyncHTTPSession(base_url)
+        position_list: List[Dict[str, Any]] = []
+        page_number: int = 0
+
+        while True:
+            #   The gateway returns the positions in pages of up to 100, so a full page means there could be another one
+            page: List[Dict[str, Any]] = await get_ibkr_data(f"/portfolio/{account_id}/positions/{page_number}")
+            position_list.extend(page)
+            if len(page) < IBKR_POSITIONS_PAGE_SIZE:
+                break
+
+            page_number += 1
 
-        await session.client.aclose()
-        session.client = httpx.AsyncClient(verify=False)
-        response: HTTPResponse = await session.get(url)
         return [
             Contract(
                 description=data["contractDesc"],
@@ -38,9 +95,12 @@ class Contract(DataClass):
                 position=Decimal(str(data["position"])),
                 average_cost=Decimal(str(data["avgPrice"])),
                 market_value=Decimal(str(data["mktPrice"])),
+                position_value=Decimal(str(data["mktValue"])) if data.get("mktValue") is not None else None,
+                unrealized_pnl=Decimal(str(data["unrealizedPnl"])) if data.get("unrealizedPnl") is not None else None,
                 type=contract_type_dict[data['assetClass']],
+                details=parse_contract_description(data["contractDesc"]),
             )
-            for data in response.data
+            for data in position_list
         ]
 
 
@@ -51,60 +111,39 @@ class IBKRAccount(DataClass):
 
     @staticmethod
     async def get_all_ibkr_accounts() -> List["IBKRAccount"]:
-        global _account_list
-        if len(_account_list) == 0:
-            async with _account_list_lock:
-                if len(_account_list) == 0:
-                    base_url: str = common.get_environmental_secret("IBKR_SERVICE_BASE_URL")
-                    url: str = f"{base_url}/portfolio/accounts/"
-                    session: AsyncHTTPSession = AsyncHTTPSession(base_url)
-
-                    await session.client.aclose()
-                    session.client = httpx.AsyncClient(verify=False)
-                    response: HTTPResponse = await session.get(url)
-
-                    _account_list = [IBKRAccount(id=data["id"], name=data["accountAlias"] if data["accountAlias"] else data["id"]) for data in response.data]
-
-        return _account_list
-
-
-@router.get(
-    "/account_summary",
-    summary="Retrieves the Account Summary from all Interactive Brokers accounts.",
-    description=(
-            f"Note:\n"
-            "    - Use the following examples to decode the pattern of the Contract Description\n"
-            "        - An Option with a contract description of \"QQQ    SEP2025 610 C [QQQ   250919C00610000 100]\" can be decoded as\n"
-            "            - Underlying Ticker: QQQ\n"
-            "            - Strike Price: $610\n"
-            "            - Type of Option: Call (because of the 'C' after in '610')\n"
-            "            - Expiry: 2019-09-25 (because of the '250919' in the '250919C00610000')\n"
-            "            - Multiplier: 100 (because of the '100' after the '250919C00610000')\n"
-            "        - An Option with a contract description of \"QQQ    SEP2025 610 P [QQQ   250919C00610000 100]\" can be decoded as\n"
-            "            - Underlying Ticker: QQQ\n"
-            "            - Strike Price: $610\n"
-            "            - Type of Option: Put (because of the 'P' after in '610')\n"
-            "            - Expiry: 2019-09-25 (because of the '250919' in the '250919C00610000')\n"
-            "            - Multiplier: 100 (because of the '100' after the '250919C00610000')\n"
-            "        - A Future's Option with a contract description of \"NQ     MAR2026 23500 P\" can be decoded as\n"
-            "            - Future's Ticker: NQ\n"
-            "            - Future's Expiry: March 2026\n"
-            "            - Strike Price: $23,500\n"
-            "            - Type of Option: Put (because of the 'P' after in '23500')\n"
-            "            - Future's Option's Expiry: March 2026\n"
-            "        - A Future's Option with a contract description of \"NQ     MAR2026 26500 C\" can be decoded as\n"
-            "            - Future's Ticker: NQ\n"
-            "            - Future's Expiry: March 2026\n"
-            "            - Strike Price: $26,500\n"
-            "            - Type of Option: Call (because of the 'C' after in '26500')\n"
-            "            - Future's Option's Expiry: March 2026\n"
-            "        - A Future with a contract description of \"NQ       MAR2026\" can be decoded as\n"
-            "            - Future's Ticker: NQ\n"
-            "            - Future's Expiry: March 2026\n"
-    ))
-async def get_ibkr_account_summary() -> List[IBKRAccount]:
-    account_list: List[IBKRAccount] = await IBKRAccount.get_all_ibkr_accounts()
-    for account in account_list:
-        account.contract_list = await Contract.get_all(account.id)
-
-    return account_list
+        account_data_list: List[Dict[str, Any]] = await get_ibkr_data("/portfolio/accounts/")
+        return [IBKRAccount(id=data["id"], name=data["accountAlias"] if data["accountAlias"] else data["id"]) for data in account_data_list]
+
+
+async def get_all_accounts_with_contracts() -> Tuple[List[IBKRAccount], float]:
+    account_list, account_list_age_seconds = await account_cache.get("accounts", IBKRAccount.get_all_ibkr_accounts)
+    cached_contract_list_list: List[Tuple[List[Contract], float]] = await asyncio.gather(*[position_cache.get(account.id, partial(Contract.get_all, account.id)) for account in account_list])
+
+    #   The age is that of the oldest data, and the cached accounts are copied rather than mutated
+    age_seconds: float = max([account_list_age_seconds] + [contract_list_age_seconds for _, contract_list_age_seconds in cached_contract_list_list])
+    return [account.model_copy(update={"contract_list": contract_list}) for account, (contract_list, _) in zip(account_list, cached_contract_list_list)], age_seconds
+
+
+@router.get("/account_summary", summary="Retrieves the Account Summary from all Interactive Brokers accounts.", response_model=List[IBKRAccount],
+            description="Each contract includes its details parsed from the contract description: the underlying, the expiry (the exact date for options, and only the month for futures and futures' options), the strike, the right (CALL or PUT) and the multiplier, where applicable.")
+async def get_ibkr_account_summary(request: Request) -> Response:
+    account_list, age_seconds = await get_all_accounts_with_contracts()
+    return get_conditional_response(request, account_list, {"Age": str(int(age_seconds))})
+
+
+@router.get("/portfolio_analytics", summary="Aggregates the positions of all Interactive Brokers accounts by underlying, by expiry bucket and by currency.", response_model=PortfolioAnalytics,
+            description="For each group, the market value and the unrealized P&L reported by the gateway are summed per currency, without any currency conversion. "
+                        "When the gateway does not report them, they are computed as position x market price x multiplier and position x (market price - average cost) x multiplier. "
+                        "Futures and futures' options without the gateway's values and without a multiplier in their description are listed in unknown_multiplier_contract_list instead of being summed.")
+async def get_ibkr_portfolio_analytics(request: Request) -> Response:
+    account_list, age_seconds = await get_all_accounts_with_contracts()
+    return get_conditional_response(request, get_portfolio_analytics([contract for account in account_list for contract in account.contract_list]), {"Age": str(int(age_seconds))})
+
+
+@router.post("/cache/invalidate", summary="Clears the cached accounts and positions, so that the next request fetches them from the gateway. If an account ID is provided, only that account's positions are cleared.")
+async def invalidate_cache(account_id: str | None = None) -> Response:
+    if account_id is None:
+        account_cache.invalidate()
+
+    position_cache.invalidate(account_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,110 @@
+import datetime
+import hashlib
+import os
+import sqlite3
+import threading
+from decimal import Decimal
+from typing import List, Tuple, Set
+
+from sirius.common import Currency, DataClass
+from sirius.wise import Transaction
+
+WISE_LEDGER_PATH: str = os.getenv("WISE_LEDGER_PATH", "wise_ledger.sqlite3")
+WISE_LEDGER_BACKFILL_DAYS: int = int(os.getenv("WISE_LEDGER_BACKFILL_DAYS", "30"))
+WISE_LEDGER_SYNC_OVERLAP_SECONDS: float = float(os.getenv("WISE_LEDGER_SYNC_OVERLAP_SECONDS", "300"))
+WISE_LEDGER_MAX_HISTORY_DAYS: int = int(os.getenv("WISE_LEDGER_MAX_HISTORY_DAYS", "365"))
+_ledger: "TransactionLedger | None" = None
+_ledger_lock: threading.Lock = threading.Lock()
+
+
+class LedgerTransaction(DataClass):
+    id: str
+    description: str
+    currency: Currency
+    amount: Decimal
+    running_balance: Decimal
+    timestamp: datetime.datetime
+
+
+def get_transaction_id(transaction: Transaction) -> str:
+    #   The Wise statement does not expose a stable ID in the compact format, so one is derived from the fields that identify a statement line
+    return hashlib.sha1(f"{transaction.currency.value}|{transaction.timestamp.isoformat()}|{transaction.amount}|{transaction.running_balance}|{transaction.description}".encode("utf-8")).hexdigest()
+
+
+class TransactionLedger:
+    connection: sqlite3.Connection
+    _lock: threading.Lock
+
+    def __init__(self, path: str = WISE_LEDGER_PATH) -> None:
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS wise_transaction (id TEXT PRIMARY KEY, currency TEXT NOT NULL, timestamp REAL NOT NULL, description TEXT NOT NULL, amount TEXT NOT NULL, running_balance TEXT NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS wise_transaction_currency_timestamp ON wise_transaction (currency, timestamp)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS wise_sync_state (currency TEXT PRIMARY KEY, synced_from REAL, synced_until REAL NOT NULL)")
+            column_set: Set[str] = {row[1] for row in self.connection.execute("PRAGMA table_info(wise_sync_state)")}
+            if "synced_from" not in column_set:
+                self.connection.execute("ALTER TABLE wise_sync_state ADD COLUMN synced_from REAL")
+
+    def get_sync_window(self, currency: Currency, time_now: datetime.datetime) -> Tuple[datetime.datetime, datetime.datetime]:
+        with self._lock:
+            row: Tuple[float] | None = self.connection.execute("SELECT synced_until FROM wise_sync_state WHERE currency = ?", (currency.value,)).fetchone()
+
+        #   The window overlaps the previous sync slightly so that transactions that are posted late are still picked up; the overlap is deduplicated by ID
+        from_time: datetime.datetime = time_now - datetime.timedelta(days=WISE_LEDGER_BACKFILL_DAYS) if row is None else datetime.datetime.fromtimestamp(row[0], tz=datetime.timezone.utc) - datetime.timedelta(seconds=WISE_LEDGER_SYNC_OVERLAP_SECONDS)
+        return from_time, time_now
+
+    def get_backfill_window(self, currency: Currency, from_time: datetime.datetime) -> Tuple[datetime.datetime, datetime.datetime] | None:
+        with self._lock:
+            row: Tuple[float | None, float] | None = self.connection.execute("SELECT synced_from, synced_until FROM wise_sync_state WHERE currency = ?", (currency.value,)).fetchone()
+
+        #   Ledgers that were created before the start of the synced range was stored are assumed to be synced only from their last sync
+        synced_from: float | None = None if row is None else row[0] if row[0] is not None else row[1]
+        if synced_from is not None and from_time.timestamp() >= synced_from:
+            return None
+
+        to_time: datetime.datetime = datetime.datetime.now(datetime.timezone.utc) if synced_from is None else datetime.datetime.fromtimestamp(synced_from + WISE_LEDGER_SYNC_OVERLAP_SECONDS, tz=datetime.timezone.utc)
+        return from_time.astimezone(datetime.timezone.utc), to_time
+
+    def add_transactions(self, currency: Currency, transaction_list: List[Transaction], synced_from: datetime.datetime, synced_until: datetime.datetime) -> int:
+        row_list: List[Tuple[str, str, float, str, str, str]] = [(get_transaction_id(transaction), currency.value, transaction.timestamp.timestamp(), transaction.description, str(transaction.amount), str(transaction.running_balance)) for transaction in transaction_list]
+        with self._lock, self.connection:
+            number_of_rows_before: int = self.connection.total_changes
+            self.connection.executemany("INSERT OR IGNORE INTO wise_transaction (id, currency, timestamp, description, amount, running_balance) VALUES (?, ?, ?, ?, ?, ?)", row_list)
+            #   The synced range only grows, as every sync and backfill overlaps the range that is already synced
+            self.connection.execute(
+                "INSERT INTO wise_sync_state (currency, synced_from, synced_until) VALUES (?, ?, ?) ON CONFLICT (currency) DO UPDATE SET synced_from = MIN(COALESCE(synced_from, excluded.synced_from), excluded.synced_from), synced_until = MAX(synced_until, excluded.synced_until)",
+                (currency.value, synced_from.timestamp(), synced_until.timestamp()),
+            )
+            return self.connection.total_changes - number_of_rows_before - 1
+
+    def get_transactions(self, currency: Currency, from_time: datetime.datetime, to_time: datetime.datetime, limit: int = 100, offset: int = 0) -> List[LedgerTransaction]:
+        with self._lock:
+            row_list: List[Tuple[str, float, str, str, str]] = self.connection.execute(
+                "SELECT id, timestamp, description, amount, running_balance FROM wise_transaction WHERE currency = ? AND timestamp >= ? AND timestamp <= ? ORDER BY timestamp DESC, id LIMIT ? OFFSET ?",
+                (currency.value, from_time.timestamp(), to_time.timestamp(), limit, offset),
+            ).fetchall()
+
+        return [LedgerTransaction(id=row[0], currency=currency, timestamp=datetime.datetime.fromtimestamp(row[1], tz=datetime.timezone.utc), description=row[2], amount=Decimal(row[3]), running_balance=Decimal(row[4])) for row in row_list]
+
+    def close(self) -> None:
+        with self._lock:
+            self.connection.close()
+
+
+def get_ledger() -> TransactionLedger:
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = TransactionLedger()
+
+        return _ledger
+
+
+def close_ledger() -> None:
+    global _ledger
+    with _ledger_lock:
+        if _ledger is not None:
+            _ledger.close()
+            _ledger = None
@@ -0,0 +1,35 @@
+import time
+from contextlib import contextmanager
+from enum import Enum
+from typing import Generator, Tuple
+
+from prometheus_client import Histogram, CONTENT_TYPE_LATEST, generate_latest
+from starlette.responses import Response
+
+LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Stage(Enum):
+    IBKR_UPSTREAM = "IBKR_UPSTREAM"
+    WISE_UPSTREAM = "WISE_UPSTREAM"
+    DISCORD_SEND = "DISCORD_SEND"
+
+
+STAGE_DURATION_SECONDS: Histogram = Histogram("vita_api_stage_duration_seconds", "Time spent in each processing stage.", ["stage"], buckets=LATENCY_BUCKETS)
+
+
+def observe_stage_duration(stage: Stage, duration_seconds: float) -> None:
+    STAGE_DURATION_SECONDS.labels(stage.value).observe(duration_seconds)
+
+
+@contextmanager
+def measure(stage: Stage) -> Generator[None, None, None]:
+    started_at: float = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage_duration(stage, time.perf_counter() - started_at)
+
+
+def get_metrics_response() -> Response:
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
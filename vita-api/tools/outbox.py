@@ -0,0 +1,183 @@
+import asyncio
+import datetime
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from enum import Enum
+from typing import List, Callable, Awaitable
+
+import httpx
+from sirius.common import DataClass
+from sirius.communication.discord import DiscordMedia
+
+DISCORD_OUTBOX_MAX_SIZE: int = int(os.getenv("DISCORD_OUTBOX_MAX_SIZE", "1000"))
+DISCORD_MAX_ATTEMPTS: int = int(os.getenv("DISCORD_MAX_ATTEMPTS", "5"))
+DISCORD_RETRY_BASE_SECONDS: float = float(os.getenv("DISCORD_RETRY_BASE_SECONDS", "1"))
+DISCORD_COALESCE_WINDOW_SECONDS: float = float(os.getenv("DISCORD_COALESCE_WINDOW_SECONDS", "1"))
+DISCORD_MAX_MESSAGE_LENGTH: int = 2000
+DISCORD_MAX_ATTACHMENTS: int = 10
+MESSAGE_STATUS_RETENTION: int = 1000
+logger = logging.getLogger(__name__)
+
+
+class OutboxFullException(Exception):
+    pass
+
+
+class MessageStatus(Enum):
+    QUEUED = "QUEUED"
+    SENT = "SENT"
+    FAILED = "FAILED"
+
+
+class OutboxMessage(DataClass):
+    id: str
+    status: MessageStatus = MessageStatus.QUEUED
+    attempts: int = 0
+    error: str | None = None
+    created_at: datetime.datetime
+    sent_at: datetime.datetime | None = None
+
+
+@dataclass
+class OutboxItem:
+    message: OutboxMessage
+    text: str
+    media_list: List[DiscordMedia]
+
+
+class DiscordOutbox:
+    send_function: Callable[[str, List[DiscordMedia]], Awaitable[httpx.Response]]
+    coalesce_window_seconds: float
+    message_dict: "OrderedDict[str, OutboxMessage]"
+    _queue: "asyncio.Queue[OutboxItem] | None" = None
+    _worker_task: "asyncio.Task[None] | None" = None
+    _next_send_at: float = 0.0
+
+    def __init__(self, send_function: Callable[[str, List[DiscordMedia]], Awaitable[httpx.Response]], coalesce_window_seconds: float = DISCORD_COALESCE_WINDOW_SECONDS) -> None:
+        self.send_function = send_function
+        self.coalesce_window_seconds = coalesce_window_seconds
+        self.message_dict = OrderedDict()
+
+    def submit(self, text: str, media_list: List[DiscordMedia]) -> OutboxMessage:
+        queue: asyncio.Queue[OutboxItem] = self._get_queue()
+        message: OutboxMessage = OutboxMessage(id=uuid.uuid4().hex, created_at=datetime.datetime.now(datetime.timezone.utc))
+
+        try:
+            queue.put_nowait(OutboxItem(message=message, text=text, media_list=media_list))
+        except asyncio.QueueFull:
+            raise OutboxFullException(f"The Discord outbox already has {queue.maxsize} messages waiting to be sent")
+
+        self.message_dict[message.id] = message
+        while len(self.message_dict) > MESSAGE_STATUS_RETENTION:
+            self.message_dict.popitem(last=False)
+
+        return message
+
+    def get_message(self, message_id: str) -> OutboxMessage | None:
+        return self.message_dict.get(message_id)
+
+    def start(self) -> None:
+        self._get_queue()
+
+    async def stop(self, timeout_seconds: float = 10.0) -> None:
+        if self._worker_task is None or self._worker_task.get_loop() is not asyncio.get_running_loop():
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout_seconds)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self._queue.qsize()} Discord messages were not sent before shutdown")
+
+        self._worker_task.cancel()
+        self._worker_task = None
+
+    def _get_queue(self) -> "asyncio.Queue[OutboxItem]":
+        #   The queue and the worker belong to the event loop they were created on, so both are recreated (keeping the queued messages) if the loop changes
+        if self._worker_task is None or self._worker_task.done() or self._worker_task.get_loop() is not asyncio.get_running_loop():
+            queue: asyncio.Queue[OutboxItem] = asyncio.Queue(maxsize=DISCORD_OUTBOX_MAX_SIZE)
+            while self._queue is not None and not self._queue.empty():
+                queue.put_nowait(self._queue.get_nowait())
+
+            self._queue = queue
+            self._worker_task = asyncio.create_task(self._run())
+
+        return self._queue
+
+    async def _run(self) -> None:
+        queue: asyncio.Queue[OutboxItem] = self._queue
+
+        while True:
+            item_list: List[OutboxItem] = [await queue.get()]
+            #   Messages that arrive within the coalescing window (e.g. several cameras alerting at once) are sent together as a single Discord message
+            deadline: float = time.monotonic() + self.coalesce_window_seconds
+            while (remaining_seconds := deadline - time.monotonic()) > 0:
+                try:
+                    item_list.append(await asyncio.wait_for(queue.get(), timeout=remaining_seconds))
+                except asyncio.TimeoutError:
+                    break
+
+            for item_group in self._get_item_groups(item_list):
+                await self._send(item_group)
+
+            for _ in item_list:
+                queue.task_done()
+
+    @staticmethod
+    def _get_item_groups(item_list: List[OutboxItem]) -> List[List[OutboxItem]]:
+        item_group_list: List[List[OutboxItem]] = []
+
+        for item in item_list:
+            last_group: List[OutboxItem] | None = item_group_list[-1] if len(item_group_list) > 0 else None
+            if last_group is not None and len("\n".join(i.text for i in last_group + [item])) <= DISCORD_MAX_MESSAGE_LENGTH and sum(len(i.media_list) for i in last_group + [item]) <= DISCORD_MAX_ATTACHMENTS:
+                last_group.append(item)
+            else:
+                item_group_list.append([item])
+
+        return item_group_list
+
+    async def _send(self, item_group: List[OutboxItem]) -> None:
+        text: str = "\n".join(item.text for item in item_group)
+        media_list: List[DiscordMedia] = [media for item in item_group for media in item.media_list]
+        error: str | None = None
+
+        for attempt in range(1, DISCORD_MAX_ATTEMPTS + 1):
+            await asyncio.sleep(max(self._next_send_at - time.monotonic(), 0.0))
+            for item in item_group:
+                item.message.attempts = attempt
+
+            try:
+                response: httpx.Response = await self.send_function(text, media_list)
+            except Exception as e:
+                error = repr(e)
+                await asyncio.sleep(DISCORD_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+                continue
+
+            #   Discord's rate limit headers tell how long to wait once the bucket is empty, so the next message is paced instead of being rejected
+            if response.headers.get("X-RateLimit-Remaining") == "0":
+                self._next_send_at = time.monotonic() + float(response.headers.get("X-RateLimit-Reset-After", "1"))
+
+            if response.is_success:
+                self._set_status(item_group, MessageStatus.SENT)
+                return
+
+            error = f"Discord responded with {response.status_code}: {response.text[:200]}"
+            if response.status_code == 429:
+                self._next_send_at = time.monotonic() + float(response.headers.get("Retry-After", "1"))
+            elif response.is_server_error:
+                await asyncio.sleep(DISCORD_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+            else:
+                break
+
+        logger.error(f"Discord message could not be sent: {error}")
+        self._set_status(item_group, MessageStatus.FAILED, error)
+
+    @staticmethod
+    def _set_status(item_group: List[OutboxItem], message_status: MessageStatus, error: str | None = None) -> None:
+        for item in item_group:
+            item.message.status = message_status
+            item.message.error = error
+            item.message.sent_at = datetime.datetime.now(datetime.timezone.utc) if message_status == MessageStatus.SENT else None
@@ -0,0 +1,50 @@
+import hashlib
+from decimal import Decimal
+from typing import Any, Dict, List
+
+import orjson
+from fastapi import Request, status
+from pydantic import BaseModel
+from starlette.responses import JSONResponse, Response
+
+
+def serialize(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    elif isinstance(value, Decimal):
+        #   Decimals are serialized as strings, as pydantic does, so that amounts are never rounded through a float
+        return str(value)
+
+    raise TypeError(f"Type {type(value).__name__} is not JSON serializable")
+
+
+def dump_json(content: Any) -> bytes:
+    return orjson.dumps(content, default=serialize, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+
+
+def get_etag(body: bytes) -> str:
+    #   Weak, because the GZip middleware may change the bytes on the wire without changing the content
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def is_etag_matched(if_none_match: str | None, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+
+    etag_list: List[str] = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    return "*" in etag_list or etag.removeprefix("W/") in etag_list
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
+
+
+def get_conditional_response(request: Request, content: Any, headers: Dict[str, str] | None = None) -> Response:
+    body: bytes = dump_json(content)
+    headers = {**(headers or {}), "ETag": get_etag(body)}
+
+    if is_etag_matched(request.headers.get("If-None-Match"), headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,14 +1,28 @@
 import asyncio
+import datetime
+import os
 from decimal import Decimal
-from typing import List
+from functools import partial
+from typing import List, Tuple
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Request, Response, status
 from sirius.common import Currency, DataClass
 from sirius.wise import WiseAccount, Account, Transaction
 
+from tools.cache import AsyncTTLCache
+from tools.ledger import LedgerTransaction, WISE_LEDGER_MAX_HISTORY_DAYS, get_ledger
+from tools.metrics import Stage, measure
+from tools.responses import get_conditional_response
+
+WISE_BALANCE_CACHE_TTL_SECONDS: float = float(os.getenv("WISE_BALANCE_CACHE_TTL_SECONDS", "30"))
+WISE_LEDGER_SYNC_INTERVAL_SECONDS: float = float(os.getenv("WISE_LEDGER_SYNC_INTERVAL_SECONDS", "60"))
 router = APIRouter()
+account_cache: AsyncTTLCache[List[Account]] = AsyncTTLCache("Wise accounts", WISE_BALANCE_CACHE_TTL_SECONDS)
+#   Each currency's ledger is synced at most once per interval, and concurrent requests share the sync that is in flight
+ledger_sync_cache: AsyncTTLCache[int] = AsyncTTLCache("Wise ledger sync", WISE_LEDGER_SYNC_INTERVAL_SECONDS)
 _wise_account: WiseAccount | None = None
 _wise_account_lock = asyncio.Lock()
+_ledger_backfill_lock = asyncio.Lock()
 
 
 class WiseAccountSummaryResponse(DataClass):
@@ -18,9 +32,11 @@ class WiseAccountSummaryResponse(DataClass):
 
 
 class WiseTransaction(DataClass):
+    id: str
     description: str
     currency: Currency
     amount: Decimal
+    timestamp: datetime.datetime
 
 
 async def get_wise_account() -> WiseAccount:
@@ -28,25 +44,58 @@ async def get_wise_account() -> WiseAccount:
     if _wise_account is None:
         async with _wise_account_lock:
             if _wise_account is None:
-                _wise_account = await WiseAccount.get()
+                with measure(Stage.WISE_UPSTREAM):
+                    _wise_account = await WiseAccount.get()
 
     return _wise_account
 
 
-@router.get("/latest_transactions", summary="Fetches the most recent transactions from a specific currency's Wise account.")
-async def get_latest_transactions(currency_str: str | None = None) -> List[WiseTransaction]:
-    currency: Currency = Currency.NZD if currency_str is None else Currency(currency_str)
+async def get_account_list() -> List[Account]:
     wise_account: WiseAccount = await get_wise_account()
-    account_list: List[Account] = await wise_account.personal_profile.account_list
+    with measure(Stage.WISE_UPSTREAM):
+        return await wise_account.personal_profile.account_list
+
+
+async def fetch_transactions(currency: Currency, from_time: datetime.datetime, to_time: datetime.datetime) -> int:
+    account_list, _ = await account_cache.get("accounts", get_account_list)
     account: Account = next(filter(lambda a: a.currency == currency, account_list))
-    transaction_list: List[Transaction] = await account.get_transactions(number_of_past_hours=24)
 
-    return [WiseTransaction(description=transaction.description, currency=currency, amount=transaction.amount) for transaction in transaction_list]
+    with measure(Stage.WISE_UPSTREAM):
+        transaction_list: List[Transaction] = await account.get_transactions(from_time=from_time, to_time=to_time)
 
+    return await asyncio.to_thread(get_ledger().add_transactions, currency, transaction_list, from_time, to_time)
+
+
+async def sync_ledger(currency: Currency) -> int:
+    from_time, to_time = await asyncio.to_thread(get_ledger().get_sync_window, currency, datetime.datetime.now(datetime.timezone.utc))
+    return await fetch_transactions(currency, from_time, to_time)
+
+
+async def backfill_ledger(currency: Currency, from_time: datetime.datetime) -> int:
+    #   Serialised so that concurrent requests for the same older window fetch it from Wise only once
+    async with _ledger_backfill_lock:
+        backfill_window: Tuple[datetime.datetime, datetime.datetime] | None = await asyncio.to_thread(get_ledger().get_backfill_window, currency, from_time)
+        return 0 if backfill_window is None else await fetch_transactions(currency, *backfill_window)
+
+
+@router.get("/latest_transactions", summary="Fetches the most recent transactions from a specific currency's Wise account.", response_model=List[WiseTransaction],
+            description="Transactions are served from a local ledger that is synced incrementally with Wise. "
+                        "By default, the transactions of the past number_of_past_hours are returned, newest first; from_time and to_time select any other window, and limit and offset paginate through it. "
+                        f"A window that starts before the synced range is backfilled from Wise first, up to {WISE_LEDGER_MAX_HISTORY_DAYS} days in the past (WISE_LEDGER_MAX_HISTORY_DAYS).")
+async def get_latest_transactions(request: Request, currency_str: str | None = None, from_time: datetime.datetime | None = None, to_time: datetime.datetime | None = None, number_of_past_hours: int = 24, limit: int = 100, offset: int = 0) -> Response:
+    currency: Currency = Currency.NZD if currency_str is None else Currency(currency_str)
+    to_time = datetime.datetime.now(datetime.timezone.utc) if to_time is None else to_time
+    from_time = to_time - datetime.timedelta(hours=number_of_past_hours) if from_time is None else from_time
+    if from_time.timestamp() < (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=WISE_LEDGER_MAX_HISTORY_DAYS)).timestamp():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"from_time can be at most {WISE_LEDGER_MAX_HISTORY_DAYS} days in the past (WISE_LEDGER_MAX_HISTORY_DAYS)")
+
+    await ledger_sync_cache.get(currency, partial(sync_ledger, currency))
+    await backfill_ledger(currency, from_time)
+    transaction_list: List[LedgerTransaction] = await asyncio.to_thread(get_ledger().get_transactions, currency, from_time, to_time, limit, offset)
+    return get_conditional_response(request, [WiseTransaction(id=transaction.id, description=transaction.description, currency=currency, amount=transaction.amount, timestamp=transaction.timestamp) for transaction in transaction_list])
 
-@router.get("/account_summary", summary="Provides a summary of all Wise cash and reserve accounts.")
-async def get_account_summary() -> List[WiseAccountSummaryResponse]:
-    wise_account: WiseAccount = await get_wise_account()
-    account_list: List[Account] = await wise_account.personal_profile.account_list
 
-    return [WiseAccountSummaryResponse(account_name=account.name, currency=account.currency, balance=account.balance) for account in account_list]
+@router.get("/account_summary", summary="Provides a summary of all Wise cash and reserve accounts.", response_model=List[WiseAccountSummaryResponse])
+async def get_account_summary(request: Request) -> Response:
+    account_list, age_seconds = await account_cache.get("accounts", get_account_list)
+    return get_conditional_response(request, [WiseAccountSummaryResponse(account_name=account.name, currency=account.currency, balance=account.balance) for account in account_list], {"Age": str(int(age_seconds))})
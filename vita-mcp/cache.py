@@ -0,0 +1,45 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar, Generic
+
+T = TypeVar("T")
+
+
+@dataclass
+class CacheEntry(Generic[T]):
+    value: T
+    expires_at: float
+
+
+class AsyncTTLCache(Generic[T]):
+    ttl_seconds: float
+    _entry_dict: Dict[Hashable, CacheEntry[T]]
+    _in_flight_dict: Dict[Hashable, "asyncio.Task[T]"]
+
+    def __init__(self, ttl_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._entry_dict = {}
+        self._in_flight_dict = {}
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> T:
+        entry: CacheEntry[T] | None = self._entry_dict.get(key)
+        if entry is not None and time.monotonic() < entry.expires_at:
+            return entry.value
+
+        #   Single-flight: concurrent calls for the same key (e.g. the same tool called twice in one turn) share a single request to vita-api
+        task: asyncio.Task[T] | None = self._in_flight_dict.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.create_task(self._load(key, loader))
+            self._in_flight_dict[key] = task
+
+        #   Shielded so that a cancelled tool call does not cancel the request for the other callers
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> T:
+        try:
+            value: T = await loader()
+            self._entry_dict[key] = CacheEntry(value=value, expires_at=time.monotonic() + self.ttl_seconds)
+            return value
+        finally:
+            self._in_flight_dict.pop(key, None)
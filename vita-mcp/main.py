@@ -1,15 +1,138 @@
+import asyncio
+import csv
+import io
 import logging
-from typing import List
+import os
+import re
+from enum import Enum
+from functools import partial
+from typing import List, Dict, Any, Tuple, Awaitable, Callable
 
 from mcp.server.fastmcp import FastMCP
 from sirius import common
 from sirius.common import Currency
 from sirius.http_requests import HTTPResponse, AsyncHTTPSession
 
+from cache import AsyncTTLCache
+
 API_BASE_URL: str = common.get_environmental_secret("VITA_API_BASE_URL")
+VITA_MCP_CACHE_TTL_SECONDS: float = float(os.getenv("VITA_MCP_CACHE_TTL_SECONDS", "15"))
+CONTRACT_DOCUMENTATION_URI: str = "vita://documentation/ibkr-contracts"
+#   An approximation of a BPE tokenizer (one token per word, number or punctuation mark), so that the formats can be compared without a tokenizer dependency
+TOKEN_PATTERN: re.Pattern[str] = re.compile(r"\w+|[^\w\s]")
 mcp = FastMCP("Vita")
 logging.basicConfig(level=logging.DEBUG)
 session: AsyncHTTPSession = AsyncHTTPSession(API_BASE_URL, headers={"Authorization": f"Bearer {common.get_environmental_secret("API_KEY")}"})
+cache: AsyncTTLCache[Any] = AsyncTTLCache(VITA_MCP_CACHE_TTL_SECONDS)
+
+
+class OutputFormat(Enum):
+    COMPACT = "COMPACT"
+    VERBOSE = "VERBOSE"
+
+
+VITA_MCP_OUTPUT_FORMAT: OutputFormat = OutputFormat(os.getenv("VITA_MCP_OUTPUT_FORMAT", OutputFormat.COMPACT.value).upper())
+CONTRACT_DESCRIPTION_DOCUMENTATION: str = (
+    "Note:\n"
+    "    - Use the following examples to decode the pattern of the Contract Description\n"
+    "        - An Option with a contract description of \"QQQ    SEP2025 610 C [QQQ   250919C00610000 100]\" can be decoded as\n"
+    "            - Underlying Ticker: QQQ\n"
+    "            - Strike Price: $610\n"
+    "            - Type of Option: Call (because of the 'C' after in '610')\n"
+    "            - Expiry: 2025-09-19 (because of the '250919' in the '250919C00610000')\n"
+    "            - Multiplier: 100 (because of the '100' after the '250919C00610000')\n"
+    "        - An Option with a contract description of \"QQQ    SEP2025 610 P [QQQ   250919C00610000 100]\" can be decoded as\n"
+    "            - Underlying Ticker: QQQ\n"
+    "            - Strike Price: $610\n"
+    "            - Type of Option: Put (because of the 'P' after in '610')\n"
+    "            - Expiry: 2025-09-19 (because of the '250919' in the '250919C00610000')\n"
+    "            - Multiplier: 100 (because of the '100' after the '250919C00610000')\n"
+    "        - A Future's Option with a contract description of \"NQ     MAR2026 23500 P\" can be decoded as\n"
+    "            - Future's Ticker: NQ\n"
+    "            - Future's Expiry: March 2026\n"
+    "            - Strike Price: $23,500\n"
+    "            - Type of Option: Put (because of the 'P' after in '23500')\n"
+    "            - Future's Option's Expiry: March 2026\n"
+    "        - A Future's Option with a contract description of \"NQ     MAR2026 26500 C\" can be decoded as\n"
+    "            - Future's Ticker: NQ\n"
+    "            - Future's Expiry: March 2026\n"
+    "            - Strike Price: $26,500\n"
+    "            - Type of Option: Call (because of the 'C' after in '26500')\n"
+    "            - Future's Option's Expiry: March 2026\n"
+    "        - A Future with a contract description of \"NQ       MAR2026\" can be decoded as\n"
+    "            - Future's Ticker: NQ\n"
+    "            - Future's Expiry: March 2026\n"
+    "    - In the compact format, the positions are listed as CSV rows under a '## Account' line for each account, with the following columns\n"
+    "        - type: Stock, Option, Future, Future's Option or Bond\n"
+    "        - underlying, expiry, strike, right and multiplier: already decoded from the Contract Description (the expiry is a date for options, and a month for futures and futures' options)\n"
+    "        - currency, position, average_cost (the price you paid for it) and market_value\n"
+)
+
+
+async def fetch_data(path: str, query_params: Dict[str, Any] | None = None) -> Any:
+    response: HTTPResponse = await session.get(f"{API_BASE_URL}{path}", query_params=query_params)
+    return response.data
+
+
+async def get_data(path: str, query_params: Dict[str, Any] | None = None) -> Any:
+    key: Tuple[str, Tuple[Tuple[str, Any], ...]] = (path, tuple(sorted((query_params or {}).items())))
+    return await cache.get(key, partial(fetch_data, path, query_params))
+
+
+def to_csv(row_list: List[List[Any]]) -> str:
+    csv_file: io.StringIO = io.StringIO()
+    csv.writer(csv_file, lineterminator="\n").writerows([["" if value is None else value for value in row] for row in row_list])
+    return csv_file.getvalue().rstrip("\n")
+
+
+def estimate_token_count(text: str) -> int:
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def format_wise_transactions(data_list: List[Dict[str, Any]], output_format: OutputFormat = VITA_MCP_OUTPUT_FORMAT) -> str:
+    if output_format == OutputFormat.COMPACT:
+        return to_csv([["description", "currency", "amount"]] + [[data["description"], data["currency"], data["amount"]] for data in data_list])
+
+    return '\n---\n'.join([
+        f"Transaction Description: {data["description"]}\nTransaction Amount (in {data["currency"]}): ${data["amount"]}"
+        for data in data_list
+    ])
+
+
+def format_wise_account_summary(data_list: List[Dict[str, Any]], output_format: OutputFormat = VITA_MCP_OUTPUT_FORMAT) -> str:
+    if output_format == OutputFormat.COMPACT:
+        return to_csv([["account", "currency", "balance"]] + [[data["account_name"], data["currency"], data["balance"]] for data in data_list])
+
+    return '\n---\n'.join([f"Account: {data["account_name"]}\nAccount Balance: {data["currency"]}{data["balance"]}" for data in data_list])
+
+
+def format_ibkr_account_summary(data_list: List[Dict[str, Any]], output_format: OutputFormat = VITA_MCP_OUTPUT_FORMAT) -> str:
+    if output_format == OutputFormat.COMPACT:
+        #   The header is written once and the account once per group, instead of labelling every field of every position
+        header: str = to_csv([["type", "underlying", "expiry", "strike", "right", "multiplier", "currency", "position", "average_cost", "market_value"]])
+        account_list: List[str] = [
+            f"## Account {account_data["id"]} ({account_data["name"]})\n" + to_csv([
+                [contract_data["type"], details["underlying"], details["expiry_date"] or details["expiry_month"], details["strike"], details["right"], details["multiplier"], contract_data["currency"], contract_data["position"], contract_data["average_cost"], contract_data["market_value"]]
+                for contract_data in account_data["contract_list"]
+                for details in [contract_data["details"]]
+            ])
+            for account_data in data_list
+        ]
+        return '\n'.join([header] + account_list) + f"\n\nThe columns are documented in the {CONTRACT_DOCUMENTATION_URI} resource."
+
+    replies: List[str] = []
+    for account_data in data_list:
+        for contract_data in account_data["contract_list"]:
+            replies.append((f"Account ID: {account_data["id"]}\n"
+                            f"Sub-Account Name: {account_data["name"]}\n"
+                            f"Contract Description: {contract_data['description']}\n"
+                            f"Position: {contract_data['position']}\n"
+                            f"Average Cost Price (the price you paid for it): {contract_data['currency']} {contract_data['average_cost']}\n"
+                            f"Market Value: {contract_data['currency']} {contract_data['market_value']}\n"
+                            f"Type of Contract: {contract_data['type']}\n"))
+
+    reply: str = '\n---\n'.join(replies)
+    return f"{reply}\n\n --- \n\n # Documentation\n{CONTRACT_DESCRIPTION_DOCUMENTATION}"
 
 
 @mcp.tool()
@@ -25,17 +148,11 @@ async def get_latest_wise_transactions(currency_str: str | None = None) -> str:
                   Defaults to "NZD" if not provided.
 
     Returns:
-        A formatted string detailing recent transactions, with each entry
-        containing the description and amount, separated by '---'.
-        Returns an empty string if no transactions are found.
+        A CSV table of the recent transactions' description, currency and amount
+        (or, in the verbose output format, one entry per transaction separated by '---').
     """
     currency: Currency = Currency.NZD if currency_str is None else Currency(currency_str)
-    response: HTTPResponse = await session.get(f"{API_BASE_URL}/wise/latest_transactions", query_params={"currency": currency.value})
-
-    return '\n---\n'.join([
-        f"Transaction Description: {data["description"]}\nTransaction Amount (in {data["currency"]}): ${data["amount"]}"
-        for data in response.data
-    ])
+    return format_wise_transactions(await get_data("/wise/latest_transactions", {"currency_str": currency.value}))
 
 
 @mcp.tool()
@@ -47,27 +164,41 @@ async def get_wise_account_summary() -> str:
     of their names and current balances.
 
     Returns:
-        A formatted string listing each account's name and balance,
-        with individual account summaries separated by '---'.
+        A CSV table of each account's name, currency and balance
+        (or, in the verbose output format, one entry per account separated by '---').
     """
-    response: HTTPResponse = await session.get(f"{API_BASE_URL}/wise/account_summary")
-    return '\n---\n'.join([f"Account: {data["account_name"]}\nAccount Balance: {data["currency"]}{data["balance"]}" for data in response.data])
+    return format_wise_account_summary(await get_data("/wise/account_summary"))
 
 
 @mcp.tool()
 async def send_discord_message(message: str) -> str:
-    """Sends a specified message to a Discord channel.
+    """Queues a specified message to be sent to a Discord channel.
 
-        This function sends a Discord message to a Discord channel.
+        This function queues a Discord message to be sent to a Discord channel. The message
+        is sent in the background, so use get_discord_message_status to check if it was delivered.
 
         Args:
             message: The string content of the message to be sent.
 
         Returns:
-            A string indicating "Message sent successfully." if the message is sent.
+            The queued message's ID and delivery status (QUEUED, SENT or FAILED).
         """
-    await session.post(f"{API_BASE_URL}/discord/send_message", data={"message": message})
-    return 'Message sent'
+    response: HTTPResponse = await session.post(f"{API_BASE_URL}/discord/send_message", data={"message": message})
+    return f"Message ID: {response.data["id"]}, Status: {response.data["status"]}"
+
+
+@mcp.tool()
+async def get_discord_message_status(message_id: str) -> str:
+    """Provides the delivery status of a Discord message queued by send_discord_message.
+
+        Args:
+            message_id: The ID returned by send_discord_message.
+
+        Returns:
+            The message's delivery status (QUEUED, SENT or FAILED), with the error if it failed to send.
+        """
+    response: HTTPResponse = await session.get(f"{API_BASE_URL}/discord/messages/{message_id}")
+    return f"Message ID: {response.data["id"]}, Status: {response.data["status"]}" + (f", Error: {response.data["error"]}" if response.data["error"] else "")
 
 
 @mcp.tool()
@@ -79,55 +210,85 @@ async def get_ibkr_account_summary() -> str:
     account, fetching account_data from an external service.
 
     Returns:
-        A formatted string detailing each held position, with individual position
-        summaries separated by '---'. Returns an empty string if no positions are found
-        or if an error occurs during retrieval.
+        A CSV table of the positions, with the header once and the positions grouped
+        by account. The columns are documented in the vita://documentation/ibkr-contracts
+        resource. In the verbose output format, each position is a labelled entry
+        separated by '---', followed by the documentation.
     """
-    documentation: str = (
-        f"Note:\n"
-        "    - Use the following examples to decode the pattern of the Contract Description\n"
-        "        - An Option with a contract description of \"QQQ    SEP2025 610 C [QQQ   250919C00610000 100]\" can be decoded as\n"
-        "            - Underlying Ticker: QQQ\n"
-        "            - Strike Price: $610\n"
-        "            - Type of Option: Call (because of the 'C' after in '610')\n"
-        "            - Expiry: 2019-09-25 (because of the '250919' in the '250919C00610000')\n"
-        "            - Multiplier: 100 (because of the '100' after the '250919C00610000')\n"
-        "        - An Option with a contract description of \"QQQ    SEP2025 610 P [QQQ   250919C00610000 100]\" can be decoded as\n"
-        "            - Underlying Ticker: QQQ\n"
-        "            - Strike Price: $610\n"
-        "            - Type of Option: Put (because of the 'P' after in '610')\n"
-        "            - Expiry: 2019-09-25 (because of the '250919' in the '250919C00610000')\n"
-        "            - Multiplier: 100 (because of the '100' after the '250919C00610000')\n"
-        "        - A Future's Option with a contract description of \"NQ     MAR2026 23500 P\" can be decoded as\n"
-        "            - Future's Ticker: NQ\n"
-        "            - Future's Expiry: March 2026\n"
-        "            - Strike Price: $23,500\n"
-        "            - Type of Option: Put (because of the 'P' after in '23500')\n"
-        "            - Future's Option's Expiry: March 2026\n"
-        "        - A Future's Option with a contract description of \"NQ     MAR2026 26500 C\" can be decoded as\n"
-        "            - Future's Ticker: NQ\n"
-        "            - Future's Expiry: March 2026\n"
-        "            - Strike Price: $26,500\n"
-        "            - Type of Option: Call (because of the 'C' after in '26500')\n"
-        "            - Future's Option's Expiry: March 2026\n"
-        "        - A Future with a contract description of \"NQ       MAR2026\" can be decoded as\n"
-        "            - Future's Ticker: NQ\n"
-        "            - Future's Expiry: March 2026\n"
-    )
-    response: HTTPResponse = await session.get(f"{API_BASE_URL}/ibkr/account_summary")
-    replies: List[str] = []
-    for account_data in response.data:
-        for contract_data in account_data["contract_list"]:
-            replies.append((f"Account ID: {account_data["id"]}\n"
-                            f"Sub-Account Name: {account_data["name"]}\n"
-                            f"Contract Description: {contract_data['description']}\n"
-                            f"Position: {contract_data['position']}\n"
-                            f"Average Cost Price (the price you paid for it): {contract_data['currency']} {contract_data['average_cost']}\n"
-                            f"Market Value: {contract_data['currency']} {contract_data['market_value']}\n"
-                            f"Type of Contract: {contract_data['type']}\n"))
+    return format_ibkr_account_summary(await get_data("/ibkr/account_summary"))
 
-    reply: str = '\n---\n'.join(replies)
-    return f"{reply}\n\n --- \n\n # Documentation\n{documentation}"
+
+@mcp.tool()
+async def get_financial_snapshot(currency_str: str | None = None) -> str:
+    """Provides a snapshot of the user's full financial picture in a single call.
+
+    This function fetches the Wise account summary, the recent Wise transactions
+    and the Interactive Brokers (IBKR) account summary concurrently, and returns
+    them together. Prefer it over calling the individual tools one after another
+    when more than one of them is needed.
+
+    Args:
+        currency_str: The ISO 4217 currency code of the Wise account whose
+                  transactions are included. Defaults to "NZD" if not provided.
+
+    Returns:
+        A formatted string with a section for each source. A source that could
+        not be fetched is reported as unavailable, without failing the others.
+    """
+    currency: Currency = Currency.NZD if currency_str is None else Currency(currency_str)
+    section_list: List[Tuple[str, Awaitable[Any], Callable[[Any], str]]] = [
+        ("Wise Account Summary", get_data("/wise/account_summary"), format_wise_account_summary),
+        (f"Latest Wise Transactions ({currency.value})", get_data("/wise/latest_transactions", {"currency_str": currency.value}), format_wise_transactions),
+        ("IBKR Account Summary", get_data("/ibkr/account_summary"), format_ibkr_account_summary),
+    ]
+    result_list: List[Any] = await asyncio.gather(*[coroutine for _, coroutine, _ in section_list], return_exceptions=True)
+
+    reply: str = '\n\n'.join([
+        f"# {title}\n{f"Unavailable: {result!r}" if isinstance(result, Exception) else format_function(result)}"
+        for (title, _, format_function), result in zip(section_list, result_list)
+    ])
+    return reply
+
+
+@mcp.tool()
+async def get_output_format_token_stats(currency_str: str | None = None) -> str:
+    """Compares the size of the compact and the verbose output formats of the tools.
+
+    This function renders the current Wise and IBKR data in both output formats
+    and estimates the number of tokens of each, approximating a token as a word,
+    a number or a punctuation mark. The output format is set for all tools with
+    the VITA_MCP_OUTPUT_FORMAT environment variable (COMPACT by default).
+
+    Args:
+        currency_str: The ISO 4217 currency code of the Wise account whose
+                  transactions are compared. Defaults to "NZD" if not provided.
+
+    Returns:
+        A CSV table with the characters and estimated tokens of each tool's
+        output in both formats, and the reduction of the compact format.
+    """
+    currency: Currency = Currency.NZD if currency_str is None else Currency(currency_str)
+    wise_account_summary, wise_transactions, ibkr_account_summary = await asyncio.gather(get_data("/wise/account_summary"), get_data("/wise/latest_transactions", {"currency_str": currency.value}), get_data("/ibkr/account_summary"))
+    tool_list: List[Tuple[str, Any, Callable[[Any, OutputFormat], str]]] = [
+        ("get_wise_account_summary", wise_account_summary, format_wise_account_summary),
+        ("get_latest_wise_transactions", wise_transactions, format_wise_transactions),
+        ("get_ibkr_account_summary", ibkr_account_summary, format_ibkr_account_summary),
+    ]
+    row_list: List[List[Any]] = [["tool", "verbose_characters", "compact_characters", "verbose_tokens", "compact_tokens", "token_reduction"]]
+
+    for name, data, format_function in tool_list:
+        verbose_output, compact_output = format_function(data, OutputFormat.VERBOSE), format_function(data, OutputFormat.COMPACT)
+        verbose_token_count, compact_token_count = estimate_token_count(verbose_output), estimate_token_count(compact_output)
+        row_list.append([name, len(verbose_output), len(compact_output), verbose_token_count, compact_token_count, f"{1 - compact_token_count / max(verbose_token_count, 1):.0%}"])
+
+    #   In the compact format, the documentation is a resource that is read once per session rather than a part of every response
+    row_list.append([f"resource {CONTRACT_DOCUMENTATION_URI}", "", len(CONTRACT_DESCRIPTION_DOCUMENTATION), "", estimate_token_count(CONTRACT_DESCRIPTION_DOCUMENTATION), ""])
+    return to_csv(row_list)
+
+
+@mcp.resource(CONTRACT_DOCUMENTATION_URI, name="IBKR contract documentation", description="Explains how to decode IBKR contract descriptions and the columns of the compact IBKR account summary.", mime_type="text/plain")
+def get_contract_documentation() -> str:
+    return CONTRACT_DESCRIPTION_DOCUMENTATION
 
 
 if __name__ == "__main__":
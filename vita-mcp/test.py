@@ -41,3 +41,28 @@ async def test_get_ibkr_account_summary() -> None:
         result_string: str = result.content[0].text  # type: ignore[union-attr]
         assert result_string is not None and result_string != ""
         print(result.content[0].text)  # type: ignore[union-attr]
+
+
+@pytest.mark.asyncio
+async def test_get_financial_snapshot() -> None:
+    async with client:
+        result = await client.call_tool("get_financial_snapshot", {"currency_str": "NZD"})
+        result_string: str = result.content[0].text  # type: ignore[union-attr]
+        assert "# Wise Account Summary" in result_string and "# IBKR Account Summary" in result_string
+        print(result.content[0].text)  # type: ignore[union-attr]
+
+
+@pytest.mark.asyncio
+async def test_get_output_format_token_stats() -> None:
+    async with client:
+        result = await client.call_tool("get_output_format_token_stats", None)
+        result_string: str = result.content[0].text  # type: ignore[union-attr]
+        assert "get_ibkr_account_summary" in result_string
+        print(result.content[0].text)  # type: ignore[union-attr]
+
+
+@pytest.mark.asyncio
+async def test_read_contract_documentation() -> None:
+    async with client:
+        result = await client.read_resource("vita://documentation/ibkr-contracts")
+        assert "Contract Description" in result[0].text  # type: ignore[union-attr]